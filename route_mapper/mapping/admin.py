@@ -1,5 +1,12 @@
 from django.contrib import admin
-from .models import BackgroundImage, Route, RoutePoint
+from .models import BackgroundImage, BackgroundImageRendition, Route, RoutePoint
+
+# Renditions are generated automatically, show them read-only under their image
+class BackgroundImageRenditionInline(admin.TabularInline):
+    model = BackgroundImageRendition
+    extra = 0
+    readonly_fields = ('kind', 'format', 'image', 'width', 'height')
+    can_delete = False
 
 # Optional: Customize how BackgroundImage is displayed in the admin
 class BackgroundImageAdmin(admin.ModelAdmin):
@@ -10,6 +17,7 @@ class BackgroundImageAdmin(admin.ModelAdmin):
     search_fields = ('name', 'slug')
     # Add filter by uploader
     list_filter = ('uploader', 'uploaded_at')
+    inlines = [BackgroundImageRenditionInline]
 
     # Optionally, pre-populate slug from name on add/change form
     # prepopulated_fields = {'slug': ('name',)} # Note: This might conflict slightly with custom save() slug logic
@@ -18,13 +26,13 @@ class BackgroundImageAdmin(admin.ModelAdmin):
 
 # Optional: Customize how Route is displayed in the admin
 class RouteAdmin(admin.ModelAdmin):
-    list_display = ('name', 'user', 'background_image', 'created_at')
+    list_display = ('name', 'user', 'background_image', 'point_count', 'length', 'created_at')
     # Add filter by user and background image
     list_filter = ('user', 'background_image', 'created_at')
     # Add search capability by name or description
     search_fields = ('name', 'description')
     # Make user and created_at read-only (assuming they are set automatically)
-    readonly_fields = ('user', 'created_at') # User will likely be set by the view/serializer, not admin form
+    readonly_fields = ('user', 'created_at', 'version', *Route.METRIC_FIELDS) # User will likely be set by the view/serializer, not admin form
 
     # You could potentially add RoutePoint as an inline here
     # class RoutePointInline(admin.TabularInline):
@@ -47,6 +55,21 @@ class RoutePointAdmin(admin.ModelAdmin):
     # Make created_at read-only
     readonly_fields = ('created_at',)
 
+    # Points edited here bypass the API, so rebuild the route's packed geometry afterwards
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        obj.route.rebuild_packed_points()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        obj.route.rebuild_packed_points()
+
+    def delete_queryset(self, request, queryset):
+        routes = list(Route.objects.filter(points__in=queryset).distinct())
+        super().delete_queryset(request, queryset)
+        for route in routes:
+            route.rebuild_packed_points()
+
 # Register your models here with their optional custom Admin classes
 admin.site.register(BackgroundImage, BackgroundImageAdmin)
 admin.site.register(Route, RouteAdmin)
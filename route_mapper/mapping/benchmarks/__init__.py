@@ -0,0 +1,22 @@
+# mapping/benchmarks/__init__.py
+"""
+Load and benchmark suite for the route API (RouteViewSet and RoutePointViewSet).
+
+    datasets.py   generate_dataset(): synthetic users x routes x points on several
+                  background images, written with bulk inserts
+    scenarios.py  the measured requests (route list / retrieve, point create / delete,
+                  export), each one built outside the timed part
+    runner.py     runs a scenario a number of times and reports latency percentiles,
+                  query counts and peak memory
+
+Run it with the benchmark_api management command, which writes the results as JSON
+so that two runs (e.g. before and after a change) can be compared:
+
+    python manage.py benchmark_api --users 10 --routes 20 --points 500 --output before.json
+"""
+
+from .datasets import Dataset, generate_dataset
+from .runner import measure, run_benchmarks
+from .scenarios import SCENARIOS
+
+__all__ = ['Dataset', 'generate_dataset', 'measure', 'run_benchmarks', 'SCENARIOS']
@@ -0,0 +1,104 @@
+# mapping/benchmarks/datasets.py
+"""
+Synthetic benchmark data: N users x M routes x K points spread over several
+background images. Everything is written with bulk inserts (one INSERT per table,
+one executemany per route for the points), so even large datasets are quick to build.
+"""
+
+import random
+
+from django.contrib.auth import get_user_model
+
+from ..geometry import flatten_points, measure_points, pack_points
+from ..models import BackgroundImage, Route, RoutePoint, RouteSegmentCell
+from ..ranks import RANK_GAP
+
+User = get_user_model()
+
+# Pixel size given to the generated images (they have no file, only the size is used)
+IMAGE_WIDTH = 2000
+IMAGE_HEIGHT = 1500
+# Largest step of the random walk that generates a route's points (normalized units)
+STEP = 0.01
+
+
+class Dataset:
+    """The generated objects, as passed to the benchmark scenarios."""
+
+    def __init__(self, users, images, routes, points_per_route):
+        self.users = users
+        self.images = images
+        self.routes = routes
+        self.points_per_route = points_per_route
+
+    def routes_of(self, user):
+        return [route for route in self.routes if route.user_id == user.pk]
+
+    def summary(self):
+        return {
+            'users': len(self.users),
+            'images': len(self.images),
+            'routes': len(self.routes),
+            'points_per_route': self.points_per_route,
+            'points': len(self.routes) * self.points_per_route,
+        }
+
+
+def random_walk(rng, count):
+    """Returns (xs, ys) of `count` points wandering around the image, kept inside 0..1."""
+    x, y = rng.random(), rng.random()
+    xs, ys = [], []
+    for _ in range(count):
+        x = min(max(x + rng.uniform(-STEP, STEP), 0.0), 1.0)
+        y = min(max(y + rng.uniform(-STEP, STEP), 0.0), 1.0)
+        xs.append(x)
+        ys.append(y)
+    return xs, ys
+
+
+def generate_dataset(users=10, routes_per_user=10, points_per_route=500, images=3, seed=0, prefix='benchmark'):
+    """
+    Creates the benchmark users, images and routes (with their points, packed geometry,
+    metrics and spatial index, as the API would leave them) and returns a Dataset.
+    The same seed always gives the same points. Usernames and slugs start with `prefix`.
+    """
+    # Imported here like in Route.update_segment_cells (NumPy only when needed)
+    from ..spatial import polyline_cells
+
+    rng = random.Random(seed)
+
+    user_objects = User.objects.bulk_create(
+        User(username=f'{prefix}-user-{i}') for i in range(users)
+    )
+    image_objects = BackgroundImage.objects.bulk_create(
+        BackgroundImage(
+            name=f'Benchmark image {i}', slug=f'{prefix}-image-{i}', image='benchmark/none.jpg',
+            width=IMAGE_WIDTH, height=IMAGE_HEIGHT,
+        )
+        for i in range(images)
+    )
+    # Routes go round the images, so every image gets routes of several users
+    routes = Route.objects.bulk_create(
+        Route(user=user, background_image=image_objects[(u * routes_per_user + r) % images], name=f'Route {r}')
+        for u, user in enumerate(user_objects)
+        for r in range(routes_per_user)
+    )
+
+    cells = []
+    for route in routes:
+        xs, ys = random_walk(rng, points_per_route)
+        RoutePoint.objects.insert_points(route.pk, xs, ys)
+        coords = flatten_points(zip(xs, ys)) # float32, as stored
+        for field, value in measure_points(coords, IMAGE_WIDTH, IMAGE_HEIGHT).items():
+            setattr(route, field, value)
+        route.packed_points = pack_points(coords)
+        route.version = 1
+        route.next_rank = RANK_GAP * (points_per_route + 1) # As set by insert_points
+        cells.extend(
+            RouteSegmentCell(route=route, background_image_id=route.background_image_id, cell_x=cell_x, cell_y=cell_y)
+            for cell_x, cell_y in polyline_cells(coords)
+        )
+    Route.objects.bulk_update(routes, ['packed_points', 'version', *Route.METRIC_FIELDS], batch_size=500)
+    RouteSegmentCell.objects.bulk_create(cells, batch_size=5000)
+
+    return Dataset(user_objects, image_objects, routes, points_per_route)
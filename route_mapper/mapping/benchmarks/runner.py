@@ -0,0 +1,109 @@
+# mapping/benchmarks/runner.py
+"""
+Runs the benchmark scenarios and summarizes them:
+latency percentiles (nearest rank, in milliseconds), the number of queries per
+request, the peak memory Python allocated while answering one request and the
+size of its response body (not for streamed responses).
+"""
+
+from collections import Counter
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from .scenarios import SCENARIOS
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    rank = max(1, -(-len(sorted_values) * percent // 100)) # ceil without floats
+    return sorted_values[rank - 1]
+
+
+def _server_name():
+    """A host name the settings accept (the request factory's 'testserver' usually is not)."""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def _call(view, request, kwargs):
+    """Calls the view and produces the whole response body, like a server would."""
+    response = view(request, **kwargs)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    elif hasattr(response, 'render'):
+        response.render()
+    return response
+
+
+def measure(scenario, dataset, repeat, warmup=1):
+    """
+    Runs one scenario `warmup` times untimed, then `repeat` times timed, then once more
+    under tracemalloc (kept apart because tracing slows Python code down a lot).
+    Returns a dict of the measurements.
+    """
+    factory = APIRequestFactory(SERVER_NAME=_server_name())
+    iteration = 0
+    for _ in range(warmup):
+        _call(*scenario(dataset, factory, iteration))
+        iteration += 1
+
+    timings = []
+    query_counts = []
+    status_codes = Counter()
+    for _ in range(repeat):
+        view, request, kwargs = scenario(dataset, factory, iteration)
+        iteration += 1
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = _call(view, request, kwargs)
+            timings.append((time.perf_counter() - started) * 1000)
+        query_counts.append(len(queries))
+        status_codes[str(response.status_code)] += 1
+
+    view, request, kwargs = scenario(dataset, factory, iteration)
+    tracemalloc.start()
+    try:
+        response = _call(view, request, kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    result = {'requests': repeat}
+    if timings:
+        result.update({f'p{percent}_ms': round(percentile(timings, percent), 3) for percent in PERCENTILES})
+        result.update({
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'max_ms': round(timings[-1], 3),
+            'queries_min': min(query_counts),
+            'queries_max': max(query_counts),
+        })
+    result.update({'peak_memory_kb': round(peak / 1024, 1), 'status_codes': dict(status_codes)})
+    if not response.streaming:
+        result['response_kb'] = round(len(response.content) / 1024, 1)
+    return result
+
+
+def run_benchmarks(dataset, names=None, repeat=50, warmup=1, progress=None):
+    """
+    Measures the named scenarios (all of SCENARIOS by default, in their order) and
+    returns {name: measurements}. progress(name, measurements) is called after each one.
+    """
+    results = {}
+    for name, scenario in SCENARIOS.items():
+        if names and name not in names:
+            continue
+        results[name] = measure(scenario, dataset, repeat, warmup)
+        if progress:
+            progress(name, results[name])
+    return results
@@ -0,0 +1,90 @@
+# mapping/benchmarks/scenarios.py
+"""
+The measured API requests. Every scenario is a function
+(dataset, factory, iteration) -> (view, request, view kwargs) that builds the
+request for one iteration; only calling the view is timed (see runner.py).
+Iterations go round the users and routes of the dataset, so the requests are
+spread over the whole dataset instead of hitting one cached row.
+"""
+
+from rest_framework.test import force_authenticate
+
+from ..models import RoutePoint
+from ..views import RoutePointViewSet, RouteViewSet
+
+route_list_view = RouteViewSet.as_view({'get': 'list'})
+route_detail_view = RouteViewSet.as_view({'get': 'retrieve'})
+route_export_view = RouteViewSet.as_view({'get': 'export'})
+point_list_view = RoutePointViewSet.as_view({'get': 'list'})
+point_create_view = RoutePointViewSet.as_view({'post': 'create'})
+point_delete_view = RoutePointViewSet.as_view({'delete': 'destroy'})
+
+
+def _authenticated(request, user):
+    force_authenticate(request, user=user)
+    return request
+
+
+def _route(dataset, iteration):
+    return dataset.routes[iteration % len(dataset.routes)]
+
+
+def route_list(dataset, factory, iteration):
+    """GET /api/routes/ (first page, with the points) for one of the users."""
+    user = dataset.users[iteration % len(dataset.users)]
+    return route_list_view, _authenticated(factory.get('/api/routes/'), user), {}
+
+
+def route_retrieve(dataset, factory, iteration):
+    """GET /api/routes/{id}/ with all of the route's points."""
+    route = _route(dataset, iteration)
+    request = _authenticated(factory.get(f'/api/routes/{route.pk}/'), route.user)
+    return route_detail_view, request, {'pk': route.pk}
+
+
+def point_list(dataset, factory, iteration):
+    """GET /api/routes/{id}/points/ as JSON objects."""
+    route = _route(dataset, iteration)
+    request = _authenticated(factory.get(f'/api/routes/{route.pk}/points/'), route.user)
+    return point_list_view, request, {'route_pk': route.pk}
+
+
+def point_polyline(dataset, factory, iteration):
+    """GET /api/routes/{id}/points/ as an encoded polyline (see mapping/encodings.py)."""
+    route = _route(dataset, iteration)
+    request = _authenticated(factory.get(f'/api/routes/{route.pk}/points/?format=polyline'), route.user)
+    return point_list_view, request, {'route_pk': route.pk}
+
+
+def point_create(dataset, factory, iteration):
+    """POST /api/routes/{id}/points/ appending one point."""
+    route = _route(dataset, iteration)
+    request = factory.post(f'/api/routes/{route.pk}/points/', {'x': 0.5, 'y': 0.5}, format='json')
+    return point_create_view, _authenticated(request, route.user), {'route_pk': route.pk}
+
+
+def point_delete(dataset, factory, iteration):
+    """DELETE /api/routes/{id}/points/{pk}/ of the route's second point (its first if it has only one)."""
+    route = _route(dataset, iteration)
+    point_ids = list(RoutePoint.objects.filter(route=route).order_by('order').values_list('pk', flat=True)[:2])
+    point_id = point_ids[-1] if point_ids else 0 # 0: nothing left to delete, answered with 404
+    request = _authenticated(factory.delete(f'/api/routes/{route.pk}/points/{point_id}/'), route.user)
+    return point_delete_view, request, {'route_pk': route.pk, 'pk': point_id}
+
+
+def export(dataset, factory, iteration):
+    """GET /api/routes/export/ (GeoJSON) of all of one user's routes."""
+    user = dataset.users[iteration % len(dataset.users)]
+    return route_export_view, _authenticated(factory.get('/api/routes/export/'), user), {}
+
+
+# Name: scenario, in the order they are run (the write scenarios last)
+SCENARIOS = {
+    'route_list': route_list,
+    'route_retrieve': route_retrieve,
+    'export': export,
+    'point_list': point_list,
+    'point_polyline': point_polyline,
+    'point_create': point_create,
+    'point_delete': point_delete,
+}
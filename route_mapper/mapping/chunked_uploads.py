@@ -0,0 +1,159 @@
+# mapping/chunked_uploads.py
+"""
+Resumable chunked uploads of background images (the /api/uploads/ endpoints).
+
+A large scan is not sent as one multipart POST that ties up a worker for the whole
+transfer. The client creates an ImageUpload (name, file name, total size), then
+PUTs the file in chunks, each with a Content-Range header saying where it starts.
+Every chunk is streamed from the request straight into a partial file in storage,
+so nothing is buffered in memory or in a temp file, and ImageUpload.offset records
+how far it got. After an interruption the client reads the offset and continues
+from there. Finalizing moves the partial file into place (a rename, it is not read
+into memory) and creates the BackgroundImage with its usual save().
+
+Chunks are appended to the file on disk, so this needs a storage with local paths
+(FileSystemStorage, the project's default).
+"""
+
+import os
+import re
+
+from django.core.files import File
+from django.db import transaction
+from PIL import Image
+
+from .models import BackgroundImage, ImageUpload
+from .uploads import store_image
+
+# Largest file accepted (bytes)
+MAX_UPLOAD_SIZE = 2 * 1024 ** 3
+# Bytes read from the request and written to the file at a time
+READ_SIZE = 64 * 1024
+
+CONTENT_RANGE_PATTERN = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadError(ValueError):
+    """The chunk or the finished upload was rejected (bad range, not an image, ...)."""
+
+
+class UploadOffsetMismatch(UploadError):
+    """A chunk does not start where the received data ends; `offset` is where it does."""
+
+    def __init__(self, offset):
+        super().__init__(f"The chunk must start at byte {offset}.")
+        self.offset = offset
+
+
+class PartialUploadFile(File):
+    """
+    The finished partial file. temporary_file_path() makes FileSystemStorage move it
+    into place instead of copying it, like Django's TemporaryUploadedFile.
+    """
+
+    def temporary_file_path(self):
+        return self.name
+
+
+def _storage():
+    return BackgroundImage._meta.get_field('image').storage
+
+
+def parse_content_range(header):
+    """(start, length, total) from a "bytes <first>-<last>/<total>" Content-Range header."""
+    match = CONTENT_RANGE_PATTERN.match(header or '')
+    if not match:
+        raise UploadError('Content-Range must look like "bytes <first>-<last>/<total>".')
+    first, last, total = (int(group) for group in match.groups())
+    if last < first:
+        raise UploadError("The last byte of the Content-Range is before its first byte.")
+    return first, last - first + 1, total
+
+
+def append_chunk(upload, stream, start, length):
+    """
+    Writes `length` bytes read from `stream` at byte `start` of the upload's partial
+    file and returns the updated upload. The upload row is locked meanwhile, so two
+    requests cannot write the same upload at once. If the stream ends early (client
+    disconnected), whatever arrived is kept and the offset says how much that was.
+    """
+    with transaction.atomic():
+        upload = ImageUpload.objects.select_for_update().get(pk=upload.pk)
+        if start != upload.offset:
+            raise UploadOffsetMismatch(upload.offset)
+        if start + length > upload.size:
+            raise UploadError(f"The chunk ends after the declared size of {upload.size} bytes.")
+
+        path = _storage().path(upload.partial_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        remaining = length
+        with open(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as partial_file:
+            partial_file.seek(start)
+            partial_file.truncate() # Bytes of an earlier interrupted write were never counted
+            while remaining:
+                data = stream.read(min(READ_SIZE, remaining))
+                if not data:
+                    break
+                partial_file.write(data)
+                remaining -= len(data)
+
+        upload.offset = start + length - remaining
+        upload.save(update_fields=['offset', 'updated_at'])
+    return upload
+
+
+def finalize_upload(upload):
+    """
+    Turns a completely received upload into a BackgroundImage: the partial file is
+    stored by content (see mapping/uploads.py, moved, or dropped if the same bytes
+    are already stored) and the image is saved, which generates its slug.
+    Deletes the upload and returns the new BackgroundImage.
+
+    If saving fails after the file was moved, it is moved back, so the upload (rolled
+    back with the transaction) can be finalized again.
+    """
+    storage = _storage()
+    partial_name = upload.partial_name # upload.pk is cleared by delete()
+    background_image = BackgroundImage()
+    try:
+        with transaction.atomic():
+            upload = ImageUpload.objects.select_for_update().get(pk=upload.pk)
+            if upload.offset != upload.size:
+                raise UploadError(f"Only {upload.offset} of {upload.size} bytes have been received.")
+
+            background_image = BackgroundImage(name=upload.name, description=upload.description, uploader=upload.user)
+            path = storage.path(partial_name)
+            try:
+                with Image.open(path): # Reads the header only
+                    pass
+            except (OSError, Image.DecompressionBombError): # Missing, or Pillow cannot read it
+                raise UploadError("The uploaded file is not a valid image.")
+            with PartialUploadFile(open(path, 'rb'), name=path) as partial_file:
+                store_image(background_image, partial_file)
+            background_image.save()
+            upload.delete()
+    except Exception:
+        _restore_partial_file(storage, background_image.image, partial_name)
+        raise
+
+    # Still there if the content was already stored
+    if storage.exists(partial_name):
+        storage.delete(partial_name)
+    return background_image
+
+
+def _restore_partial_file(storage, field_file, partial_name):
+    # The partial file is gone only if store_image() moved it to the image's name
+    # (a reused stored copy leaves it in place and must not be touched)
+    path = storage.path(partial_name)
+    if field_file.name and not os.path.exists(path) and storage.exists(field_file.name):
+        os.replace(storage.path(field_file.name), path)
+
+
+def delete_upload(upload):
+    """Deletes an unfinished upload and its partial file."""
+    partial_name = upload.partial_name
+    upload.delete()
+    storage = _storage()
+    if storage.exists(partial_name):
+        storage.delete(partial_name)
@@ -0,0 +1,134 @@
+# mapping/conditional.py
+"""
+ETag / Last-Modified support for the route and point API (conditional GET).
+
+Every change to a route or its points bumps Route.version and Route.last_modified,
+and changes to a background image (renditions, tiles) bump BackgroundImage.updated_at.
+The validators below are computed from those columns with a single small query, so a
+poll that gets "304 Not Modified" never loads RoutePoint rows or serializes anything.
+
+Used through django.views.decorators.http.condition on the viewsets' list/retrieve.
+"""
+
+import hashlib
+
+from django.db import models
+
+from .models import Route
+
+
+def _variant(request):
+    """
+    Short hash of everything besides the data that shapes the response body:
+    the chosen renderer (JSON / browsable API) and the query parameters (?points=,
+    ?tolerance=, filters, cursor, ...). Each variant gets its own ETag.
+    """
+    query = sorted(request.query_params.lists())
+    key = f'{request.accepted_renderer.format}:{query}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+
+
+def _latest(*timestamps):
+    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+    return max(timestamps) if timestamps else None
+
+
+def _cached_state(request, key, compute):
+    # etag_func and last_modified_func are called separately, query only once per request
+    states = request.__dict__.setdefault('_conditional_states', {})
+    if key not in states:
+        states[key] = compute()
+    return states[key]
+
+
+def route_list_state(request):
+    """
+    (etag, last_modified) of the authenticated user's route list.
+    Adding a route raises the newest last_modified, deleting one lowers the count.
+    """
+    def compute():
+        state = Route.objects.filter(user=request.user).aggregate(
+            count=models.Count('pk'),
+            route_modified=models.Max('last_modified'),
+            image_modified=models.Max('background_image__updated_at'),
+        )
+        last_modified = _latest(state['route_modified'], state['image_modified'])
+        stamp = last_modified.timestamp() if last_modified else 0
+        return f"routes-{state['count']}-{stamp}-{_variant(request)}", last_modified
+    return _cached_state(request, 'routes', compute)
+
+
+def route_state(request, route_pk):
+    """
+    (etag, last_modified) of one of the authenticated user's routes, including the
+    embedded background image. (None, None) if there is no such route; the view
+    then answers 404 as usual.
+    """
+    def compute():
+        row = Route.objects.filter(user=request.user, pk=route_pk).values_list(
+            'version', 'last_modified', 'background_image__updated_at'
+        ).first()
+        if row is None:
+            return None, None
+        version, route_modified, image_modified = row
+        last_modified = _latest(route_modified, image_modified)
+        return f"route-{route_pk}-{version}-{last_modified.timestamp()}-{_variant(request)}", last_modified
+    return _cached_state(request, ('route', route_pk), compute)
+
+
+def route_points_state(request, route_pk):
+    """
+    (etag, last_modified) of a route's points. Point changes always go through the
+    route's packed geometry, which bumps the route's version.
+    """
+    def compute():
+        row = Route.objects.filter(user=request.user, pk=route_pk).values_list(
+            'version', 'last_modified'
+        ).first()
+        if row is None:
+            return None, None
+        version, last_modified = row
+        return f"route-points-{route_pk}-{version}-{last_modified.timestamp()}-{_variant(request)}", last_modified
+    return _cached_state(request, ('points', route_pk), compute)
+
+
+def image_heatmap_state(request, slug):
+    """
+    (etag, None) of an image's heatmap: it changes whenever the routes on the image
+    do (see mapping/heatmaps.py). An unknown slug still gets a tag; the view then
+    answers 404 as usual.
+    """
+    def compute():
+        state = Route.objects.filter(background_image__slug=slug).state()
+        return f"heatmap-{slug}-{state}-{_variant(request)}", None
+    return _cached_state(request, ('heatmap', slug), compute)
+
+
+# Adapters with the (request, *args, **kwargs) signature expected by condition()
+
+def route_list_etag(request, *args, **kwargs):
+    return route_list_state(request)[0]
+
+
+def route_list_last_modified(request, *args, **kwargs):
+    return route_list_state(request)[1]
+
+
+def route_etag(request, *args, **kwargs):
+    return route_state(request, kwargs['pk'])[0]
+
+
+def route_last_modified(request, *args, **kwargs):
+    return route_state(request, kwargs['pk'])[1]
+
+
+def route_points_etag(request, *args, **kwargs):
+    return route_points_state(request, kwargs['route_pk'])[0]
+
+
+def route_points_last_modified(request, *args, **kwargs):
+    return route_points_state(request, kwargs['route_pk'])[1]
+
+
+def image_heatmap_etag(request, *args, **kwargs):
+    return image_heatmap_state(request, kwargs['slug'])[0]
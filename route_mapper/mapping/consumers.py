@@ -0,0 +1,47 @@
+# mapping/consumers.py
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .live import route_group
+from .models import Route
+
+
+class RouteEditConsumer(AsyncJsonWebsocketConsumer):
+    """
+    WebSocket with the live changes of one route: ws/routes/<route_id>/
+    Only the route's owner can subscribe (like the API, the connection is refused
+    otherwise). Right after connecting the client gets {"op": "hello", "version": N},
+    then every point-level delta sent by mapping/live.py.
+    """
+
+    async def connect(self):
+        self.group_name = None
+        route_id = int(self.scope['url_route']['kwargs']['route_id'])
+        version = await self.get_route_version(route_id)
+        if version is None:
+            await self.close() # Before accept(): the handshake is refused
+            return
+
+        self.group_name = route_group(route_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        # Deltas sent before this subscription are missed: a client that loaded an
+        # older version fetches the route again
+        await self.send_json({'route': route_id, 'op': 'hello', 'version': version})
+
+    async def disconnect(self, close_code):
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def route_delta(self, event):
+        """A delta sent to the route's group by broadcast_route_delta()."""
+        await self.send_json({key: value for key, value in event.items() if key != 'type'})
+
+    @database_sync_to_async
+    def get_route_version(self, route_id):
+        """Version of the route if it belongs to the connected user, otherwise None."""
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            return None
+        return Route.objects.filter(pk=route_id, user=user).values_list('version', flat=True).first()
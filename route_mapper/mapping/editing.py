@@ -0,0 +1,133 @@
+# mapping/editing.py
+"""
+Batch editing of a route's points (PATCH /api/routes/{route_pk}/points/).
+
+A batch is a list of operations applied one after the other, each one addressing
+points by their position in the route as the previous operations left it:
+
+    insert  {"op": "insert", "index": i, "points": [{"x": ..., "y": ...}, ...]}
+            puts the points before position i (i = point count appends)
+    move    {"op": "move", "start": s, "end": e, "to": t}
+            takes out the points s..e (inclusive) and puts them back so that the
+            first of them ends up at position t
+    delete  {"op": "delete", "start": s, "end": e}
+            removes the points s..e (inclusive)
+    update  {"op": "update", "index": i, "x": ..., "y": ...}
+            changes the coordinates of one point (x and/or y)
+
+The operations are first applied to an in-memory list of the points (apply_operations),
+then the difference to the stored rows is written with a fixed number of queries
+(save_edited_points). Points that stay in the same relative order keep their ranks
+(see mapping/ranks.py), so only removed, inserted, moved and updated rows are written.
+"""
+
+from django.db import models
+
+from .geometry import flatten_points
+from .models import Route, RoutePoint
+from .ranks import RANK_GAP, assign_ranks, spaced_ranks
+
+
+class PointEditError(ValueError):
+    """An operation addresses positions the route does not have (at that point of the batch)."""
+
+
+def _check_range(number, start, end, length):
+    if end >= length:
+        raise PointEditError(f"Operation {number}: positions {start}..{end} are outside the route ({length} points).")
+
+
+def apply_operations(points, operations):
+    """
+    Applies validated operations (see PointOperationSerializer) to a list of
+    (id, x, y) tuples and returns the new list. Inserted points have id None.
+    """
+    points = list(points)
+    for number, operation in enumerate(operations):
+        op = operation['op']
+        if op == 'insert':
+            index = operation['index']
+            if index > len(points):
+                raise PointEditError(f"Operation {number}: cannot insert at {index}, the route has {len(points)} points.")
+            points[index:index] = [(None, point['x'], point['y']) for point in operation['points']]
+        elif op == 'delete':
+            _check_range(number, operation['start'], operation['end'], len(points))
+            del points[operation['start']:operation['end'] + 1]
+        elif op == 'move':
+            start, end, to = operation['start'], operation['end'], operation['to']
+            _check_range(number, start, end, len(points))
+            moved = points[start:end + 1]
+            del points[start:end + 1]
+            if to > len(points):
+                raise PointEditError(f"Operation {number}: cannot move to {to}, only {len(points)} other points.")
+            points[to:to] = moved
+        elif op == 'update':
+            index = operation['index']
+            if index >= len(points):
+                raise PointEditError(f"Operation {number}: no point at {index}, the route has {len(points)} points.")
+            point_id, x, y = points[index]
+            points[index] = (point_id, operation.get('x', x), operation.get('y', y))
+    return points
+
+
+def edit_points(route, operations):
+    """
+    Applies a batch of operations to a route (locked by the caller, inside a
+    transaction) and stores the result. Returns the new list of (id, x, y).
+    """
+    # One query for the current points, in route order
+    stored = {
+        point_id: (rank, x, y)
+        for point_id, rank, x, y in route.points.order_by('order').values_list('id', 'order', 'x', 'y')
+    }
+    edited = apply_operations(
+        ((point_id, x, y) for point_id, (_, x, y) in stored.items()), operations
+    )
+    save_edited_points(route, stored, edited)
+    return edited
+
+
+def save_edited_points(route, stored, edited):
+    """
+    Writes the difference between the stored rows ({id: (rank, x, y)}) and the edited
+    list (in route order): deletes the removed rows, gives new ranks to the moved ones
+    and writes changed coordinates, inserts the new ones, then rebuilds the packed
+    geometry (one version bump).
+    """
+    kept_ids = {point_id for point_id, _, _ in edited if point_id is not None}
+    removed_ids = [point_id for point_id in stored if point_id not in kept_ids]
+    ranks = assign_ranks([stored[point_id][0] if point_id is not None else None for point_id, _, _ in edited])
+    if ranks is None:
+        ranks = spaced_ranks(len(edited)) # No room left somewhere, respace the whole route
+    changed = [
+        RoutePoint(id=point_id, route=route, order=rank, x=x, y=y)
+        for rank, (point_id, x, y) in zip(ranks, edited)
+        if point_id is not None and stored[point_id] != (rank, x, y)
+    ]
+    moved_ids = [point.id for point in changed if point.order != stored[point.id][0]]
+    new_points = [
+        RoutePoint(route=route, order=rank, x=x, y=y)
+        for rank, (point_id, x, y) in zip(ranks, edited)
+        if point_id is None
+    ]
+
+    if removed_ids:
+        RoutePoint.objects.filter(route=route, id__in=removed_ids).delete()
+    if moved_ids:
+        # Same idea as RoutePointManager.respace: lift the moved rows above every
+        # stored and every new rank first, so that no row collides with
+        # unique_together = ('route', 'order') while the new ranks are written.
+        offset = max(max(rank for rank, _, _ in stored.values()), ranks[-1]) + 1
+        RoutePoint.objects.filter(route=route, id__in=moved_ids).update(order=models.F('order') + offset)
+    if changed:
+        RoutePoint.objects.bulk_update(changed, ['order', 'x', 'y'])
+    if new_points:
+        RoutePoint.objects.bulk_create(new_points)
+    if ranks and ranks[-1] >= route.next_rank:
+        # Points were added after the end, appends must get ranks above them
+        route.next_rank = ranks[-1] + RANK_GAP
+        Route.objects.filter(pk=route.pk).update(next_rank=route.next_rank)
+
+    coords = flatten_points((x, y) for _, x, y in edited)
+    route._save_packed_points(coords)
+    route.update_segment_cells(coords)
@@ -0,0 +1,75 @@
+# mapping/embedded.py
+"""
+Route data embedded in the route management page (routes_on_image_view).
+
+Instead of the page fetching every route's points from the API when it is opened,
+the view embeds all of the user's routes on the image, with their points, as one
+JSON blob (a <script type="application/json"> element). The blob is built with two
+queries (the routes, then all of their points at once) and cached per
+(user, image, routes version): any change to one of those routes or their points
+gives a new version, so a stale blob is simply never looked up again.
+"""
+
+from django.core.cache import cache
+from django.utils.html import json_script
+from django.utils.safestring import mark_safe
+
+from .models import Route, RoutePoint
+
+# Id of the <script> element holding the blob (read by the page's JavaScript)
+ROUTES_JSON_ELEMENT_ID = 'userRoutesJson'
+# The key changes with the data, the timeout only frees memory of images nobody opens
+ROUTES_JSON_CACHE_SECONDS = 24 * 60 * 60
+
+
+def routes_version(user, background_image):
+    """
+    Version of the user's routes on the image, from one aggregate query
+    (see RouteQuerySet.state).
+    """
+    return Route.objects.filter(user=user, background_image=background_image).state()
+
+
+def build_routes_data(user, background_image):
+    """
+    The user's routes on the image as a list of dicts, each with its points as
+    {"id", "order", "x", "y"} (order being the point's position, like the API).
+    """
+    routes = list(
+        Route.objects.filter(user=user, background_image=background_image)
+        .order_by('created_at', 'id')
+        .values('id', 'name', 'description', 'version', 'point_count')
+    )
+    by_id = {route['id']: route for route in routes}
+    for route in routes:
+        route['points'] = []
+
+    # All points of all routes in one query, sorted by route and rank
+    point_rows = (
+        RoutePoint.objects.filter(route__user=user, route__background_image=background_image)
+        .order_by('route_id', 'order')
+        .values_list('route_id', 'id', 'x', 'y')
+    )
+    for route_id, point_id, x, y in point_rows.iterator(chunk_size=5000):
+        points = by_id[route_id]['points']
+        points.append({'id': point_id, 'order': len(points), 'x': x, 'y': y})
+    return routes
+
+
+def routes_on_image_json(user, background_image):
+    """
+    Returns (routes, script) for the page: the route list (dicts with "id" and
+    "name", without the points) and the <script> element with the whole JSON blob,
+    both from the cache when the user's routes on the image have not changed.
+    """
+    key = f'routes-on-image:{user.pk}:{background_image.pk}:{routes_version(user, background_image)}'
+    cached = cache.get(key)
+    if cached is None:
+        routes = build_routes_data(user, background_image)
+        # Serialized and escaped once, here, not on every page view
+        script = json_script(routes, ROUTES_JSON_ELEMENT_ID)
+        summary = [{'id': route['id'], 'name': route['name']} for route in routes]
+        cached = (summary, script)
+        cache.set(key, cached, timeout=ROUTES_JSON_CACHE_SECONDS)
+    summary, script = cached
+    return summary, mark_safe(script) # json_script escaped it for the <script> element
@@ -0,0 +1,128 @@
+# mapping/encodings.py
+"""
+Compact encodings of route geometry for the route and point endpoints.
+
+A point list serialized by RoutePointSerializer costs 80+ bytes per point
+({"id", "x", "y", "order", "created_at"}) and a trip through DRF's field machinery
+for every point. The encodings below are built straight from the coordinates
+(NumPy arrays, no per-point serializer) and chosen by content negotiation
+(see mapping/renderers.py):
+
+- columnar: the coordinates as two arrays, {"xs": [...], "ys": [...]}
+- polyline: Google's encoded polyline algorithm with the coordinates quantized to
+  `precision` decimals (x before y), {"precision": 6, "polyline": "..."}
+- msgpack: the columnar form as MessagePack, with "xs" and "ys" as binary
+  little-endian float32 arrays (the stored format, e.g. new Float32Array(...) in JS)
+
+Point positions are implied by the index in the arrays.
+"""
+
+import numpy as np
+
+from .formats import POLYLINE_PRECISION
+from .geometry import unpack_points
+
+# Decimals of the JSON floats, like the other endpoints (the values are float32)
+COLUMNAR_DECIMALS = 7
+
+
+def _xy(coords):
+    """(n, 2) float64 array from a flat [x0, y0, x1, y1, ...] sequence or (x, y) pairs."""
+    return np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+
+
+def encode_polyline(coords, precision=POLYLINE_PRECISION):
+    """
+    Encodes the points with Google's polyline algorithm: every coordinate is
+    rounded to `precision` decimals, stored as the difference to the previous
+    point, zigzag-encoded and written as 5-bit chunks (one ASCII character each,
+    with the 0x20 bit set on all but the last chunk). Done for all values at once.
+    """
+    values = np.rint(_xy(coords) * 10 ** precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    if not len(deltas):
+        return ''
+    zigzag = np.where(deltas < 0, ~(deltas << 1), deltas << 1).astype(np.uint64)
+
+    # One column per 5-bit chunk, as many as the largest value needs
+    width = max(1, (int(zigzag.max()).bit_length() + 4) // 5)
+    shifts = np.arange(width, dtype=np.uint64) * np.uint64(5)
+    chunks = (zigzag[:, None] >> shifts) & np.uint64(0x1F)
+    # A chunk is followed by another one while higher bits are left
+    more = np.zeros(chunks.shape, dtype=bool)
+    more[:, :-1] = (zigzag[:, None] >> shifts[1:]) != 0
+    used = np.ones(chunks.shape, dtype=bool)
+    used[:, 1:] = more[:, :-1]
+
+    characters = (chunks | (more.astype(np.uint64) << np.uint64(5))) + np.uint64(63)
+    return characters[used].astype(np.uint8).tobytes().decode('ascii')
+
+
+def decode_polyline(encoded, precision=POLYLINE_PRECISION):
+    """
+    Decodes an encoded polyline back into a list of [x, y] points
+    (the reverse of encode_polyline, for clients and tests).
+    """
+    values = []
+    value = shift = 0
+    for character in encoded:
+        chunk = ord(character) - 63
+        value |= (chunk & 0x1F) << shift
+        shift += 5
+        if not chunk & 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    deltas = np.array(values, dtype=np.int64).reshape(-1, 2)
+    return (np.cumsum(deltas, axis=0) / 10 ** precision).tolist()
+
+
+def encode_coords(coords, encoding, precision=POLYLINE_PRECISION):
+    """
+    The geometry keys of a compact response for the coordinates
+    (a flat [x0, y0, ...] sequence or (x, y) pairs) in the given encoding.
+    """
+    xy = _xy(coords)
+    if encoding == 'polyline':
+        return {'precision': precision, 'polyline': encode_polyline(xy, precision)}
+    if encoding == 'msgpack':
+        float32 = xy.astype('<f4')
+        return {'xs': float32[:, 0].tobytes(), 'ys': float32[:, 1].tobytes()}
+    xy = xy.round(COLUMNAR_DECIMALS)
+    return {'xs': xy[:, 0].tolist(), 'ys': xy[:, 1].tolist()}
+
+
+def _simplified(route, simplify):
+    """(kept positions, coordinates) of the route's level-of-detail version."""
+    points = route.simplified_points(**simplify)
+    return [point['order'] for point in points], [(point['x'], point['y']) for point in points]
+
+
+def route_geometry(route, encoding, precision=POLYLINE_PRECISION, simplify=None):
+    """
+    The route's geometry in a compact encoding, read from its packed geometry
+    (no RoutePoint rows are loaded). A level-of-detail version also lists the
+    positions of the points it kept as "orders".
+    """
+    if simplify:
+        orders, coords = _simplified(route, simplify)
+        return {'orders': orders, **encode_coords(coords, encoding, precision)}
+    return encode_coords(unpack_points(route.packed_points), encoding, precision)
+
+
+def route_points_payload(route, encoding, precision=POLYLINE_PRECISION, simplify=None):
+    """
+    The route's points in a compact encoding: {"route", "version", "count", "ids", ...}
+    with the point ids in point order (for editing them through the API), read
+    together with the coordinates in one query. A level-of-detail version has the
+    kept positions as "orders" instead of ids, like the JSON response.
+    """
+    payload = {'route': route.pk, 'version': route.version}
+    if simplify:
+        orders, coords = _simplified(route, simplify)
+        payload.update(count=len(orders), orders=orders)
+    else:
+        rows = list(route.points.order_by('order').values_list('id', 'x', 'y'))
+        coords = [(x, y) for _, x, y in rows]
+        payload.update(count=len(rows), ids=[point_id for point_id, _, _ in rows])
+    payload.update(encode_coords(coords, encoding, precision))
+    return payload
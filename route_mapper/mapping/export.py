@@ -0,0 +1,144 @@
+# mapping/export.py
+"""
+Streaming export of a user's routes as GeoJSON, NDJSON or CSV.
+
+The routes are read with QuerySet.iterator(), a chunk of rows at a time, and their
+points come from the packed geometry (see mapping/geometry.py) instead of RoutePoint
+rows, so the whole export is one query. Each generator yields the output piece by
+piece (long routes in blocks of COORDINATE_CHUNK points), so the memory used does not
+depend on how many routes or points are exported.
+
+Coordinates are the stored normalized image coordinates (0.0 to 1.0), not longitude /
+latitude; GeoJSON is used as a widely understood container for the polylines.
+"""
+
+import csv
+import json
+
+from .geometry import unpack_points
+
+# Routes fetched from the database per round trip
+ROUTE_CHUNK_SIZE = 100
+# Points formatted per yielded piece of output
+COORDINATE_CHUNK = 1000
+
+# Route columns read for the export (values_list order)
+EXPORT_FIELDS = [
+    'id', 'name', 'description', 'background_image__slug', 'created_at',
+    'point_count', 'length', 'length_px', 'packed_points',
+]
+
+EXPORT_FORMATS = {
+    # format: (content type, file extension)
+    'geojson': ('application/geo+json', 'geojson'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+
+def _rows(queryset):
+    """Yields one dict per route, reading ROUTE_CHUNK_SIZE routes per round trip."""
+    for values in queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=ROUTE_CHUNK_SIZE):
+        yield dict(zip(EXPORT_FIELDS, values))
+
+
+def _properties(row):
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'description': row['description'],
+        'background_image': row['background_image__slug'],
+        'created_at': row['created_at'].isoformat(),
+        'point_count': row['point_count'],
+        'length': row['length'],
+        'length_px': row['length_px'],
+    }
+
+
+def _coordinate_chunks(packed_points):
+    """
+    Yields the route's points as JSON array fragments ("[x,y],[x,y]"), at most
+    COORDINATE_CHUNK points per fragment. Values are rounded like the other endpoints.
+    """
+    coords = unpack_points(packed_points)
+    for start in range(0, len(coords), 2 * COORDINATE_CHUNK):
+        chunk = coords[start:start + 2 * COORDINATE_CHUNK]
+        yield ','.join(
+            f'[{json.dumps(round(chunk[i], 7))},{json.dumps(round(chunk[i + 1], 7))}]'
+            for i in range(0, len(chunk), 2)
+        )
+
+
+def _joined(chunks):
+    # Comma between the fragments of one array
+    for index, chunk in enumerate(chunks):
+        yield chunk if index == 0 else ',' + chunk
+
+
+def geojson_stream(queryset):
+    """
+    GeoJSON FeatureCollection, one Feature per route: a LineString (a Point for a
+    single point route, no geometry for an empty one) with the route's fields as
+    properties.
+    """
+    yield '{"type":"FeatureCollection","features":['
+    for index, row in enumerate(_rows(queryset)):
+        # From the geometry itself (two float32 per point), so the geometry type always
+        # matches what is written even if the point_count column is out of step
+        point_count = len(row['packed_points']) // 8
+        if index:
+            yield ','
+        yield f'{{"type":"Feature","id":{row["id"]},"properties":{json.dumps(_properties(row))},"geometry":'
+        if not point_count:
+            yield 'null}'
+        elif point_count == 1:
+            yield f'{{"type":"Point","coordinates":{next(_coordinate_chunks(row["packed_points"]))}}}}}'
+        else:
+            yield '{"type":"LineString","coordinates":['
+            yield from _joined(_coordinate_chunks(row['packed_points']))
+            yield ']}}'
+    yield ']}\n'
+
+
+def ndjson_stream(queryset):
+    """
+    Newline-delimited JSON, one route per line with its points as [[x, y], ...].
+    """
+    for row in _rows(queryset):
+        properties = json.dumps(_properties(row))
+        yield properties[:-1] + ',"points":['
+        yield from _joined(_coordinate_chunks(row['packed_points']))
+        yield ']}\n'
+
+
+class _Echo:
+    """File-like object for csv.writer that returns the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(queryset):
+    """
+    CSV with one row per point: route_id, route_name, background_image, order, x, y.
+    Routes without points do not appear.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['route_id', 'route_name', 'background_image', 'order', 'x', 'y'])
+    for row in _rows(queryset):
+        coords = unpack_points(row['packed_points'])
+        prefix = [row['id'], row['name'], row['background_image__slug']]
+        for start in range(0, len(coords), 2 * COORDINATE_CHUNK):
+            first_order = start // 2
+            chunk = coords[start:start + 2 * COORDINATE_CHUNK]
+            yield ''.join(
+                writer.writerow([*prefix, first_order + i // 2, round(chunk[i], 7), round(chunk[i + 1], 7)])
+                for i in range(0, len(chunk), 2)
+            )
+
+
+EXPORT_STREAMS = {
+    'geojson': geojson_stream,
+    'ndjson': ndjson_stream,
+    'csv': csv_stream,
+}
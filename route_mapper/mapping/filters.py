@@ -0,0 +1,61 @@
+# mapping/filters.py
+
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend
+
+
+class RouteMetricsFilterParamsSerializer(serializers.Serializer):
+    """
+    Validates the query parameters understood by RouteMetricsFilter.
+    bbox is "min_x,min_y,max_x,max_y" in normalized (0.0 to 1.0) image units.
+    """
+    length_min = serializers.FloatField(min_value=0.0, required=False)
+    length_max = serializers.FloatField(min_value=0.0, required=False)
+    length_px_min = serializers.FloatField(min_value=0.0, required=False)
+    length_px_max = serializers.FloatField(min_value=0.0, required=False)
+    point_count_min = serializers.IntegerField(min_value=0, required=False)
+    point_count_max = serializers.IntegerField(min_value=0, required=False)
+    bbox = serializers.CharField(required=False)
+
+    def validate_bbox(self, value):
+        try:
+            min_x, min_y, max_x, max_y = (float(part) for part in value.split(','))
+        except ValueError:
+            raise serializers.ValidationError("Expected four comma-separated numbers: min_x,min_y,max_x,max_y.")
+        if min_x > max_x or min_y > max_y:
+            raise serializers.ValidationError("Minimum values must not be greater than maximum values.")
+        return min_x, min_y, max_x, max_y
+
+
+class RouteMetricsFilter(BaseFilterBackend):
+    """
+    Filters routes on their denormalized metrics (see Route.METRIC_FIELDS), e.g.
+    /api/routes/?length_min=0.5&point_count_max=100&bbox=0,0,0.5,0.5
+    The bbox filter keeps routes whose bounding box intersects the given box.
+    """
+    range_filters = {
+        'length_min': 'length__gte',
+        'length_max': 'length__lte',
+        'length_px_min': 'length_px__gte',
+        'length_px_max': 'length_px__lte',
+        'point_count_min': 'point_count__gte',
+        'point_count_max': 'point_count__lte',
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        params = RouteMetricsFilterParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+
+        for param, lookup in self.range_filters.items():
+            if param in filters:
+                queryset = queryset.filter(**{lookup: filters[param]})
+
+        if 'bbox' in filters:
+            min_x, min_y, max_x, max_y = filters['bbox']
+            # Two boxes intersect unless one lies entirely beside the other
+            queryset = queryset.filter(
+                min_x__lte=max_x, max_x__gte=min_x,
+                min_y__lte=max_y, max_y__gte=min_y,
+            )
+        return queryset
@@ -0,0 +1,15 @@
+# mapping/formats.py
+"""
+Parameters of the compact point encodings (mapping/encodings.py) and the image
+heatmaps (mapping/heatmaps.py) that the serializers and renderers validate
+against. Kept apart from those modules so that importing the serializers does
+not load NumPy.
+"""
+
+COMPACT_ENCODINGS = ('columnar', 'polyline', 'msgpack')
+# Decimals kept by the polyline encoding by default: coordinates are normalized
+# (0.0 to 1.0), so 6 decimals is a millionth of the image, below a pixel
+POLYLINE_PRECISION = 6
+
+HEATMAP_RESOLUTIONS = [64, 128, 256, 512, 1024]
+DEFAULT_HEATMAP_RESOLUTION = 256
@@ -1,9 +1,12 @@
 from django import forms
 from .models import BackgroundImage
+from .uploads import ContentAddressedImageFormMixin
 
-class BackgroundImageForm(forms.ModelForm):
+class BackgroundImageForm(ContentAddressedImageFormMixin, forms.ModelForm):
     """
     Form for users to upload a new BackgroundImage.
+    The image is stored by content: uploading the same file again reuses the stored
+    copy, and its size, format and hash are saved on the model (see mapping/uploads.py).
     """
     class Meta:
         model = BackgroundImage
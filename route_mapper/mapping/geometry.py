@@ -0,0 +1,149 @@
+# mapping/geometry.py
+"""
+Helpers for the packed (binary) representation of a route's points.
+
+A route's geometry is stored on Route.packed_points as a flat array of
+little-endian float32 values: x0, y0, x1, y1, ... in point order.
+The index of a pair in the array is the point's position in the route.
+"""
+
+from array import array
+import math
+import sys
+
+# array('f') uses the machine's native byte order, the stored blob is always little-endian
+_NEEDS_BYTESWAP = sys.byteorder != 'little'
+
+
+def unpack_points(blob):
+    """
+    Returns the flat float32 array [x0, y0, x1, y1, ...] stored in a packed blob.
+    """
+    coords = array('f')
+    if blob:
+        coords.frombytes(bytes(blob)) # BinaryField may come back as a memoryview
+        if _NEEDS_BYTESWAP:
+            coords.byteswap()
+    return coords
+
+
+def pack_points(coords):
+    """
+    Packs a flat float array (or any iterable of floats) into the stored blob format.
+    """
+    if not isinstance(coords, array) or coords.typecode != 'f':
+        coords = array('f', coords)
+    if _NEEDS_BYTESWAP:
+        coords = array('f', coords)
+        coords.byteswap()
+    return coords.tobytes()
+
+
+def flatten_points(points):
+    """
+    Turns an iterable of (x, y) pairs into a flat float32 array.
+    """
+    coords = array('f')
+    for x, y in points:
+        coords.append(x)
+        coords.append(y)
+    return coords
+
+
+def measure_points(coords, width=None, height=None, previous=None):
+    """
+    Computes the route metrics for a flat coordinate array:
+    point_count, length (normalized units), length_px (pixels, only when the image
+    width and height are known) and the bounding box (min_x, min_y, max_x, max_y).
+
+    To extend existing metrics incrementally (appending points), pass the metrics of
+    the route so far as `previous` and the last existing point followed by the new
+    points as `coords`; the first pair is then only used as the start of the first
+    new segment.
+    """
+    if previous is None or not previous['point_count']:
+        metrics = {
+            'point_count': 0, 'length': 0.0, 'length_px': 0.0 if width and height else None,
+            'min_x': None, 'min_y': None, 'max_x': None, 'max_y': None,
+        }
+        start = 0
+    else:
+        metrics = dict(previous)
+        start = 2 # Skip the previous last point, it is already counted
+
+    xs = coords[start::2]
+    ys = coords[start + 1::2]
+    if not xs:
+        return metrics
+
+    metrics['point_count'] += len(xs)
+    metrics['min_x'] = min(xs) if metrics['min_x'] is None else min(metrics['min_x'], min(xs))
+    metrics['min_y'] = min(ys) if metrics['min_y'] is None else min(metrics['min_y'], min(ys))
+    metrics['max_x'] = max(xs) if metrics['max_x'] is None else max(metrics['max_x'], max(xs))
+    metrics['max_y'] = max(ys) if metrics['max_y'] is None else max(metrics['max_y'], max(ys))
+
+    # Segment lengths, starting from the previous last point when extending
+    all_xs = coords[0::2]
+    all_ys = coords[1::2]
+    length = 0.0
+    length_px = 0.0
+    for i in range(1, len(all_xs)):
+        dx = all_xs[i] - all_xs[i - 1]
+        dy = all_ys[i] - all_ys[i - 1]
+        length += math.hypot(dx, dy)
+        if width and height:
+            length_px += math.hypot(dx * width, dy * height)
+    metrics['length'] += length
+    if metrics['length_px'] is not None:
+        metrics['length_px'] += length_px
+    return metrics
+
+
+def polyline_length(coords, width=None, height=None):
+    """
+    (length in normalized units, length in pixels or None) of the polyline through
+    the points of a flat coordinate array.
+    """
+    metrics = measure_points(coords, width, height)
+    return metrics['length'], metrics['length_px']
+
+
+def splice_metrics(previous, coords, start, stop, added, old_part, new_part, width=None, height=None):
+    """
+    Route metrics after replacing the points at positions start..stop-1 with `added`
+    (a flat array), adjusted from the `previous` metrics instead of measuring the
+    whole route again. `coords` is the full geometry after the splice. `old_part`
+    and `new_part` are the points from the one before the splice to the one after it,
+    before and after: only their segments change length. The bounding box is only
+    recomputed from `coords` when a removed point was lying on it.
+    """
+    removed_count = stop - start
+    if (
+        not previous['point_count'] or previous['point_count'] == removed_count or previous['min_x'] is None
+        or (width and height and previous['length_px'] is None)
+    ):
+        return measure_points(coords, width, height) # Nothing to adjust from (or nothing left)
+
+    metrics = dict(previous)
+    metrics['point_count'] += len(added) // 2 - removed_count
+    old_length, old_length_px = polyline_length(old_part, width, height)
+    new_length, new_length_px = polyline_length(new_part, width, height)
+    metrics['length'] = max(metrics['length'] - old_length + new_length, 0.0)
+    if metrics['length_px'] is not None and old_length_px is not None:
+        metrics['length_px'] = max(metrics['length_px'] - old_length_px + new_length_px, 0.0)
+
+    first = 2 if start else 0 # old_part starts at the point before the splice, if any
+    removed = old_part[first:first + 2 * removed_count]
+    on_box = (
+        min(removed[0::2]) <= metrics['min_x'] or max(removed[0::2]) >= metrics['max_x']
+        or min(removed[1::2]) <= metrics['min_y'] or max(removed[1::2]) >= metrics['max_y']
+    ) if removed else False
+    if on_box:
+        xs, ys = coords[0::2], coords[1::2]
+        metrics.update(min_x=min(xs), min_y=min(ys), max_x=max(xs), max_y=max(ys))
+    elif added:
+        metrics['min_x'] = min(metrics['min_x'], min(added[0::2]))
+        metrics['min_y'] = min(metrics['min_y'], min(added[1::2]))
+        metrics['max_x'] = max(metrics['max_x'], max(added[0::2]))
+        metrics['max_y'] = max(metrics['max_y'], max(added[1::2]))
+    return metrics
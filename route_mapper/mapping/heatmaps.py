@@ -0,0 +1,167 @@
+# mapping/heatmaps.py
+"""
+Route density heatmaps of background images (GET /api/images/{slug}/heatmap/).
+
+The routes of all users on an image are rasterized into a grid of
+resolution x resolution cells over the normalized image coordinates. Every
+segment is sampled at least twice per cell it crosses and each sample adds its
+share of the segment's length, in cell widths, to its cell, so a cell ends up
+with about how many times routes pass through it. The sampling and the
+accumulation (np.bincount) are done for all segments of a route at once, from
+the packed geometry, without loading RoutePoint rows.
+
+The grid is stored (ImageHeatmap) together with the state of the image's routes
+it was built from (RouteQuerySet.state). Point writes do not touch it, they
+already bump their route's version and last_modified, so a heatmap request
+compares that state (one aggregate query) and rebuilds the grid only when it is
+dirty. The rebuild holds a lock on the ImageHeatmap row, so requests arriving
+meanwhile wait for it and reuse its grid instead of building the same one again.
+"""
+
+import base64
+from io import BytesIO
+
+import numpy as np
+from django.db import transaction
+from PIL import Image
+
+from .formats import DEFAULT_HEATMAP_RESOLUTION
+from .geometry import unpack_points
+from .models import ImageHeatmap, Route
+
+# Routes fetched from the database per round trip while building a grid
+ROUTE_CHUNK_SIZE = 100
+# Samples per crossed cell, two so that no cell on a segment is skipped
+SAMPLES_PER_CELL = 2
+
+
+def segment_samples(coords, resolution):
+    """
+    (cell ids, weights) of the samples of one polyline (a flat [x0, y0, ...] array in
+    normalized coordinates): the cell of every sample as row * resolution + column
+    and its share of the segment's length in cell widths. A single point has no
+    length and gives no samples.
+    """
+    xy = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(xy) < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    starts = xy[:-1]
+    deltas = xy[1:] - starts
+    lengths = np.hypot(deltas[:, 0], deltas[:, 1]) * resolution # In cell widths
+    samples = np.maximum(1, np.ceil(lengths * SAMPLES_PER_CELL)).astype(np.int64)
+
+    # Every sample at the middle of its equal part of the segment
+    segment = np.repeat(np.arange(len(starts)), samples)
+    first_sample = np.repeat(np.cumsum(samples) - samples, samples)
+    t = (np.arange(len(segment)) - first_sample + 0.5) / samples[segment]
+    points = starts[segment] + deltas[segment] * t[:, None]
+
+    cell_xy = np.clip(np.floor(points * resolution).astype(np.int64), 0, resolution - 1)
+    return cell_xy[:, 1] * resolution + cell_xy[:, 0], (lengths / samples)[segment]
+
+
+def rasterize(coords, resolution):
+    """
+    Density of one polyline as a flat float64 array of resolution * resolution cells, row by row.
+    """
+    cell_ids, weights = segment_samples(coords, resolution)
+    return np.bincount(cell_ids, weights=weights, minlength=resolution * resolution)
+
+
+def build_grid(background_image, resolution):
+    """
+    (float32 grid, number of routes) over all routes on the image, read in one
+    iterated query of their packed geometry. The samples of ROUTE_CHUNK_SIZE
+    routes are added up with one bincount, not a full grid per route.
+    """
+    grid = np.zeros(resolution * resolution)
+    route_count = 0
+    chunk = []
+    packed = Route.objects.filter(background_image=background_image).values_list('packed_points', flat=True)
+    for packed_points in packed.iterator(chunk_size=ROUTE_CHUNK_SIZE):
+        chunk.append(segment_samples(unpack_points(packed_points), resolution))
+        route_count += 1
+        if len(chunk) == ROUTE_CHUNK_SIZE:
+            grid += _accumulate(chunk, len(grid))
+            chunk = []
+    if chunk:
+        grid += _accumulate(chunk, len(grid))
+    return grid.astype('<f4'), route_count
+
+
+def _accumulate(samples, size):
+    cell_ids = np.concatenate([cell_ids for cell_ids, _ in samples])
+    weights = np.concatenate([weights for _, weights in samples])
+    return np.bincount(cell_ids, weights=weights, minlength=size)
+
+
+def get_heatmap(background_image, resolution=DEFAULT_HEATMAP_RESOLUTION):
+    """
+    The image's heatmap at the given resolution, rebuilt first if it is missing or
+    dirty. Only one request rebuilds it: the others block on the row lock and then
+    find it up to date. The state is read before the routes, so a write that lands
+    during the build leaves the stored heatmap dirty for the next request.
+    """
+    routes = Route.objects.filter(background_image=background_image)
+    heatmap = ImageHeatmap.objects.filter(background_image=background_image, resolution=resolution).first()
+    if heatmap is not None and heatmap.routes_state == routes.state():
+        return heatmap
+
+    with transaction.atomic():
+        # An empty row for a new heatmap, so there is a row to lock
+        heatmap, _ = ImageHeatmap.objects.select_for_update().get_or_create(
+            background_image=background_image, resolution=resolution, defaults={'grid': b''}
+        )
+        state = routes.state()
+        if heatmap.routes_state == state: # Rebuilt by the request we waited for
+            return heatmap
+
+        grid, route_count = build_grid(background_image, resolution)
+        heatmap.grid = grid.tobytes()
+        heatmap.max_value = float(grid.max()) if len(grid) else 0.0
+        heatmap.route_count = route_count
+        heatmap.routes_state = state
+        heatmap.save()
+    return heatmap
+
+
+def heatmap_grid(heatmap):
+    """The heatmap's cells as a (resolution, resolution) float32 array, rows from the top."""
+    return np.frombuffer(bytes(heatmap.grid), dtype='<f4').reshape(heatmap.resolution, heatmap.resolution)
+
+
+def heatmap_data(heatmap, binary=False):
+    """
+    The heatmap as a dict for the API: the grid as little-endian float32 bytes,
+    base64 encoded unless `binary` (for MessagePack).
+    """
+    grid = bytes(heatmap.grid)
+    return {
+        'image': heatmap.background_image.slug,
+        'resolution': heatmap.resolution,
+        'routes': heatmap.route_count,
+        'max_value': heatmap.max_value,
+        'built_at': heatmap.built_at.isoformat() if heatmap.built_at else None,
+        'grid': grid if binary else base64.b64encode(grid).decode('ascii'),
+    }
+
+
+def heatmap_png(heatmap):
+    """
+    The heatmap as an RGBA PNG overlay of resolution x resolution pixels, to be
+    stretched over the image: empty cells are transparent, the others go from
+    translucent red to opaque yellow-white. The square root of the density is
+    used, so that a few busy corridors do not wash out everything else.
+    """
+    grid = heatmap_grid(heatmap).astype(np.float64)
+    level = np.sqrt(grid / heatmap.max_value) if heatmap.max_value > 0 else grid
+    rgba = np.empty(grid.shape + (4,), dtype=np.uint8)
+    rgba[..., 0] = np.clip(level * 3, 0, 1) * 255
+    rgba[..., 1] = np.clip(level * 3 - 1, 0, 1) * 255
+    rgba[..., 2] = np.clip(level * 3 - 2, 0, 1) * 255
+    rgba[..., 3] = np.where(grid > 0, 96 + level * 159, 0)
+
+    output = BytesIO()
+    Image.fromarray(rgba, 'RGBA').save(output, format='PNG', optimize=True)
+    return output.getvalue()
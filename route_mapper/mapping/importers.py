@@ -0,0 +1,370 @@
+# mapping/importers.py
+"""
+Bulk import of routes from GPX, GeoJSON or CSV files.
+
+The parsers read the file incrementally and yield one (route_key, route_name, a, b)
+tuple per point, so the file is never loaded as a whole:
+
+    GPX      every <trk> (all of its segments) and every <rte> becomes a route,
+             (a, b) = (lon, lat)
+    GeoJSON  a FeatureCollection; LineString, MultiLineString and Point features
+             become routes (properties.name is the route name), (a, b) = coordinates
+    CSV      a header row with x,y (or lon,lat) columns, rows grouped into routes
+             by a route_id or route_name column; the format written by the CSV export
+
+A frame (see make_frame) maps (a, b) to normalized image coordinates. import_routes()
+then creates the routes and writes their points in chunks (RoutePointManager.insert_points,
+one executemany per chunk), builds the packed geometry / metrics / spatial index once
+per route, and reports progress.
+"""
+
+from array import array
+import codecs
+import csv
+import io
+from itertools import chain, groupby, islice
+import json
+from operator import itemgetter
+from xml.parsers import expat
+
+from django.db import transaction
+
+from .models import Route, RoutePoint
+from .ranks import RANK_GAP
+
+# Points converted and inserted per round (one executemany each)
+IMPORT_CHUNK_SIZE = 5000
+# Frame rounding may put edge points a hair outside the image, those are clamped
+EDGE_TOLERANCE = 1e-9
+
+IMPORT_FORMATS = ['gpx', 'geojson', 'csv']
+FRAMES = ['normalized', 'pixels', 'bounds', 'fit']
+# Frame used when none is given: GPX is always longitude / latitude
+DEFAULT_FRAMES = {'gpx': 'fit', 'geojson': 'normalized', 'csv': 'normalized'}
+
+# Bytes read from the file at a time by the GPX and GeoJSON parsers
+READ_SIZE = 64 * 1024
+
+
+class RouteImportError(ValueError):
+    """The file could not be imported (bad format, coordinates outside the image, ...)."""
+
+
+def guess_format(file_name):
+    """Import format from a file name's extension, None if it is not recognized."""
+    extension = file_name.rsplit('.', 1)[-1].lower()
+    return {'gpx': 'gpx', 'geojson': 'geojson', 'json': 'geojson', 'csv': 'csv'}.get(extension)
+
+
+# --- Parsers ---
+
+def parse_gpx(binary_file):
+    """
+    Yields (route_key, route_name, lon, lat) for every track and route point.
+    Uses the expat parser's callbacks directly (no element tree is built) and feeds
+    it READ_SIZE bytes at a time, yielding the points found in each block.
+    """
+    state = {'key': 0, 'name': None, 'in_route': False, 'in_point': False, 'name_text': None}
+    found = []
+
+    # Called for every element, so kept short. Tags may carry a namespace prefix ("gpx:trkpt").
+    def start(tag, attributes):
+        if ':' in tag:
+            tag = tag.rsplit(':', 1)[1]
+        if tag == 'trkpt' or tag == 'rtept':
+            try:
+                found.append((state['key'], state['name'], float(attributes['lon']), float(attributes['lat'])))
+            except (KeyError, ValueError):
+                raise RouteImportError(f"GPX point without valid lat/lon in route {state['key']}.")
+            state['in_point'] = True
+        elif tag == 'trk' or tag == 'rte':
+            state.update(key=state['key'] + 1, name=None, in_route=True)
+        elif tag == 'name' and state['in_route'] and not state['in_point'] and state['name'] is None:
+            state['name_text'] = [] # Collect the route's name text
+
+    def end(tag):
+        if ':' in tag:
+            tag = tag.rsplit(':', 1)[1]
+        if tag == 'trkpt' or tag == 'rtept':
+            state['in_point'] = False
+        elif tag == 'name' and state['name_text'] is not None:
+            state['name'] = ''.join(state['name_text']).strip() or None
+            state['name_text'] = None
+        elif tag == 'trk' or tag == 'rte':
+            state['in_route'] = False
+
+    def text(data):
+        if state['name_text'] is not None:
+            state['name_text'].append(data)
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = text
+    parser.buffer_text = True
+    while True:
+        chunk = binary_file.read(READ_SIZE)
+        try:
+            parser.Parse(chunk, not chunk)
+        except expat.ExpatError as error:
+            raise RouteImportError(f"Invalid GPX: {error}")
+        for route_key, route_name, lon, lat in found:
+            yield route_key, route_name or f'Track {route_key}', lon, lat
+        found.clear()
+        if not chunk:
+            return
+
+
+def _find_array_start(text_file, key):
+    """
+    Reads until the "[" opening the array stored under `key` in the top-level object
+    and returns (buffer, position right after it). Strings are skipped and nesting is
+    tracked, so the same key in a nested object (e.g. in "properties") or inside a
+    string value is not taken for it.
+    """
+    buffer = ''
+    position = 0
+    depth = 0
+    string_start = None # Index of the opening quote while inside a string
+    escaped = False
+    last_string = current_key = None
+    while True:
+        chunk = text_file.read(READ_SIZE)
+        if not chunk:
+            raise RouteImportError(f'Expected a GeoJSON FeatureCollection with a "{key}" array.')
+        buffer += chunk
+        while position < len(buffer):
+            char = buffer[position]
+            if string_start is not None:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    if depth == 1:
+                        last_string = buffer[string_start:position + 1]
+                    string_start = None
+            elif char == '"':
+                string_start = position
+            elif char in '{[':
+                if char == '[' and depth == 1 and current_key == key:
+                    return buffer, position + 1
+                depth += 1
+            elif char in '}]':
+                depth -= 1
+            elif depth == 1 and char == ':': # The last string was a key of the top-level object
+                try:
+                    current_key = json.loads(last_string)
+                except (TypeError, json.JSONDecodeError):
+                    raise RouteImportError("Invalid GeoJSON.")
+            elif depth == 1 and char == ',':
+                current_key = None
+            position += 1
+        # Drop what has been scanned, except a string that is still open
+        keep = position if string_start is None else string_start
+        buffer, position = buffer[keep:], position - keep
+        if string_start is not None:
+            string_start = 0
+
+
+def _json_array_items(text_file, key):
+    """
+    Yields the items of the array stored under `key` ("features") in the top-level
+    object one by one, decoding them from a rolling buffer instead of loading the
+    whole document.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position = _find_array_start(text_file, key)
+
+    while True:
+        # Skip whitespace and the comma between items
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer):
+                break
+            chunk = text_file.read(READ_SIZE)
+            if not chunk:
+                raise RouteImportError("Unexpected end of GeoJSON file.")
+            buffer, position = chunk, 0
+        if buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # Most likely the item continues in the next chunk
+            chunk = text_file.read(READ_SIZE)
+            if not chunk:
+                raise RouteImportError("Invalid or truncated GeoJSON.")
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield item
+        position = end
+        if position > READ_SIZE:
+            buffer, position = buffer[position:], 0 # Drop what has been decoded
+
+
+def parse_geojson(binary_file):
+    """Yields (route_key, route_name, x, y) for the points of every feature."""
+    text_file = codecs.getreader('utf-8')(binary_file)
+    for route_key, feature in enumerate(_json_array_items(text_file, 'features'), start=1):
+        if not isinstance(feature, dict):
+            raise RouteImportError(f"Feature {route_key} is not a GeoJSON object.")
+        geometry = feature.get('geometry') or {}
+        properties = feature.get('properties') or {}
+        route_name = str(properties.get('name') or f'Feature {route_key}')
+        kind = geometry.get('type')
+        coordinates = geometry.get('coordinates') or []
+        if kind == 'Point':
+            lines = [[coordinates]]
+        elif kind == 'LineString':
+            lines = [coordinates]
+        elif kind == 'MultiLineString':
+            lines = coordinates
+        else:
+            continue # Polygons etc. are not routes
+        for line in lines:
+            for position in line:
+                try:
+                    yield route_key, route_name, float(position[0]), float(position[1])
+                except (TypeError, ValueError, IndexError):
+                    raise RouteImportError(f"Invalid coordinates in feature {route_key}.")
+
+
+def parse_csv(binary_file):
+    """
+    Yields (route_key, route_name, a, b) for every row. Rows of one route must be
+    consecutive (as in the CSV export); without a route column the file is one route.
+    """
+    text_file = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(text_file)
+        header = next(reader, [])
+        if 'x' in header and 'y' in header:
+            a_index, b_index = header.index('x'), header.index('y')
+        elif 'lon' in header and 'lat' in header:
+            a_index, b_index = header.index('lon'), header.index('lat')
+        else:
+            raise RouteImportError("CSV needs x,y or lon,lat columns.")
+        key_index = next((header.index(column) for column in ('route_id', 'route_name', 'route') if column in header), None)
+        name_index = next((header.index(column) for column in ('route_name', 'name', 'route') if column in header), None)
+
+        for line_number, row in enumerate(reader, start=2):
+            try:
+                yield (
+                    row[key_index] if key_index is not None else 1,
+                    row[name_index] if name_index is not None else 'Imported Route',
+                    float(row[a_index]), float(row[b_index]),
+                )
+            except (IndexError, ValueError):
+                raise RouteImportError(f"Invalid coordinates on CSV line {line_number}.")
+    finally:
+        text_file.detach() # Leave the caller's file open (it is read twice for frame="fit")
+
+
+PARSERS = {
+    'gpx': parse_gpx,
+    'geojson': parse_geojson,
+    'csv': parse_csv,
+}
+
+
+# --- Frames ---
+
+def make_frame(frame, background_image, bounds=None, points=None):
+    """
+    Returns a function mapping a parsed (a, b) pair to normalized image coordinates.
+
+    normalized  (a, b) already are 0.0 to 1.0 fractions of the image (default for CSV
+                and GeoJSON, what the export writes)
+    pixels      (a, b) are pixels of the background image
+    bounds      (a, b) are (lon, lat); `bounds` = (west, south, east, north) of the image
+    fit         (a, b) are (lon, lat); the bounding box of all points is stretched over
+                the whole image. Needs `points`, an iterable of (a, b) for a first pass.
+    """
+    if frame == 'normalized':
+        return lambda a, b: (a, b)
+    if frame == 'pixels':
+        width, height = background_image.width, background_image.height
+        if not width or not height:
+            raise RouteImportError("The image size is unknown, pixel coordinates cannot be used.")
+        return lambda a, b: (a / width, b / height)
+    if frame == 'fit':
+        west = south = float('inf')
+        east = north = float('-inf')
+        for a, b in points:
+            west, east = min(west, a), max(east, a)
+            south, north = min(south, b), max(north, b)
+        if west == float('inf'):
+            raise RouteImportError("The file contains no points.")
+        bounds = (west, south, east, north)
+    if frame in ('bounds', 'fit'):
+        if bounds is None:
+            raise RouteImportError("The bounds frame needs bounds=west,south,east,north.")
+        west, south, east, north = bounds
+        # A single point or a perfectly straight line has no extent on one axis
+        width = (east - west) or 1.0
+        height = (north - south) or 1.0
+        # North is up: latitude grows upwards, image y grows downwards
+        return lambda a, b: ((a - west) / width, (north - b) / height)
+    raise RouteImportError(f"Unknown frame {frame!r}.")
+
+
+# --- Import ---
+
+def _clamped(values, route):
+    """Clamps values within EDGE_TOLERANCE of the image edges, rejects the rest."""
+    if min(values) < -EDGE_TOLERANCE or max(values) > 1 + EDGE_TOLERANCE:
+        raise RouteImportError(f"Route {route.name!r} has points outside the image; check the frame / bounds.")
+    return [min(max(value, 0.0), 1.0) for value in values]
+
+
+def import_routes(binary_file, import_format, user, background_image, frame=None, bounds=None,
+                  chunk_size=None, progress=None):
+    """
+    Imports every route of an open (binary, seekable for frame="fit") file for
+    `user` on `background_image`, all or nothing in one transaction.
+    progress(routes, points) is called after every written chunk of points.
+    Returns the list of created routes.
+    """
+    parse = PARSERS[import_format]
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    frame = frame or DEFAULT_FRAMES[import_format]
+    first_pass = None
+    if frame == 'fit':
+        first_pass = ((a, b) for _, _, a, b in parse(binary_file))
+    to_image = make_frame(frame, background_image, bounds, first_pass)
+    if frame == 'fit':
+        binary_file.seek(0)
+
+    routes = []
+    point_total = 0
+    with transaction.atomic():
+        for _, route_points in groupby(parse(binary_file), key=itemgetter(0)):
+            first_key, route_name, a, b = next(route_points)
+            route = Route.objects.create(user=user, background_image=background_image, name=route_name[:255])
+            coords = array('f')
+            points = chain([(first_key, route_name, a, b)], route_points)
+            # Convert and write one chunk of points at a time
+            while True:
+                chunk = [to_image(a, b) for _, _, a, b in islice(points, chunk_size)]
+                if not chunk:
+                    break
+                xs, ys = map(list, zip(*chunk))
+                if min(xs) < 0.0 or max(xs) > 1.0 or min(ys) < 0.0 or max(ys) > 1.0:
+                    xs, ys = _clamped(xs, route), _clamped(ys, route)
+                # Ranks RANK_GAP apart, continuing after the points already written
+                first_rank = RANK_GAP * (len(coords) // 2 + 1)
+                RoutePoint.objects.insert_points(route.pk, xs, ys, first_rank)
+                coords.extend(chain.from_iterable(zip(xs, ys)))
+                point_total += len(chunk)
+                if progress:
+                    progress(len(routes), point_total)
+
+            # Geometry, metrics and spatial index once per route, not per chunk
+            route._save_packed_points(coords)
+            route.update_segment_cells(coords)
+            routes.append(route)
+            if progress:
+                progress(len(routes), point_total)
+    return routes
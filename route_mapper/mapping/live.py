@@ -0,0 +1,57 @@
+# mapping/live.py
+"""
+Live point-level updates of routes (see mapping/consumers.py for the WebSocket side).
+
+Every write to a route's points sends a small delta to the route's channel group
+once the transaction commits, instead of subscribers re-fetching /api/routes/{id}/:
+
+    {"route": 5, "version": 12, "op": "append", "position": 40, "points": [{"id", "x", "y"}, ...]}
+    {"route": 5, "version": 13, "op": "insert", "position": 3, "points": [...]}
+    {"route": 5, "version": 14, "op": "move", "position": 3, "point": {"id", "x", "y"}}
+    {"route": 5, "version": 15, "op": "delete", "position": 3, "count": 2}
+    {"route": 5, "version": 16, "op": "reload"}     (batch edits, route changes: fetch again)
+    {"route": 5, "op": "deleted"}
+
+Each point write bumps the route's version by exactly one, so a client at version
+N applies the delta with version N + 1, ignores older ones (its own edits, already
+fetched) and fetches the route again if it sees a gap.
+
+Channels is optional: without it (or without CHANNEL_LAYERS) nothing is sent.
+"""
+
+from django.db import transaction
+
+try:
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+except ImportError: # Channels not installed, live updates are off
+    get_channel_layer = None
+
+
+def route_group(route_id):
+    """Channel group of the subscribers of one route."""
+    return f'route-{route_id}'
+
+
+def delta_point(point):
+    """A point as it appears in the deltas."""
+    return {'id': point.pk, 'x': point.x, 'y': point.y}
+
+
+def broadcast_route_delta(route, op, **delta):
+    """
+    Sends {"route", "version", "op", **delta} to the route's subscribers after the
+    current transaction commits (nothing is sent if it rolls back).
+    """
+    message = {'type': 'route.delta', 'route': route.pk, 'op': op, **delta}
+    if op != 'deleted':
+        message['version'] = route.version
+    route_id = route.pk
+    transaction.on_commit(lambda: send_to_route_group(route_id, message))
+
+
+def send_to_route_group(route_id, message):
+    channel_layer = get_channel_layer() if get_channel_layer else None
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(route_group(route_id), message)
@@ -0,0 +1,75 @@
+# mapping/management/commands/backfill_route_metrics.py
+
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mapping.geometry import flatten_points, measure_points, pack_points
+from mapping.models import BackgroundImage, Route, RoutePoint
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the packed geometry, the denormalized metrics (point count, length,
+    pixel length, bounding box) and the spatial index cells of existing routes
+    from their RoutePoint rows.
+
+    Routes are processed in batches of --batch-size: one query for the routes, one for
+    all of their points and one bulk UPDATE per batch, each batch in its own transaction.
+    Usage: python manage.py backfill_route_metrics --batch-size 500
+    """
+    help = "Backfill Route.packed_points and route metrics from RoutePoint rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Number of routes processed per batch.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # Pixel lengths need the image sizes, read the missing ones first
+        for image in BackgroundImage.objects.filter(width__isnull=True).iterator():
+            image.read_dimensions()
+            if image.width is not None:
+                image.save(update_fields=['width', 'height'])
+
+        update_fields = ['packed_points', 'version', *Route.METRIC_FIELDS]
+        last_pk = 0
+        total = 0
+        while True:
+            with transaction.atomic():
+                routes = list(
+                    Route.objects.select_related('background_image')
+                    .select_for_update(of=('self',))
+                    .filter(pk__gt=last_pk).order_by('pk')[:batch_size]
+                )
+                if not routes:
+                    break
+
+                points = (
+                    RoutePoint.objects.filter(route__in=routes)
+                    .order_by('route_id', 'order')
+                    .values_list('route_id', 'x', 'y')
+                )
+                coords_by_route = {
+                    route_id: flatten_points((x, y) for _, x, y in rows)
+                    for route_id, rows in groupby(points.iterator(), key=lambda row: row[0])
+                }
+
+                for route in routes:
+                    coords = coords_by_route.get(route.pk, flatten_points(()))
+                    for field, value in measure_points(coords, *route.image_size()).items():
+                        setattr(route, field, value)
+                    route.packed_points = pack_points(coords)
+                    route.version += 1 # Invalidates anything cached for the old version
+                Route.objects.bulk_update(routes, update_fields)
+                # Refresh the spatial grid index too
+                for route in routes:
+                    route.update_segment_cells(coords_by_route.get(route.pk, flatten_points(())))
+
+            last_pk = routes[-1].pk
+            total += len(routes)
+            self.stdout.write(f"Backfilled {total} routes...")
+
+        self.stdout.write(self.style.SUCCESS(f"Done, {total} routes backfilled."))
@@ -0,0 +1,102 @@
+# mapping/management/commands/benchmark_api.py
+
+from datetime import datetime, timezone
+import json
+import platform
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from mapping.benchmarks import SCENARIOS, generate_dataset, run_benchmarks
+
+
+class Command(BaseCommand):
+    """
+    Generates a synthetic dataset (users x routes x points on several background images)
+    and measures the route API on it: latency percentiles, queries per request and peak
+    memory for the route list, route retrieve, export, point create and point delete.
+    The results are written as JSON; with --compare, the median latencies and query
+    counts of an earlier run are shown next to the new ones.
+
+    Everything runs inside a transaction that is rolled back at the end,
+    so the command can be pointed at a development database safely.
+    Usage: python manage.py benchmark_api --users 10 --routes 20 --points 1000 --output after.json --compare before.json
+    """
+    help = "Benchmark the route API on a generated dataset and write the results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help="Number of users.")
+        parser.add_argument('--routes', type=int, default=10, help="Routes per user.")
+        parser.add_argument('--points', type=int, default=500, help="Points per route.")
+        parser.add_argument('--images', type=int, default=3, help="Number of background images.")
+        parser.add_argument('--repeat', type=int, default=50, help="Timed requests per scenario.")
+        parser.add_argument('--warmup', type=int, default=2, help="Untimed requests per scenario first.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the generated points.")
+        parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS),
+                            help="Scenarios to run (all by default).")
+        parser.add_argument('--output', default='benchmark_api.json',
+                            help="JSON file the results are written to ('-' for stdout only).")
+        parser.add_argument('--compare', help="JSON results of an earlier run to compare with.")
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['routes'], options['images'], options['repeat']) < 1:
+            raise CommandError("--users, --routes, --images and --repeat must be at least 1.")
+        baseline = {}
+        if options['compare']:
+            try:
+                with open(options['compare']) as baseline_file:
+                    baseline = json.load(baseline_file)['results']
+            except (OSError, ValueError, KeyError) as error:
+                raise CommandError(f"Cannot read {options['compare']}: {error}")
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            dataset = generate_dataset(
+                users=options['users'], routes_per_user=options['routes'],
+                points_per_route=options['points'], images=options['images'], seed=options['seed'],
+            )
+            setup_seconds = time.perf_counter() - started
+            self.stdout.write(f"Generated {dataset.summary()['points']} points in {setup_seconds:.2f}s")
+            self.stdout.write(
+                f"{'scenario':<16} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'peak kB':>9}"
+                + (f" {'p50 before':>10} {'queries before':>14}" if baseline else '')
+            )
+
+            def progress(name, result):
+                line = (
+                    f"{name:<16} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+                    f" {result['queries_max']:>8} {result['peak_memory_kb']:>9.1f}"
+                )
+                if name in baseline:
+                    line += f" {baseline[name]['p50_ms']:>10.2f} {baseline[name]['queries_max']:>14}"
+                self.stdout.write(line)
+
+            results = run_benchmarks(
+                dataset, names=options['scenarios'], repeat=options['repeat'],
+                warmup=options['warmup'], progress=progress,
+            )
+
+            # Throw away all benchmark data
+            transaction.set_rollback(True)
+
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'parameters': {
+                'repeat': options['repeat'], 'warmup': options['warmup'], 'seed': options['seed'],
+            },
+            'dataset': {**dataset.summary(), 'setup_seconds': round(setup_seconds, 3)},
+            'results': results,
+        }
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            with open(options['output'], 'w') as output_file:
+                json.dump(report, output_file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}."))
@@ -0,0 +1,83 @@
+# mapping/management/commands/benchmark_point_delete.py
+
+import math
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from mapping.models import BackgroundImage, Route, RoutePoint
+from mapping.views import RoutePointViewSet
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Measures how long deleting a point near the start of a route takes
+    for increasingly long routes.
+
+    The routes are written like real ones (RoutePoint rows with sparse ranks, then the
+    packed geometry, metrics and segment cells), so a delete does all of its real
+    work: the row, the packed geometry splice, the metrics and the cells around the point.
+
+    Everything runs inside a transaction that is rolled back at the end,
+    so the command can be pointed at a development database safely.
+    Usage: python manage.py benchmark_point_delete --lengths 1000 5000 20000
+    """
+    help = "Benchmark RoutePoint deletion latency against route length."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lengths', nargs='+', type=int, default=[1000, 5000, 20000],
+                            help="Route lengths (number of points) to benchmark.")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Number of deletes timed per route length.")
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        destroy_view = RoutePointViewSet.as_view({'delete': 'destroy'})
+
+        self.stdout.write(f"{'points':>8} {'median ms':>10} {'max ms':>8} {'queries':>8}")
+
+        with transaction.atomic():
+            user = User.objects.create_user(username='benchmark-point-delete')
+            image = BackgroundImage.objects.create(name='Benchmark Image', image='benchmark/none.jpg')
+            BackgroundImage.objects.filter(pk=image.pk).update(width=20000, height=15000)
+            image.refresh_from_db()
+
+            for length in options['lengths']:
+                route = Route.objects.create(user=user, background_image=image, name=f'Benchmark {length}')
+                # A wavy path across the image, so the route covers plenty of grid cells
+                xs = [i / length for i in range(length)]
+                ys = [0.5 + 0.4 * math.sin(i / 50) for i in range(length)]
+                RoutePoint.objects.insert_points(route.pk, xs, ys)
+                route.refresh_from_db()
+                route.rebuild_packed_points()
+
+                timings = []
+                query_count = 0
+                for _ in range(options['repeat']):
+                    # Always delete the second point (it used to renumber every later point)
+                    point = route.points.all()[1]
+                    request = factory.delete(f'/api/routes/{route.pk}/points/{point.pk}/')
+                    force_authenticate(request, user=user)
+
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        response = destroy_view(request, route_pk=route.pk, pk=point.pk)
+                        timings.append((time.perf_counter() - started) * 1000)
+                    query_count = len(queries)
+
+                    if response.status_code != 204:
+                        self.stderr.write(f"Unexpected status {response.status_code}")
+
+                timings.sort()
+                self.stdout.write(
+                    f"{length:>8} {timings[len(timings) // 2]:>10.2f} {timings[-1]:>8.2f} {query_count:>8}"
+                )
+
+            # Throw away all benchmark data
+            transaction.set_rollback(True)
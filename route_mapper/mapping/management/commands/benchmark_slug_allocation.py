@@ -0,0 +1,60 @@
+# mapping/management/commands/benchmark_slug_allocation.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from mapping.models import BackgroundImage
+
+
+class Command(BaseCommand):
+    """
+    Measures how long saving a BackgroundImage takes when many images with the
+    same name (and so the same base slug) already exist.
+
+    Everything runs inside a transaction that is rolled back at the end,
+    so the command can be pointed at a development database safely.
+    Usage: python manage.py benchmark_slug_allocation --duplicates 10 100 1000
+    """
+    help = "Benchmark slug allocation latency against the number of duplicate names."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duplicates', nargs='+', type=int, default=[10, 100, 1000],
+                            help="Number of existing images with the same name.")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Number of saves timed per duplicate count.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'existing':>8} {'median ms':>10} {'max ms':>8} {'queries':>8}")
+
+        with transaction.atomic():
+            for duplicates in options['duplicates']:
+                name = f'Benchmark Slug {duplicates}'
+                # Create the duplicates with their final slugs directly, the
+                # allocation being measured is only the one below
+                BackgroundImage.objects.bulk_create(
+                    BackgroundImage(
+                        name=name, image='benchmark/none.jpg',
+                        slug=f'benchmark-slug-{duplicates}' + (f'-{i}' if i else ''),
+                    )
+                    for i in range(duplicates)
+                )
+
+                timings = []
+                query_count = 0
+                for _ in range(options['repeat']):
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        BackgroundImage.objects.create(name=name, image='benchmark/none.jpg')
+                        timings.append((time.perf_counter() - started) * 1000)
+                    query_count = len(queries)
+
+                timings.sort()
+                self.stdout.write(
+                    f"{duplicates:>8} {timings[len(timings) // 2]:>10.2f} {timings[-1]:>8.2f} {query_count:>8}"
+                )
+
+            # Throw away all benchmark data
+            transaction.set_rollback(True)
@@ -0,0 +1,44 @@
+# mapping/management/commands/build_tile_pyramids.py
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from mapping.models import BackgroundImage
+from mapping.tiles import generate_tile_archive
+
+
+class Command(BaseCommand):
+    """
+    Builds the deep zoom tile archive (see mapping/tiles.py) of background images
+    in this process. Uploads do not build tiles themselves: run this periodically
+    (e.g. every few minutes from cron) and it picks up the new images.
+
+    By default only images without tiles are processed, --all rebuilds every image.
+    Usage: python manage.py build_tile_pyramids [--all] [--slug SLUG ...]
+    """
+    help = "Build deep zoom tile archives for background images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Rebuild images that already have tiles too.")
+        parser.add_argument('--slug', nargs='+', default=None,
+                            help="Only process the images with these slugs.")
+
+    def handle(self, *args, **options):
+        images = BackgroundImage.objects.order_by('pk')
+        if options['slug']:
+            images = images.filter(slug__in=options['slug'])
+        if not options['all']:
+            images = images.filter(tiles_version=0)
+
+        built = 0
+        for image_id, slug in images.values_list('pk', 'slug'):
+            try:
+                version = generate_tile_archive(image_id)
+            except (OSError, ValueError, Image.DecompressionBombError) as error: # Missing, unreadable or too large
+                self.stderr.write(f"{slug}: {error}")
+                continue
+            built += 1
+            self.stdout.write(f"{slug}: tiles version {version}")
+
+        self.stdout.write(self.style.SUCCESS(f"Built tiles for {built} image(s)."))
@@ -0,0 +1,31 @@
+# mapping/management/commands/clear_stale_uploads.py
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mapping.chunked_uploads import delete_upload
+from mapping.models import ImageUpload
+
+
+class Command(BaseCommand):
+    """
+    Deletes chunked uploads (see mapping/chunked_uploads.py) that have not received
+    a chunk for --hours hours, together with their partial files.
+    Meant to run periodically, e.g. from cron.
+    Usage: python manage.py clear_stale_uploads --hours 48
+    """
+    help = "Delete abandoned chunked image uploads and their partial files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24,
+                            help="Uploads untouched for this many hours are deleted.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        deleted = 0
+        for upload in ImageUpload.objects.filter(updated_at__lt=cutoff).iterator():
+            delete_upload(upload)
+            deleted += 1
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} stale uploads."))
@@ -0,0 +1,62 @@
+# mapping/management/commands/dedupe_background_images.py
+
+from django.core.management.base import BaseCommand
+
+from mapping.models import BackgroundImage
+from mapping.uploads import hash_upload, read_image_info
+
+
+class Command(BaseCommand):
+    """
+    Fills content_hash, width, height and format of background images uploaded before
+    they were recorded (see mapping/uploads.py), and points images with identical
+    bytes at one shared file: the file of the oldest image with that hash.
+
+    With --delete, the duplicate files no image refers to any more are removed
+    from storage; without it they are only listed.
+    Usage: python manage.py dedupe_background_images --delete
+    """
+    help = "Hash existing background images and make identical ones share a single file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true',
+                            help="Delete duplicate files that are no longer referenced.")
+
+    def handle(self, *args, **options):
+        hashed = 0
+        for image in BackgroundImage.objects.filter(content_hash='').exclude(image='').order_by('pk').iterator():
+            try:
+                with image.image.open('rb') as image_file:
+                    image.content_hash = hash_upload(image_file)
+                    image.width, image.height, image.format = read_image_info(image_file)
+            except (OSError, ValueError) as error: # Missing file or not an image
+                self.stderr.write(f"Skipping {image.image.name}: {error}")
+                continue
+            image.save(update_fields=['content_hash', 'width', 'height', 'format'])
+            hashed += 1
+        self.stdout.write(f"Hashed {hashed} images.")
+
+        # One file per hash: the oldest image's
+        shared_names = {}
+        replaced_names = set()
+        repointed = []
+        for image in BackgroundImage.objects.exclude(content_hash='').order_by('pk').only('pk', 'image', 'content_hash'):
+            shared_name = shared_names.setdefault(image.content_hash, image.image.name)
+            if image.image.name != shared_name:
+                replaced_names.add(image.image.name)
+                image.image = shared_name
+                repointed.append(image)
+        BackgroundImage.objects.bulk_update(repointed, ['image'], batch_size=500)
+        self.stdout.write(f"Pointed {len(repointed)} images at a shared file.")
+
+        # Files still referenced by an image (one not hashed, say) are kept
+        unused_names = replaced_names - set(BackgroundImage.objects.values_list('image', flat=True))
+        storage = BackgroundImage._meta.get_field('image').storage
+        for name in sorted(unused_names):
+            if options['delete']:
+                storage.delete(name)
+                self.stdout.write(f"Deleted {name}")
+            else:
+                self.stdout.write(f"Unused duplicate: {name}")
+
+        self.stdout.write(self.style.SUCCESS(f"Done, {len(unused_names)} duplicate files {'deleted' if options['delete'] else 'found'}."))
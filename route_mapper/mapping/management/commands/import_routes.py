@@ -0,0 +1,84 @@
+# mapping/management/commands/import_routes.py
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from mapping.importers import (
+    FRAMES, IMPORT_CHUNK_SIZE, IMPORT_FORMATS, RouteImportError, guess_format, import_routes,
+)
+from mapping.models import BackgroundImage
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Imports routes from a GPX, GeoJSON or CSV file for one user on one background image
+    (the same importer as POST /api/routes/import/), printing progress as it goes.
+
+    Usage: python manage.py import_routes survey.gpx --user alice --image floor-plan
+           python manage.py import_routes points.csv --user alice --image floor-plan --frame pixels
+    """
+    help = "Bulk import routes from GPX, GeoJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import.")
+        parser.add_argument('--user', required=True, help="Username owning the new routes.")
+        parser.add_argument('--image', required=True, help="Slug of the background image.")
+        parser.add_argument('--format', dest='file_format', choices=IMPORT_FORMATS,
+                            help="File format (guessed from the extension by default).")
+        parser.add_argument('--frame', choices=FRAMES,
+                            help="How the file's coordinates map onto the image.")
+        parser.add_argument('--bounds',
+                            help="west,south,east,north of the image, for --frame bounds.")
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                            help="Points written per insert round.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['user']!r}.")
+        try:
+            background_image = BackgroundImage.objects.get(slug=options['image'])
+        except BackgroundImage.DoesNotExist:
+            raise CommandError(f"No background image {options['image']!r}.")
+
+        file_format = options['file_format'] or guess_format(options['path'])
+        if file_format is None:
+            raise CommandError("Cannot tell the format from the file name, use --format.")
+        bounds = None
+        if options['bounds']:
+            try:
+                bounds = tuple(float(part) for part in options['bounds'].split(','))
+            except ValueError:
+                bounds = ()
+            if len(bounds) != 4:
+                raise CommandError("--bounds must be four numbers: west,south,east,north.")
+
+        started = time.perf_counter()
+
+        def progress(routes, points):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"\r{routes} routes, {points} points ({points / max(elapsed, 1e-9):,.0f} points/s)", ending='')
+            self.stdout.flush()
+
+        try:
+            with open(options['path'], 'rb') as import_file:
+                routes = import_routes(
+                    import_file, file_format, user, background_image,
+                    frame=options['frame'], bounds=bounds,
+                    chunk_size=options['chunk_size'], progress=progress,
+                )
+        except (OSError, RouteImportError) as error:
+            raise CommandError(str(error))
+
+        points = sum(route.point_count for route in routes)
+        elapsed = time.perf_counter() - started
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {len(routes)} routes with {points} points in {elapsed:.2f}s "
+            f"({points / max(elapsed, 1e-9):,.0f} points/s)."
+        ))
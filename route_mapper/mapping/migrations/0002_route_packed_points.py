@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 11:06
+
+from django.db import migrations, models
+
+from mapping.geometry import flatten_points, pack_points
+
+
+def pack_existing_routes(apps, schema_editor):
+    """
+    Fills packed_points for routes that already have RoutePoint rows.
+    """
+    Route = apps.get_model('mapping', 'Route')
+    RoutePoint = apps.get_model('mapping', 'RoutePoint')
+    for route in Route.objects.all().iterator():
+        points = RoutePoint.objects.filter(route=route).order_by('order').values_list('x', 'y')
+        route.packed_points = pack_points(flatten_points(points))
+        route.save(update_fields=['packed_points'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapping', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='packed_points',
+            field=models.BinaryField(default=b'', help_text='All points of the route as little-endian float32 (x, y) pairs, in point order.'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Incremented on every change to the route's points."),
+        ),
+        migrations.RunPython(pack_existing_routes, migrations.RunPython.noop),
+    ]
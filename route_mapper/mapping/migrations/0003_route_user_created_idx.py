@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 11:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapping', '0002_route_packed_points'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['user', '-created_at', 'id'], name='route_user_created_idx'),
+        ),
+    ]
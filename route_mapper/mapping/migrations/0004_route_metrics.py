@@ -0,0 +1,64 @@
+# Generated by Django 5.2 on 2026-10-18 11:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapping', '0003_route_user_created_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backgroundimage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='backgroundimage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='length',
+            field=models.FloatField(default=0.0, editable=False, help_text='Polyline length in normalized (0.0 to 1.0) image units.'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='length_px',
+            field=models.FloatField(blank=True, editable=False, help_text='Polyline length in pixels of the background image (empty if its size is unknown).', null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='max_x',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='max_y',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='min_x',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='min_y',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='point_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['user', 'length'], name='route_user_length_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 11:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapping', '0004_route_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteSegmentCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cell_x', models.PositiveSmallIntegerField()),
+                ('cell_y', models.PositiveSmallIntegerField()),
+                ('background_image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mapping.backgroundimage')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segment_cells', to='mapping.route')),
+            ],
+            options={
+                'verbose_name': 'Route Segment Cell',
+                'verbose_name_plural': 'Route Segment Cells',
+                'indexes': [models.Index(fields=['background_image', 'cell_x', 'cell_y'], name='segment_cell_lookup_idx')],
+                'unique_together': {('route', 'cell_x', 'cell_y')},
+            },
+        ),
+    ]
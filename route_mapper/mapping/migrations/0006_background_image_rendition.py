@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 11:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapping', '0005_route_segment_cell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackgroundImageRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('thumbnail', 'Thumbnail'), ('medium', 'Medium'), ('full', 'Full size')], max_length=20)),
+                ('format', models.CharField(choices=[('webp', 'WebP'), ('jpeg', 'JPEG')], max_length=10)),
+                ('image', models.ImageField(upload_to='background_images/renditions/')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('background_image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='mapping.backgroundimage')),
+            ],
+            options={
+                'verbose_name': 'Background Image Rendition',
+                'verbose_name_plural': 'Background Image Renditions',
+                'unique_together': {('background_image', 'kind', 'format')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapping', '0006_background_image_rendition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backgroundimage',
+            name='tiles_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapping', '0007_background_image_tiles_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backgroundimage',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True, help_text='Timestamp of the last change to the route or its points.'),
+        ),
+    ]
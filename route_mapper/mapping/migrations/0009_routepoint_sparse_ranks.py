@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+from mapping.ranks import RANK_GAP
+
+# Temporary offset above every old and new rank, see spread_existing_orders
+LIFT = 2 ** 62
+
+
+def spread_existing_orders(apps, schema_editor):
+    """
+    Turns the dense orders 0, 1, 2, ... into ranks RANK_GAP, 2 * RANK_GAP, ...
+    In two UPDATEs through a range no rank uses, so unique_together ('route', 'order')
+    never sees two rows with the same value while the rows are rewritten one by one.
+    """
+    RoutePoint = apps.get_model('mapping', 'RoutePoint')
+    RoutePoint.objects.update(order=(models.F('order') + 1) * RANK_GAP + LIFT)
+    RoutePoint.objects.update(order=models.F('order') - LIFT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapping', '0008_last_modified_timestamps'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='routepoint',
+            name='order',
+            field=models.PositiveBigIntegerField(help_text='Sort key of the point within the route. Not contiguous: ranks are spaced apart so a point can be inserted between two others without renumbering.'),
+        ),
+        # Going back leaves the ranks as they are: still correctly ordered, just not dense
+        migrations.RunPython(spread_existing_orders, migrations.RunPython.noop),
+    ]
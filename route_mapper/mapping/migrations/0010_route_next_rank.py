@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 14:05
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+from mapping.ranks import RANK_GAP
+
+
+def start_after_existing_points(apps, schema_editor):
+    """
+    Sets next_rank one step above the highest rank of every route that has points.
+    """
+    Route = apps.get_model('mapping', 'Route')
+    RoutePoint = apps.get_model('mapping', 'RoutePoint')
+    highest_rank = RoutePoint.objects.filter(route=models.OuterRef('pk')).order_by('-order').values('order')[:1]
+    Route.objects.update(next_rank=Coalesce(models.Subquery(highest_rank), 0) + RANK_GAP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapping', '0009_routepoint_sparse_ranks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='next_rank',
+            field=models.PositiveBigIntegerField(default=65536, editable=False, help_text='Rank the next appended point gets (above the rank of every point of the route).'),
+        ),
+        migrations.RunPython(start_after_existing_points, migrations.RunPython.noop),
+    ]
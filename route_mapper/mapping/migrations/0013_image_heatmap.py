@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapping', '0012_image_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageHeatmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveSmallIntegerField(help_text='Cells per side of the grid.')),
+                ('grid', models.BinaryField()),
+                ('max_value', models.FloatField(default=0.0, editable=False)),
+                ('route_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('routes_state', models.CharField(editable=False, help_text="State of the image's routes the grid was built from (count, versions, last change).", max_length=100)),
+                ('built_at', models.DateTimeField(auto_now=True)),
+                ('background_image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='heatmaps', to='mapping.backgroundimage')),
+            ],
+            options={
+                'verbose_name': 'Image Heatmap',
+                'verbose_name_plural': 'Image Heatmaps',
+                'unique_together': {('background_image', 'resolution')},
+            },
+        ),
+    ]
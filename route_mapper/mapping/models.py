@@ -1,12 +1,82 @@
-from django.db import models
+from django.db import connections, models
+from django.utils import timezone
+from itertools import count, repeat
 from django.conf import settings # Recommended way to get the user model
+from django.core.cache import cache
 from django.utils.text import slugify
 import uuid # To help ensure unique slugs if needed, though simple counter is often enough
 
+from django.core.files.images import get_image_dimensions
+import random
+
+from .slugs import save_with_unique_slug
+from .geometry import flatten_points, measure_points, pack_points, splice_metrics, unpack_points
+from .ranks import RANK_GAP, ranks_between, spaced_ranks
+
 # Get the currently active User model
 # This is preferred over importing django.contrib.auth.models.User directly
 User = settings.AUTH_USER_MODEL
 
+class BackgroundImageManager(models.Manager):
+    """
+    Manager for BackgroundImage with a random sampler that does not load the whole table.
+    """
+
+    # Rounds of random id guesses before falling back to a contiguous block of ids
+    SAMPLE_ATTEMPTS = 3
+
+    def random_sample(self, k, queryset=None):
+        """
+        Returns up to k distinct random images, in random order.
+
+        Instead of loading every row and shuffling in Python, random ids are picked
+        between the lowest and highest id and fetched with one "id IN (...)" query per
+        round, so only about k rows are ever read. Ids freed by deleted images simply
+        miss and are guessed again (twice as many guesses as needed per round). If the
+        table is very sparse, the remaining images are taken from the first ids after
+        a random starting point.
+        `queryset` can add select_related / prefetch_related to the fetched rows.
+        """
+        queryset = self.get_queryset() if queryset is None else queryset
+        bounds = self.aggregate(low=models.Min('pk'), high=models.Max('pk'))
+        if bounds['low'] is None or k <= 0:
+            return []
+        low, high = bounds['low'], bounds['high']
+
+        chosen = {}
+        tried = set()
+        for _ in range(self.SAMPLE_ATTEMPTS):
+            needed = k - len(chosen)
+            untried = (high - low + 1) - len(tried)
+            if needed <= 0 or untried <= 0:
+                break
+            guesses = set()
+            while len(guesses) < min(2 * needed, untried):
+                guess = random.randint(low, high)
+                if guess not in tried:
+                    guesses.add(guess)
+            tried.update(guesses)
+            for image in queryset.filter(pk__in=guesses):
+                if len(chosen) < k:
+                    chosen[image.pk] = image
+
+        needed = k - len(chosen)
+        if needed > 0 and len(tried) < high - low + 1:
+            # Still short: the id range is mostly gaps. Take the next ids after a random
+            # start (an index range scan), wrapping around to the beginning if needed.
+            start = random.randint(low, high)
+            rest = queryset.exclude(pk__in=chosen.keys())
+            block = list(rest.filter(pk__gte=start).order_by('pk')[:needed])
+            if len(block) < needed:
+                block += list(rest.filter(pk__lt=start).order_by('pk')[:needed - len(block)])
+            for image in block:
+                chosen[image.pk] = image
+
+        images = list(chosen.values())
+        random.shuffle(images)
+        return images
+
+
 class BackgroundImage(models.Model):
     """
     Represents a background image (map, floor plan, etc.) that routes can be drawn on.
@@ -44,6 +114,19 @@ class BackgroundImage(models.Model):
         related_name='uploaded_images', # Access images uploaded by a user via user.uploaded_images.all()
         help_text="The user who uploaded this image (optional)."
     )
+    # Pixel size of the image, read once on save so route metrics never open the file
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # Pillow format name (JPEG, PNG, ...) and SHA-256 of the file, set on upload (see mapping/uploads.py);
+    # images with the same content_hash share one stored file
+    format = models.CharField(max_length=10, blank=True, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    # Bumped when the image or its renditions / tiles change (embedded in route API responses)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Current version of the deep zoom tile archive (see mapping/tiles.py), 0 = not built yet
+    tiles_version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = BackgroundImageManager()
 
     class Meta:
         verbose_name = "Background Image"
@@ -58,24 +141,137 @@ class BackgroundImage(models.Model):
         """
         Auto-generates a unique slug from the name before saving.
         """
-        if not self.slug: # Generate slug only if it's not already set
-            base_slug = slugify(self.name)
-            slug = base_slug
-            counter = 1
-            # Check for uniqueness
-            while BackgroundImage.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
-
         # Optional: If the name changes after the slug is set, you might want to regenerate
         # or update the slug. This adds complexity (e.g., breaking old URLs).
         # For now, let's assume the slug is generated only on initial creation.
         # If you need slug updates based on name changes, the logic would be more complex
         # and involve checking if self.pk is not None and comparing original name vs current name.
 
+        if self.width is None and self.image:
+            self.read_dimensions()
+
+        if not self.slug: # Generate slug only if it's not already set
+            # Picks the next free base-N with one query and retries if a
+            # concurrent upload took the same slug first (see mapping/slugs.py)
+            save_with_unique_slug(self, slugify(self.name), lambda: super(BackgroundImage, self).save(*args, **kwargs))
+            return
         super().save(*args, **kwargs)
 
+    @property
+    def webp_srcset(self):
+        """srcset attribute value listing the WebP renditions (see BackgroundImageRendition)."""
+        return self._rendition_srcset('webp')
+
+    @property
+    def jpeg_srcset(self):
+        """srcset attribute value listing the JPEG renditions."""
+        return self._rendition_srcset('jpeg')
+
+    def _rendition_srcset(self, image_format):
+        # Iterates renditions.all() so a prefetch_related('renditions') is reused
+        renditions = sorted(
+            (r for r in self.renditions.all() if r.format == image_format and r.image),
+            key=lambda r: r.width,
+        )
+        return ', '.join(f'{r.image.url} {r.width}w' for r in renditions)
+
+    def read_dimensions(self):
+        """
+        Reads the pixel width and height from the image header.
+        Leaves them empty if the file is missing or not a readable image.
+        """
+        try:
+            self.width, self.height = get_image_dimensions(self.image)
+        except (OSError, ValueError):
+            self.width = self.height = None
+
+
+class BackgroundImageRendition(models.Model):
+    """
+    A resized copy of a BackgroundImage in one size (kind) and format,
+    generated in the background after upload (see mapping/renditions.py).
+    """
+    KIND_CHOICES = [
+        ('thumbnail', 'Thumbnail'),
+        ('medium', 'Medium'),
+        ('full', 'Full size'),
+    ]
+    FORMAT_CHOICES = [
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+    ]
+
+    background_image = models.ForeignKey(
+        BackgroundImage,
+        on_delete=models.CASCADE,
+        related_name='renditions', # Access via background_image.renditions.all()
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    image = models.ImageField(upload_to='background_images/renditions/')
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = "Background Image Rendition"
+        verbose_name_plural = "Background Image Renditions"
+        unique_together = ('background_image', 'kind', 'format')
+
+    def __str__(self):
+        return f"{self.background_image.name} ({self.kind}, {self.format}, {self.width}x{self.height})"
+
+
+class ImageUpload(models.Model):
+    """
+    A background image being uploaded in chunks (see mapping/chunked_uploads.py).
+    The chunks are appended to a partial file in storage; `offset` is how many bytes
+    of it have arrived, so an interrupted upload continues from there. Finalizing it
+    creates the BackgroundImage and deletes this row.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='image_uploads')
+    # Fields of the BackgroundImage created when the upload is finalized
+    name = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    filename = models.CharField(max_length=255, help_text="Name of the file on the user's computer.")
+    size = models.PositiveBigIntegerField(help_text="Total size of the file in bytes.")
+    offset = models.PositiveBigIntegerField(default=0, editable=False, help_text="Bytes received so far.")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Image Upload"
+        verbose_name_plural = "Image Uploads"
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size} bytes)"
+
+    @property
+    def partial_name(self):
+        """Storage name of the file the chunks are appended to."""
+        return f'uploads/partial/{self.pk}.part'
+
+
+class RouteQuerySet(models.QuerySet):
+    """
+    QuerySet for Route with a cheap change marker of a set of routes.
+    """
+
+    def state(self):
+        """
+        State of these routes as a string, from one aggregate query: point writes
+        bump a route's version and last_modified, route edits (like moving it to
+        another image) its last_modified, and adding or deleting a route changes
+        the count. Used to key caches of data built from the routes.
+        """
+        state = self.aggregate(
+            count=models.Count('pk'),
+            versions=models.Sum('version'),
+            modified=models.Max('last_modified'),
+        )
+        modified = state['modified'].timestamp() if state['modified'] else 0
+        return f"{state['count']}-{state['versions'] or 0}-{modified}"
+
 
 class Route(models.Model):
     """
@@ -107,17 +303,286 @@ class Route(models.Model):
         auto_now_add=True,
         help_text="Timestamp when the route was created."
     )
-    # Optional: Add last_modified field auto_now=True
+    last_modified = models.DateTimeField(
+        auto_now=True,
+        help_text="Timestamp of the last change to the route or its points."
+        # Used with 'version' for the API's ETag / Last-Modified headers (see mapping/conditional.py)
+    )
+    packed_points = models.BinaryField(
+        default=b'',
+        editable=False,
+        help_text="All points of the route as little-endian float32 (x, y) pairs, in point order."
+        # Kept in sync with the RoutePoint rows by the API write paths (see mapping/geometry.py)
+    )
+    version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Incremented on every change to the route's points."
+    )
+    next_rank = models.PositiveBigIntegerField(
+        default=RANK_GAP,
+        editable=False,
+        help_text="Rank the next appended point gets (above the rank of every point of the route)."
+        # Moved forward with a single UPDATE ... SET next_rank = next_rank + n, see RoutePointViewSet.reserve_ranks
+    )
+
+    # Denormalized metrics, maintained together with packed_points (see _save_packed_points)
+    point_count = models.PositiveIntegerField(default=0, editable=False)
+    length = models.FloatField(
+        default=0.0,
+        editable=False,
+        help_text="Polyline length in normalized (0.0 to 1.0) image units."
+    )
+    length_px = models.FloatField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Polyline length in pixels of the background image (empty if its size is unknown)."
+    )
+    min_x = models.FloatField(null=True, blank=True, editable=False)
+    min_y = models.FloatField(null=True, blank=True, editable=False)
+    max_x = models.FloatField(null=True, blank=True, editable=False)
+    max_y = models.FloatField(null=True, blank=True, editable=False)
+
+    METRIC_FIELDS = ['point_count', 'length', 'length_px', 'min_x', 'min_y', 'max_x', 'max_y']
+
+    objects = RouteQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Route"
         verbose_name_plural = "Routes"
+        indexes = [
+            # Serves the per-user route list and its cursor pagination (newest first)
+            models.Index(fields=['user', '-created_at', 'id'], name='route_user_created_idx'),
+            # Sorting / filtering a user's routes by length
+            models.Index(fields=['user', 'length'], name='route_user_length_idx'),
+        ]
         # Optional: Add unique_together = ('user', 'name') if route names must be unique per user
         # ordering = ['-created_at'] # Default order by creation date
 
     def __str__(self):
         return f"{self.name} (by {self.user.username})"
 
+    # --- Packed geometry maintenance ---
+    # The methods below expect the route row to be locked (select_for_update) inside
+    # a transaction, since they read, modify and write back the whole blob.
+    # Positions in the packed array are the points' dense positions (their index
+    # when sorted by 'order'), as shown by the API.
+
+    def append_packed_points(self, points):
+        """
+        Appends (x, y) pairs to the end of the packed geometry.
+        The metrics are extended from the previous last point only.
+        """
+        coords = unpack_points(self.packed_points)
+        new_coords = flatten_points(points)
+        # The previous last point (if any) starts the first new segment
+        metrics = measure_points(
+            coords[-2:] + new_coords, *self.image_size(), previous=self.get_metrics()
+        )
+        new_segments = coords[-2:] + new_coords
+        coords.extend(new_coords)
+        self._save_packed_points(coords, metrics)
+        self.update_segment_cells(new_segments, appended=True)
+
+    def splice_packed_points(self, start, stop, points=()):
+        """
+        Replaces the points at positions start..stop-1 with the given (x, y) pairs
+        (pass no points to just remove them).
+        Only the changed bytes of the blob are replaced, and the metrics and the
+        segment cells are adjusted from the segments around the splice (the point
+        before it to the point after it) instead of being rebuilt for the whole route.
+        """
+        blob = bytes(self.packed_points)
+        added = flatten_points(points)
+        first = max(start - 1, 0) * 8 # Byte offsets: 8 bytes (two float32) per point
+        last = min((stop + 1) * 8, len(blob))
+        old_part = unpack_points(blob[first:last])
+        new_blob = blob[:start * 8] + pack_points(added) + blob[stop * 8:]
+        new_part = unpack_points(new_blob[first:last + (len(new_blob) - len(blob))])
+
+        coords = unpack_points(new_blob)
+        metrics = splice_metrics(
+            self.get_metrics(), coords, start, stop, added, old_part, new_part, *self.image_size()
+        )
+        self._save_packed_points(coords, metrics, packed=new_blob)
+        self.splice_segment_cells(coords, old_part, new_part)
+
+    def rebuild_packed_points(self):
+        """
+        Rebuilds the packed geometry from the RoutePoint rows
+        (without creating a model instance per point).
+        """
+        coords = flatten_points(self.points.order_by('order').values_list('x', 'y'))
+        self._save_packed_points(coords)
+        self.update_segment_cells(coords)
+
+    def update_segment_cells(self, coords, appended=False):
+        """
+        Updates the route's entries in the spatial grid index (RouteSegmentCell).
+        With appended=True, coords are only the new segments (starting at the previous
+        last point) and their cells are added; otherwise coords is the whole route and
+        its cells are replaced.
+        """
+        # Imported here so NumPy is only loaded when the spatial helpers are actually used
+        from .spatial import polyline_cells
+
+        if not appended:
+            self.segment_cells.all().delete()
+        RouteSegmentCell.objects.bulk_create(
+            [
+                RouteSegmentCell(route=self, background_image_id=self.background_image_id, cell_x=cell_x, cell_y=cell_y)
+                for cell_x, cell_y in polyline_cells(coords)
+            ],
+            ignore_conflicts=appended, # Cells the route already covers are kept as they are
+        )
+
+    def splice_segment_cells(self, coords, old_part, new_part):
+        """
+        Updates the spatial grid index after a splice: adds the cells of the new
+        segments around it, and deletes the cells only the replaced segments covered
+        (those still crossed by another segment of `coords`, the whole new route, stay).
+        """
+        # Imported here so NumPy is only loaded when the spatial helpers are actually used
+        from .spatial import covered_cells, polyline_cells
+
+        old_cells = polyline_cells(old_part)
+        new_cells = polyline_cells(new_part)
+        gone = old_cells - new_cells
+        gone -= covered_cells(coords, gone)
+        if gone:
+            cell_filter = models.Q()
+            for cell_x, cell_y in gone:
+                cell_filter |= models.Q(cell_x=cell_x, cell_y=cell_y)
+            self.segment_cells.filter(cell_filter).delete()
+        if new_cells - old_cells:
+            RouteSegmentCell.objects.bulk_create(
+                [
+                    RouteSegmentCell(route=self, background_image_id=self.background_image_id, cell_x=cell_x, cell_y=cell_y)
+                    for cell_x, cell_y in new_cells - old_cells
+                ],
+                ignore_conflicts=True, # Other segments of the route may already cover them
+            )
+
+    def image_size(self):
+        """
+        Returns (width, height) of the background image in pixels, (None, None) if unknown.
+        """
+        return self.background_image.width, self.background_image.height
+
+    def get_metrics(self):
+        return {field: getattr(self, field) for field in self.METRIC_FIELDS}
+
+    def simplified_points(self, tolerance=None, max_points=None):
+        """
+        Returns a reduced version of the route as a list of {"order", "x", "y"} dicts,
+        computed from the packed geometry (see mapping/simplification.py).
+        The kept indices are cached per (route version, tolerance, max_points), so a
+        changed route is simply recomputed under its new version.
+        """
+        # Imported here so NumPy is only loaded when simplification is actually used
+        from .simplification import coords_array, simplify_indices
+
+        xy = coords_array(self.packed_points)
+        cache_key = f'route-simplified:{self.pk}:{self.version}:{tolerance}:{max_points}'
+        kept = cache.get(cache_key)
+        if kept is None:
+            kept = simplify_indices(xy, tolerance=tolerance, max_points=max_points)
+            cache.set(cache_key, kept, timeout=60 * 60)
+
+        # Coordinates are stored as float32, rounding keeps the JSON short
+        return [
+            {'order': index, 'x': round(float(xy[index, 0]), 7), 'y': round(float(xy[index, 1]), 7)}
+            for index in kept
+        ]
+
+    def _save_packed_points(self, coords, metrics=None, packed=None):
+        """
+        Stores the new geometry (`packed` if it is already packed) together with its
+        metrics (recomputed from the coordinates unless already given) and bumps the version.
+        """
+        if metrics is None:
+            metrics = measure_points(coords, *self.image_size())
+        for field, value in metrics.items():
+            setattr(self, field, value)
+        self.packed_points = pack_points(coords) if packed is None else packed
+        self.version += 1
+        self.save(update_fields=['packed_points', 'version', 'last_modified', *self.METRIC_FIELDS])
+
+
+class RoutePointManager(models.Manager):
+    """
+    Manager for RoutePoint with set-based helpers for the sparse 'order' ranks
+    (see mapping/ranks.py).
+    """
+
+    def rank_at(self, route_id, position):
+        """
+        Returns a free rank for a new point at `position` of the route (before the
+        point now there), or None if the position is at or past the end (appending
+        takes a rank from Route.next_rank instead). Reads at most two neighbours;
+        if they have no room between them, the route is respaced first.
+        """
+        ranks = self.filter(route_id=route_id).order_by('order').values_list('order', flat=True)
+        neighbours = list(ranks[max(position - 1, 0):position + 1])
+        if position == 0:
+            neighbours.insert(0, None)
+        if len(neighbours) < 2: # Nothing at that position
+            return None
+        low, high = neighbours
+        between = ranks_between(low, high, 1)
+        if between is None:
+            self.respace(route_id)
+            return self.rank_at(route_id, position)
+        return between[0]
+
+    def respace(self, route_id):
+        """
+        Spreads the ranks of the route's points out evenly again (RANK_GAP apart),
+        keeping their order.
+
+        The new ranks cannot simply be written one by one with unique_together =
+        ('route', 'order'): a row could collide with a neighbour that has not been
+        moved yet. So all rows are first lifted above every old and new rank (where
+        nothing can collide), then written with their final ranks.
+        """
+        points = list(self.filter(route_id=route_id).order_by('order').only('id', 'order'))
+        if not points:
+            return
+        new_ranks = spaced_ranks(len(points))
+        offset = max(points[-1].order, new_ranks[-1]) + 1
+        self.filter(route_id=route_id).update(order=models.F('order') + offset)
+        for point, rank in zip(points, new_ranks):
+            point.order = rank
+        self.bulk_update(points, ['order'])
+        # Appends must still get ranks above all of these
+        Route.objects.filter(pk=route_id, next_rank__lte=new_ranks[-1]).update(next_rank=new_ranks[-1] + RANK_GAP)
+
+    def insert_points(self, route_id, xs, ys, first_rank=RANK_GAP):
+        """
+        Inserts the points (xs[i], ys[i]) with ranks first_rank, first_rank + RANK_GAP, ...
+        with a single executemany(). bulk_create builds and prepares a model instance
+        per row, which limits it to a few ten thousand points per second; this is for
+        bulk imports (see mapping/importers.py) where that is the bottleneck.
+        """
+        connection = connections[self.db]
+        meta = self.model._meta
+        quote = connection.ops.quote_name
+        columns = [meta.get_field(name).column for name in ('route', 'x', 'y', 'order', 'created_at')]
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(meta.db_table), ', '.join(quote(column) for column in columns), ', '.join(['%s'] * len(columns))
+        )
+        created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        rows = list(zip(repeat(route_id), xs, ys, count(first_rank, RANK_GAP), repeat(created_at)))
+        if not rows:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        # Keep Route.next_rank above the new points, for later appends
+        last_rank = rows[-1][3]
+        Route.objects.using(self.db).filter(pk=route_id, next_rank__lte=last_rank).update(next_rank=last_rank + RANK_GAP)
+        return len(rows)
+
 
 class RoutePoint(models.Model):
     """
@@ -136,24 +601,89 @@ class RoutePoint(models.Model):
     y = models.FloatField(
         help_text="Y coordinate as a fraction (0.0 to 1.0) of the image height."
     )
-    order = models.PositiveIntegerField(
-        help_text="The sequential order of this point within the route (starts from 0 or 1)."
-        # Note: The order needs to be managed manually (or via a library)
-        # during creation, deletion, and reordering in views/serializers.
+    order = models.PositiveBigIntegerField(
+        help_text="Sort key of the point within the route. Not contiguous: ranks are spaced "
+                  "apart so a point can be inserted between two others without renumbering."
+        # See mapping/ranks.py. The API shows the point's dense position instead.
     )
     created_at = models.DateTimeField(
         auto_now_add=True,
         help_text="Timestamp when the point was created."
     )
 
+    objects = RoutePointManager()
+
     class Meta:
         verbose_name = "Route Point"
         verbose_name_plural = "Route Points"
         # Ensure points are always retrieved in their defined order
         ordering = ['order']
-        # Prevent duplicate order numbers within the same route
+        # Prevent duplicate ranks within the same route
         unique_together = ('route', 'order')
 
 
     def __str__(self):
-        return f"Point {self.order} on Route '{self.route.name}' ({self.x:.2f}, {self.y:.2f})"
\ No newline at end of file
+        return f"Point {self.order} on Route '{self.route.name}' ({self.x:.2f}, {self.y:.2f})"
+
+
+class RouteSegmentCell(models.Model):
+    """
+    Spatial grid index entry: the route has at least one segment passing through
+    grid cell (cell_x, cell_y) of its background image (see mapping/spatial.py).
+    Maintained together with Route.packed_points.
+    """
+    background_image = models.ForeignKey(
+        BackgroundImage,
+        on_delete=models.CASCADE,
+        related_name='+', # Copy of route.background_image, only here so the index can be keyed by image
+    )
+    route = models.ForeignKey(
+        Route,
+        on_delete=models.CASCADE,
+        related_name='segment_cells',
+    )
+    cell_x = models.PositiveSmallIntegerField()
+    cell_y = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name = "Route Segment Cell"
+        verbose_name_plural = "Route Segment Cells"
+        unique_together = ('route', 'cell_x', 'cell_y')
+        indexes = [
+            models.Index(fields=['background_image', 'cell_x', 'cell_y'], name='segment_cell_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"Cell ({self.cell_x}, {self.cell_y}) of Route {self.route_id}"
+
+
+class ImageHeatmap(models.Model):
+    """
+    Route density grid of a background image at one resolution, over the routes of
+    all users (see mapping/heatmaps.py). `grid` holds resolution x resolution
+    little-endian float32 cells, row by row from the top of the image; each cell is
+    about how many times routes pass through it. Rebuilt on demand when routes_state
+    no longer matches the image's routes (the grid is dirty).
+    """
+    background_image = models.ForeignKey(
+        BackgroundImage,
+        on_delete=models.CASCADE,
+        related_name='heatmaps',
+    )
+    resolution = models.PositiveSmallIntegerField(help_text="Cells per side of the grid.")
+    grid = models.BinaryField(editable=False)
+    max_value = models.FloatField(default=0.0, editable=False)
+    route_count = models.PositiveIntegerField(default=0, editable=False)
+    routes_state = models.CharField(
+        max_length=100, editable=False,
+        help_text="State of the image's routes the grid was built from (count, versions, last change).",
+    )
+    built_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Image Heatmap"
+        verbose_name_plural = "Image Heatmaps"
+        unique_together = ('background_image', 'resolution')
+
+    def __str__(self):
+        return f"Heatmap {self.resolution}x{self.resolution} of {self.background_image}"
@@ -0,0 +1,16 @@
+# mapping/pagination.py
+
+from rest_framework.pagination import CursorPagination
+
+
+class RouteCursorPagination(CursorPagination):
+    """
+    Keyset (cursor) pagination for route lists, newest first.
+    Pages are located by created_at (ties broken by id), backed by the
+    (user, -created_at, id) index on Route, so deep pages cost the same as the first one
+    and there is no COUNT(*) query.
+    """
+    ordering = ('-created_at', 'id')
+    page_size = 50
+    page_size_query_param = 'page_size' # Clients can ask for ?page_size=...
+    max_page_size = 200
@@ -0,0 +1,91 @@
+# mapping/ranks.py
+"""
+Sort keys ("ranks") for the points of a route.
+
+RoutePoint.order is not a dense 0, 1, 2, ... sequence but a sparse integer key: new
+points are given ranks RANK_GAP apart, which leaves room to put a point between two
+neighbours by giving it a rank in between. Inserting, deleting or moving a point
+therefore writes only that point's row, not every point after it. Appended points
+take their ranks from the route's next_rank counter, which is kept above every rank
+of the route.
+
+When two neighbours end up with adjacent ranks (after about log2(RANK_GAP) inserts at
+the same spot) there is no room left between them and the route's ranks are spread
+out again (respaced) once. The API never shows ranks: it exposes every point's dense
+position in the route (0 .. point count - 1), computed when reading.
+"""
+
+from bisect import bisect_left
+
+# Distance between the ranks of consecutive points after a respacing / when appending
+RANK_GAP = 2 ** 16
+
+
+def spaced_ranks(count):
+    """Evenly spaced ranks for `count` points (the result of a respacing)."""
+    return [RANK_GAP * (position + 1) for position in range(count)]
+
+
+def ranks_between(low, high, count):
+    """
+    Returns `count` increasing ranks strictly between low and high (None for "no
+    neighbour on that side"), spread evenly, or None if there is not enough room.
+    """
+    if high is None:
+        start = 0 if low is None else low
+        return [start + RANK_GAP * (position + 1) for position in range(count)]
+    low = -1 if low is None else low # Rank 0 is still free before the first point
+    if high - low <= count:
+        return None
+    return [low + (high - low) * (position + 1) // (count + 1) for position in range(count)]
+
+
+def _longest_increasing(values):
+    """Positions of one longest strictly increasing subsequence of `values` (None entries skipped)."""
+    tails = [] # tails[k]: smallest last value of an increasing run of length k + 1
+    tail_positions = []
+    previous = {}
+    for position, value in enumerate(values):
+        if value is None:
+            continue
+        k = bisect_left(tails, value)
+        previous[position] = tail_positions[k - 1] if k else None
+        if k == len(tails):
+            tails.append(value)
+            tail_positions.append(position)
+        else:
+            tails[k] = value
+            tail_positions[k] = position
+    kept = set()
+    position = tail_positions[-1] if tail_positions else None
+    while position is not None:
+        kept.add(position)
+        position = previous[position]
+    return kept
+
+
+def assign_ranks(ranks):
+    """
+    Given the current rank of every point in its new position (None for new points),
+    returns the new ranks. As many points as possible keep their rank (a longest
+    increasing run of them); the others get ranks between their kept neighbours.
+    Returns None if some gap is too small, then the route needs respacing.
+    """
+    kept = _longest_increasing(ranks)
+    result = [rank if position in kept else None for position, rank in enumerate(ranks)]
+    position = 0
+    while position < len(result):
+        if result[position] is not None:
+            position += 1
+            continue
+        run_end = position
+        while run_end < len(result) and result[run_end] is None:
+            run_end += 1
+        low = result[position - 1] if position else None
+        high = result[run_end] if run_end < len(result) else None
+        filled = ranks_between(low, high, run_end - position)
+        if filled is None:
+            return None
+        result[position:run_end] = filled
+        position = run_end
+    return result
@@ -0,0 +1,110 @@
+# mapping/renderers.py
+"""
+Renderers of the compact point encodings (see mapping/encodings.py) and the
+viewset mixin that offers them on the route and point endpoints.
+
+A client picks an encoding with the Accept header or with ?format=:
+
+    Accept: application/vnd.route-mapper.columnar+json   (?format=columnar)
+    Accept: application/vnd.route-mapper.polyline+json   (?format=polyline)
+    Accept: application/msgpack                          (?format=msgpack)
+
+The views build those responses from the coordinates directly, the renderers
+only write them out. MessagePack needs the optional msgpack package; without it
+that format is simply not offered. The image heatmap endpoint additionally
+answers as a PNG overlay (Accept: image/png, ?format=png).
+"""
+
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .formats import COMPACT_ENCODINGS
+from .serializers import EncodingParamsSerializer
+
+try:
+    import msgpack
+except ImportError: # Optional dependency
+    msgpack = None
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.route-mapper.columnar+json'
+    format = 'columnar'
+
+
+class PolylineJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.route-mapper.polyline+json'
+    format = 'polyline'
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # default=str covers the odd non-msgpack value (e.g. lazy translation strings in errors)
+        return msgpack.packb(data, default=str)
+
+
+class PNGRenderer(BaseRenderer):
+    """
+    Writes out PNG bytes built by the view (the heatmap overlay). Anything else,
+    i.e. an error response, is rendered as JSON.
+    """
+    media_type = 'image/png'
+    format = 'png'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return JSONRenderer().render(data)
+
+
+COMPACT_RENDERERS = [ColumnarJSONRenderer, PolylineJSONRenderer]
+# The heatmap (see mapping/heatmaps.py): its grid as JSON or MessagePack, or a PNG overlay
+HEATMAP_RENDERERS = [JSONRenderer, PNGRenderer]
+if msgpack is not None:
+    COMPACT_RENDERERS.append(MessagePackRenderer)
+    HEATMAP_RENDERERS.append(MessagePackRenderer)
+
+
+class CompactEncodingMixin:
+    """
+    Offers the compact renderers, on top of the viewset's usual ones, for the
+    actions listed in `compact_actions`. The view checks compact_encoding() and,
+    when one was negotiated, builds the response with mapping/encodings.py
+    instead of the serializer.
+    """
+    compact_actions = ('list', 'retrieve')
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.action in self.compact_actions:
+            renderers += [renderer() for renderer in COMPACT_RENDERERS]
+        return renderers
+
+    def compact_encoding(self):
+        """The negotiated compact encoding ('columnar', 'polyline', 'msgpack') or None."""
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        return renderer.format if renderer is not None and renderer.format in COMPACT_ENCODINGS else None
+
+    def get_polyline_precision(self):
+        params = EncodingParamsSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        return params.validated_data['precision']
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.action in self.compact_actions:
+            # The same URL has a different body per Accept header
+            patch_vary_headers(response, ['Accept'])
+        return response
@@ -0,0 +1,149 @@
+# mapping/renditions.py
+"""
+Resized copies (renditions) of uploaded background images.
+
+After an upload is committed, schedule_renditions() hands the image to a background
+worker thread, which writes a thumbnail, a medium and a full-size version in both
+WebP and JPEG (BackgroundImageRendition rows). The upload request itself never waits
+for the resizing. There is a single worker, so a web process decodes at most one
+full-size scan at a time. (Tile pyramids are far bigger jobs and are built by the
+build_tile_pyramids command instead, see mapping/tiles.py.)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import logging
+import warnings
+
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels of each rendition kind (None keeps the original size)
+RENDITION_SIZES = {
+    'thumbnail': 320,
+    'medium': 1280,
+    'full': None,
+}
+
+# Pillow format name and file extension of each output format
+RENDITION_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+RENDITION_QUALITY = 82
+
+# WebP cannot store a side longer than this, so a larger source gets a WebP 'full'
+# rendition scaled down to fit (the JPEG one keeps the original size)
+WEBP_MAX_SIDE = 16383
+
+# Floor plan scans go up to about 20k x 15k pixels, which is above Pillow's decompression
+# bomb warning threshold (about 179M pixels, the error comes at twice that). The size is
+# checked from the header in open_source_image(), Pillow's global limit is left alone.
+MAX_SOURCE_PIXELS = 20000 * 15000
+
+_executor = None
+
+
+def get_executor():
+    """
+    Returns the shared worker, created on first use (one thread: every job decodes a
+    whole image, two at once could take gigabytes for large scans).
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='renditions')
+    return _executor
+
+
+def schedule_after_commit(job, background_image):
+    """
+    Queues job(image_id) on the worker once the current transaction commits
+    (so the worker can see the saved row and file).
+    """
+    image_id = background_image.pk
+    transaction.on_commit(lambda: get_executor().submit(_run_in_worker, job, image_id))
+
+
+def schedule_renditions(background_image):
+    """
+    Queues rendition generation for the image once the current transaction commits.
+    """
+    schedule_after_commit(generate_renditions, background_image)
+
+
+def _run_in_worker(job, image_id):
+    # Worker threads get their own DB connection, close it when done
+    close_old_connections()
+    try:
+        job(image_id)
+    except Exception:
+        logger.exception("%s for background image %s failed", job.__name__, image_id)
+    finally:
+        close_old_connections()
+
+
+def open_source_image(background_image):
+    """
+    Decodes the image's file, turned upright (camera orientation). An image above
+    MAX_SOURCE_PIXELS is refused with ValueError from its header, before decoding.
+    """
+    with background_image.image.open('rb') as image_file:
+        with warnings.catch_warnings():
+            # Large scans are expected here, the size is checked below
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            source = Image.open(image_file) # Reads the header only
+            if source.width * source.height > MAX_SOURCE_PIXELS:
+                raise ValueError(
+                    f"{source.width}x{source.height} pixels is above the limit of {MAX_SOURCE_PIXELS} pixels"
+                )
+            source.load()
+    return ImageOps.exif_transpose(source)
+
+
+def generate_renditions(image_id):
+    """
+    Creates (or replaces) all renditions of one background image.
+    Returns the list of created BackgroundImageRendition objects.
+    """
+    from .models import BackgroundImage, BackgroundImageRendition
+
+    background_image = BackgroundImage.objects.get(pk=image_id)
+    source = open_source_image(background_image)
+    if source.mode not in ('RGB', 'RGBA'):
+        source = source.convert('RGBA' if 'transparency' in source.info else 'RGB')
+
+    renditions = []
+    for kind, max_side in RENDITION_SIZES.items():
+        resized = source.copy()
+        if max_side is not None:
+            resized.thumbnail((max_side, max_side), Image.LANCZOS) # Only ever shrinks
+        for image_format, (pil_format, extension) in RENDITION_FORMATS.items():
+            output = resized.convert('RGB') if pil_format == 'JPEG' else resized
+            if pil_format == 'WEBP' and max(output.size) > WEBP_MAX_SIDE:
+                output = output.copy()
+                output.thumbnail((WEBP_MAX_SIDE, WEBP_MAX_SIDE), Image.LANCZOS)
+            buffer = BytesIO()
+            output.save(buffer, pil_format, quality=RENDITION_QUALITY)
+
+            rendition, _ = BackgroundImageRendition.objects.update_or_create(
+                background_image=background_image,
+                kind=kind,
+                format=image_format,
+                defaults={'width': output.width, 'height': output.height},
+            )
+            # Regenerating: drop the old file first, so it is not orphaned and the
+            # new one gets the same name instead of a suffixed one
+            if rendition.image:
+                rendition.image.delete(save=False)
+            rendition.image.save(
+                f'{background_image.slug}_{kind}.{extension}', ContentFile(buffer.getvalue()), save=True
+            )
+            renditions.append(rendition)
+    # The renditions are part of the image's API representation
+    BackgroundImage.objects.filter(pk=image_id).update(updated_at=timezone.now())
+    return renditions
@@ -0,0 +1,10 @@
+# mapping/routing.py (WebSocket URLs, served by route_mapper/asgi.py)
+
+from django.urls import re_path
+
+from . import consumers
+
+websocket_urlpatterns = [
+    # Live point changes of one route (see mapping/live.py)
+    re_path(r'^ws/routes/(?P<route_id>\d+)/$', consumers.RouteEditConsumer.as_asgi()),
+]
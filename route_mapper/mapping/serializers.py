@@ -1,5 +1,24 @@
+import base64
+
+from django.urls import reverse
 from rest_framework import serializers
-from .models import BackgroundImage, Route, RoutePoint
+from .chunked_uploads import MAX_UPLOAD_SIZE
+from .formats import DEFAULT_HEATMAP_RESOLUTION, HEATMAP_RESOLUTIONS, POLYLINE_PRECISION
+from .models import BackgroundImage, BackgroundImageRendition, ImageUpload, Route, RoutePoint
+
+class BackgroundImageRenditionSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a resized copy of a background image (read-only).
+    """
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BackgroundImageRendition
+        fields = ['kind', 'format', 'url', 'width', 'height']
+
+    def get_url(self, obj):
+        return obj.image.url if obj.image else None
+
 
 class BackgroundImageSerializer(serializers.ModelSerializer):
     """
@@ -7,16 +26,20 @@ class BackgroundImageSerializer(serializers.ModelSerializer):
     """
     # Use SerializerMethodField to get the full image URL
     image_url = serializers.SerializerMethodField()
+    # Thumbnail / medium / full copies, filled in by a background worker after upload
+    renditions = BackgroundImageRenditionSerializer(many=True, read_only=True)
+    # Deep zoom descriptor of the tile pyramid, None until the tiles are built
+    dzi_url = serializers.SerializerMethodField()
 
     class Meta:
         model = BackgroundImage
         # Fields to include in the API representation
-        fields = ['id', 'name', 'slug', 'image', 'image_url', 'description', 'uploaded_at']
+        fields = ['id', 'name', 'slug', 'image', 'image_url', 'width', 'height', 'renditions', 'dzi_url', 'description', 'uploaded_at']
         # Make image field read-only to prevent direct file uploads via this serializer (upload handled separately)
         # Or, if you need to update other fields without changing the image, you can make image read_only=True
         # However, for simplicity in this context (used for *reading* nested data), let's keep it standard.
         # The .url accessor makes it read-only anyway for the 'image' field itself.
-        read_only_fields = ['slug', 'uploaded_at'] # Slug and upload time are set automatically
+        read_only_fields = ['slug', 'width', 'height', 'uploaded_at'] # Slug, size and upload time are set automatically
 
     def get_image_url(self, obj):
         """
@@ -30,17 +53,61 @@ class BackgroundImageSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None # Or an empty string
 
+    def get_dzi_url(self, obj):
+        if not obj.tiles_version:
+            return None
+        return reverse('mapping:tile_descriptor', kwargs={'image_slug': obj.slug})
+
+class ImageUploadSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a chunked background image upload (see mapping/chunked_uploads.py).
+    Created with the image's name, description, file name and total size;
+    `offset` tells the client where the next chunk starts.
+    """
+
+    class Meta:
+        model = ImageUpload
+        fields = ['id', 'name', 'description', 'filename', 'size', 'offset', 'created_at', 'updated_at']
+        read_only_fields = ['offset', 'created_at', 'updated_at']
+
+    def validate_size(self, value):
+        if not 0 < value <= MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError(f"The size must be between 1 and {MAX_UPLOAD_SIZE} bytes.")
+        return value
+
+
+class RoutePointListSerializer(serializers.ListSerializer):
+    """
+    Numbers a route's points with their dense positions while serializing them
+    (the points come sorted by rank, so a point's position is its index in the list).
+    Points that already carry a position (set by a write path) keep it.
+    """
+
+    def to_representation(self, data):
+        points = data.all() if hasattr(data, 'all') else data
+        points = list(points)
+        for position, point in enumerate(points):
+            if not hasattr(point, 'position'):
+                point.position = position
+        return super().to_representation(points)
+
+
 class RoutePointSerializer(serializers.ModelSerializer):
     """
     Serializer for the RoutePoint model.
     Used for listing points within a route and potentially creating/updating individual points.
     """
+    # The point's dense position in the route (0 .. point count - 1), set by the view.
+    # The stored 'order' is a sparse rank (see mapping/ranks.py) and is not exposed.
+    order = serializers.IntegerField(source='position', read_only=True)
+    # Optional on create: insert the point at this position instead of appending it
+    index = serializers.IntegerField(min_value=0, write_only=True, required=False)
+
     class Meta:
         model = RoutePoint
-        fields = ['id', 'x', 'y', 'order', 'created_at']
-        # Mark 'order' as read-only so it's not required in POST/PUT/PATCH data
-        # The backend will set it in perform_create.
-        read_only_fields = ['order', 'created_at'] # <-- Add 'order' here
+        fields = ['id', 'x', 'y', 'order', 'index', 'created_at']
+        read_only_fields = ['created_at']
+        list_serializer_class = RoutePointListSerializer
 
 
     # Optional: Add custom validation for x, y range (0.0 to 1.0)
@@ -54,6 +121,139 @@ class RoutePointSerializer(serializers.ModelSerializer):
         return data
 
 
+class PointRangeSerializer(serializers.Serializer):
+    """
+    Validates an inclusive range of point positions (used by the range-delete endpoint).
+    """
+    start = serializers.IntegerField(min_value=0)
+    end = serializers.IntegerField(min_value=0)
+
+    def validate(self, data):
+        if data['end'] < data['start']:
+            raise serializers.ValidationError({"end": "End order must not be lower than start order."})
+        return data
+
+
+class PointOperationSerializer(serializers.Serializer):
+    """
+    One operation of a batch edit (see mapping/editing.py for what each one does).
+    Positions are checked against the route when the batch is applied.
+    """
+    # Fields each operation needs
+    REQUIRED_FIELDS = {
+        'insert': ['index', 'points'],
+        'move': ['start', 'end', 'to'],
+        'delete': ['start', 'end'],
+        'update': ['index'],
+    }
+
+    op = serializers.ChoiceField(choices=list(REQUIRED_FIELDS))
+    index = serializers.IntegerField(min_value=0, required=False)
+    start = serializers.IntegerField(min_value=0, required=False)
+    end = serializers.IntegerField(min_value=0, required=False)
+    to = serializers.IntegerField(min_value=0, required=False)
+    # Same x/y validation as a single POST
+    points = RoutePointSerializer(many=True, required=False, allow_empty=False)
+    x = serializers.FloatField(min_value=0.0, max_value=1.0, required=False)
+    y = serializers.FloatField(min_value=0.0, max_value=1.0, required=False)
+
+    def validate(self, data):
+        missing = [field for field in self.REQUIRED_FIELDS[data['op']] if field not in data]
+        if missing:
+            raise serializers.ValidationError({field: f"Required for {data['op']}." for field in missing})
+        if 'start' in data and 'end' in data and data['end'] < data['start']:
+            raise serializers.ValidationError({"end": "End must not be lower than start."})
+        if data['op'] == 'update' and 'x' not in data and 'y' not in data:
+            raise serializers.ValidationError("An update needs x and/or y.")
+        return data
+
+
+class PointBatchSerializer(serializers.Serializer):
+    """
+    Validates a batch edit of a route's points. With version given, the batch is
+    only applied if the route still has that version (otherwise 409 Conflict).
+    """
+    operations = PointOperationSerializer(many=True, allow_empty=False)
+    version = serializers.IntegerField(min_value=0, required=False)
+
+
+class SimplifyParamsSerializer(serializers.Serializer):
+    """
+    Validates the level-of-detail query parameters accepted by the route and points endpoints.
+    tolerance is in normalized (0.0 to 1.0) image units.
+    """
+    tolerance = serializers.FloatField(min_value=0.0, required=False)
+    max_points = serializers.IntegerField(min_value=2, required=False)
+
+
+class EncodingParamsSerializer(serializers.Serializer):
+    """
+    Validates the query parameters of the compact point encodings (see mapping/encodings.py):
+    the decimals kept by the polyline encoding (7 is already below float32 precision).
+    """
+    precision = serializers.IntegerField(min_value=0, max_value=7, default=POLYLINE_PRECISION)
+
+
+class RoutesNearParamsSerializer(serializers.Serializer):
+    """
+    Validates the query of the routes-near endpoint: a point (x, y) and a radius r,
+    all in normalized (0.0 to 1.0) image units.
+    """
+    x = serializers.FloatField(min_value=0.0, max_value=1.0)
+    y = serializers.FloatField(min_value=0.0, max_value=1.0)
+    r = serializers.FloatField(min_value=0.0, max_value=1.0)
+
+
+class HeatmapParamsSerializer(serializers.Serializer):
+    """
+    Validates the query of the heatmap endpoint: the grid's cells per side
+    (a few fixed sizes, each stored once per image).
+    """
+    resolution = serializers.ChoiceField(choices=HEATMAP_RESOLUTIONS, default=DEFAULT_HEATMAP_RESOLUTION)
+
+
+class RouteExportParamsSerializer(serializers.Serializer):
+    """
+    Validates the query of the route export endpoint.
+    (Named export_format because ?format= is DRF's renderer override.)
+    """
+    export_format = serializers.ChoiceField(choices=['geojson', 'ndjson', 'csv'], default='geojson')
+
+
+class RouteImportParamsSerializer(serializers.Serializer):
+    """
+    Validates an upload to the route import endpoint (multipart form).
+    file_format is guessed from the file name when not given; frame and bounds
+    describe the file's coordinates (see mapping/importers.make_frame).
+    """
+    file = serializers.FileField()
+    background_image_id = serializers.PrimaryKeyRelatedField(
+        queryset=BackgroundImage.objects.all(), source='background_image'
+    )
+    file_format = serializers.ChoiceField(choices=['gpx', 'geojson', 'csv'], required=False)
+    frame = serializers.ChoiceField(choices=['normalized', 'pixels', 'bounds', 'fit'], required=False)
+    bounds = serializers.CharField(required=False)
+
+    def validate_bounds(self, value):
+        try:
+            west, south, east, north = (float(part) for part in value.split(','))
+        except ValueError:
+            raise serializers.ValidationError("Expected four comma-separated numbers: west,south,east,north.")
+        if west >= east or south >= north:
+            raise serializers.ValidationError("West must be below east and south below north.")
+        return west, south, east, north
+
+    def validate(self, data):
+        if 'file_format' not in data:
+            from .importers import guess_format
+            data['file_format'] = guess_format(data['file'].name)
+            if data['file_format'] is None:
+                raise serializers.ValidationError({"file_format": "Cannot tell the format from the file name, please give it."})
+        if data.get('frame') == 'bounds' and 'bounds' not in data:
+            raise serializers.ValidationError({"bounds": "Required for the bounds frame."})
+        return data
+
+
 class RouteSerializer(serializers.ModelSerializer):
     """
     Serializer for the Route model.
@@ -88,18 +288,70 @@ class RouteSerializer(serializers.ModelSerializer):
     # Make it read_only because points are managed via the /points/ endpoint, not directly here
     points = RoutePointSerializer(many=True, read_only=True)
 
+    # Compact alternative to 'points': the route's packed geometry (little-endian float32
+    # x, y pairs in point order) as a base64 string. Returned instead of 'points' when the
+    # request asks for ?points=packed, which never loads the RoutePoint rows at all.
+    packed_points = serializers.SerializerMethodField()
+
     # User field is read-only, will display the username by default with ModelSerializer
     # user = serializers.ReadOnlyField(source='user.username') # Example if you want custom representation
 
     class Meta:
         model = Route
         # Fields included in the API representation for READ (GET) requests
-        fields = ['id', 'user', 'background_image_id', 'background_image_details', 'name', 'description', 'points', 'created_at']
+        fields = ['id', 'user', 'background_image_id', 'background_image_details', 'name', 'description', 'points', 'packed_points', 'version',
+                  'point_count', 'length', 'length_px', 'min_x', 'min_y', 'max_x', 'max_y', 'created_at', 'last_modified']
         # Fields included in the API representation for WRITE (POST, PUT, PATCH) requests
         # ModelSerializer automatically uses write_only fields for writing.
         # Fields not in `fields` or explicitly `write_only=True` are excluded from writing.
         # 'user' and 'created_at' are automatically read_only or handled by perform_create.
-        read_only_fields = ['user', 'points', 'created_at'] # 'user' and 'created_at' are set by server, 'points' are managed separately
+        read_only_fields = ['user', 'points', 'version', 'point_count', 'length', 'length_px', 'min_x', 'min_y', 'max_x', 'max_y', 'created_at', 'last_modified'] # 'user' and 'created_at' are set by server, 'points' are managed separately
+
+    def get_points_mode(self):
+        """
+        The points representation requested with the ?points= query parameter:
+        'full' (default) nests every RoutePoint, 'packed' returns packed_points instead
+        and 'none' leaves the points out altogether (e.g. for lightweight route lists).
+        A view can set it with context['points_mode'] (the compact encodings do).
+        """
+        if self.context.get('points_mode'):
+            return self.context['points_mode']
+        request = self.context.get('request')
+        return request.query_params.get('points', 'full') if request is not None else 'full'
+
+    def get_fields(self):
+        fields = super().get_fields()
+        points_mode = self.get_points_mode()
+        # A level-of-detail request replaces the nested points (see to_representation)
+        if points_mode != 'full' or self.context.get('simplify'):
+            fields.pop('points')
+        if points_mode != 'packed':
+            fields.pop('packed_points')
+        return fields
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # When the view asked for a level-of-detail version, serve the simplified
+        # polyline (built from the packed geometry) in place of the full point list.
+        simplify = self.context.get('simplify')
+        if simplify and self.get_points_mode() == 'full':
+            data['points'] = instance.simplified_points(**simplify)
+        return data
+
+    def get_packed_points(self, obj):
+        return base64.b64encode(bytes(obj.packed_points)).decode('ascii')
+
+    def update(self, instance, validated_data):
+        """
+        Writes only the edited columns (name, description, background image). The
+        instance was read without a lock, so a full save() would put back stale
+        copies of next_rank, the packed geometry and the metrics, undoing any point
+        write that landed in between (which then hands out a used rank again).
+        """
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'last_modified'])
+        return instance
 
 
     # You can add custom validation for the Route itself if needed
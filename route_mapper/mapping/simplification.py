@@ -0,0 +1,82 @@
+# mapping/simplification.py
+"""
+Level-of-detail reduction of route polylines (Douglas-Peucker).
+
+Works directly on the packed geometry (see mapping/geometry.py), so no RoutePoint
+rows or model instances are needed to simplify a route.
+"""
+
+import heapq
+
+import numpy as np
+
+from .geometry import unpack_points
+
+
+def coords_array(packed_points):
+    """
+    Returns the packed geometry as an (n, 2) float64 NumPy array of (x, y) rows.
+    """
+    return np.asarray(unpack_points(packed_points), dtype=np.float64).reshape(-1, 2)
+
+
+def _farthest_point(xy, start, end):
+    """
+    Finds the interior point of xy[start..end] farthest from the segment xy[start]-xy[end].
+    Returns (distance, index). The distances are computed for all interior points at once.
+    """
+    a = xy[start]
+    b = xy[end]
+    interior = xy[start + 1:end]
+    ab = b - a
+    length_sq = ab @ ab
+    if length_sq == 0.0:
+        # Degenerate segment (start and end coincide): plain distance to that point
+        distances = np.hypot(*(interior - a).T)
+    else:
+        # Distance to the closest point on the segment (projection clamped to [0, 1])
+        t = np.clip(((interior - a) @ ab) / length_sq, 0.0, 1.0)
+        closest = a + t[:, None] * ab
+        distances = np.hypot(*(interior - closest).T)
+    farthest = int(np.argmax(distances))
+    return float(distances[farthest]), start + 1 + farthest
+
+
+def simplify_indices(xy, tolerance=None, max_points=None):
+    """
+    Douglas-Peucker simplification of an (n, 2) array of points.
+    Returns the sorted indices of the points to keep (always including both ends).
+
+    tolerance  - drop points closer than this to the simplified line (same units as xy).
+    max_points - keep at most this many points.
+    Segments are refined worst-first, so with max_points the result is the best
+    max_points-point approximation Douglas-Peucker can give; both limits can be combined.
+    """
+    count = len(xy)
+    if tolerance is None and (max_points is None or max_points >= count):
+        return list(range(count))
+    if count <= 2:
+        return list(range(count))
+
+    kept = [0, count - 1]
+    # Max-heap (negated distances) of segments that still have interior points
+    heap = []
+
+    def push(start, end):
+        if end - start > 1:
+            distance, index = _farthest_point(xy, start, end)
+            heapq.heappush(heap, (-distance, start, end, index))
+
+    push(0, count - 1)
+    while heap:
+        if max_points is not None and len(kept) >= max_points:
+            break
+        negative_distance, start, end, index = heapq.heappop(heap)
+        if tolerance is not None and -negative_distance <= tolerance:
+            break # Every remaining segment is within tolerance too
+        kept.append(index)
+        push(start, index)
+        push(index, end)
+
+    kept.sort()
+    return kept
@@ -0,0 +1,67 @@
+# mapping/slugs.py
+"""
+Unique slug allocation for models with an auto-generated slug (BackgroundImage).
+
+Slugs are handed out as base, base-1, base-2, ... The next free one is found with a
+single aggregate query (highest numeric suffix already used for the base) instead of
+checking base-1, base-2, ... one query at a time.
+"""
+
+import re
+
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Cast, Length, Substr
+
+# Inserts tried before giving up on a slug that keeps colliding
+SAVE_ATTEMPTS = 5
+
+
+def allocate_slug(queryset, base_slug, field='slug'):
+    """
+    Returns the first slug for `base_slug` that is not used in `queryset`:
+    base_slug itself if it is free, otherwise base_slug-N with N one higher than
+    the highest suffix in use.
+
+    A base that already ends in a number (e.g. "floor-2") is handled the same way:
+    its copies are "floor-2-1", ..., and those are not mistaken for numbered copies
+    of "floor" (only slugs matching base-<digits> exactly count as suffixes).
+    """
+    suffix_pattern = rf'^{re.escape(base_slug)}-[0-9]+$'
+    suffix_start = len(base_slug) + 2 # Substr() is 1-based, skip "base-"
+    # The prefix lookups can use the slug index, the regex only runs on what they match
+    taken = queryset.filter(
+        models.Q(**{field: base_slug}) | models.Q(**{f'{field}__startswith': f'{base_slug}-'})
+    ).aggregate(
+        base_taken=models.Count('pk', filter=models.Q(**{field: base_slug})),
+        # Suffixes are compared as numbers, so base-10 beats base-9
+        highest_suffix=models.Max(
+            Cast(Substr(field, suffix_start, Length(field)), models.IntegerField()),
+            filter=models.Q(**{f'{field}__regex': suffix_pattern}),
+        ),
+    )
+    if not taken['base_taken']:
+        return base_slug
+    return f"{base_slug}-{(taken['highest_suffix'] or 0) + 1}"
+
+
+def save_with_unique_slug(instance, base_slug, save, field='slug'):
+    """
+    Sets a freshly allocated slug on `instance` and saves it by calling `save()`
+    (the model's super().save with its arguments bound).
+
+    Two uploads with the same name can allocate the same slug before either is
+    inserted; the loser hits the unique index. In that case the slug is allocated
+    again (now seeing the winner's row) and the save retried, up to SAVE_ATTEMPTS
+    times in total (every round of colliding uploads has at least one winner).
+    """
+    queryset = type(instance)._default_manager.all()
+    for attempt in range(SAVE_ATTEMPTS):
+        setattr(instance, field, allocate_slug(queryset, base_slug, field))
+        try:
+            # Savepoint, so a failed insert does not break an outer transaction
+            with transaction.atomic():
+                save()
+            return
+        except IntegrityError:
+            if attempt == SAVE_ATTEMPTS - 1:
+                raise
@@ -0,0 +1,138 @@
+# mapping/spatial.py
+"""
+Uniform grid index over route segments (see RouteSegmentCell).
+
+Normalized image coordinates (0.0 to 1.0) are divided into GRID_SIZE x GRID_SIZE cells.
+Every cell a route segment passes through gets one RouteSegmentCell row, so
+"which routes pass near this spot?" only has to look at a handful of cells.
+"""
+
+import math
+
+import numpy as np
+
+GRID_SIZE = 64
+
+
+def cell_of(value):
+    """
+    Grid cell index (0..GRID_SIZE-1) of a normalized coordinate, clamped to the grid.
+    """
+    return min(max(int(math.floor(value * GRID_SIZE)), 0), GRID_SIZE - 1)
+
+
+def segment_cells(x0, y0, x1, y1):
+    """
+    Returns every grid cell (cell_x, cell_y) the segment (x0, y0)-(x1, y1) passes through,
+    by walking the grid along the segment (Amanatides & Woo).
+    """
+    cx, cy = cell_of(x0), cell_of(y0)
+    end = (cell_of(x1), cell_of(y1))
+    cells = [(cx, cy)]
+
+    dx = x1 - x0
+    dy = y1 - y0
+    step_x = 1 if dx > 0 else -1
+    step_y = 1 if dy > 0 else -1
+    # Distance along the segment (t in 0..1) to the next vertical / horizontal cell border,
+    # and how much t advances per crossed cell
+    t_max_x = ((cx + (step_x > 0)) / GRID_SIZE - x0) / dx if dx else math.inf
+    t_max_y = ((cy + (step_y > 0)) / GRID_SIZE - y0) / dy if dy else math.inf
+    t_delta_x = 1 / (GRID_SIZE * abs(dx)) if dx else math.inf
+    t_delta_y = 1 / (GRID_SIZE * abs(dy)) if dy else math.inf
+
+    # A segment can cross at most 2 * GRID_SIZE borders, the limit only guards against
+    # floating point drift at the very end of the segment
+    for _ in range(2 * GRID_SIZE):
+        if (cx, cy) == end:
+            break
+        if t_max_x < t_max_y:
+            cx += step_x
+            t_max_x += t_delta_x
+        else:
+            cy += step_y
+            t_max_y += t_delta_y
+        if not (0 <= cx < GRID_SIZE and 0 <= cy < GRID_SIZE):
+            break
+        cells.append((cx, cy))
+    return cells
+
+
+def polyline_cells(coords):
+    """
+    Returns the set of grid cells covered by a flat coordinate array [x0, y0, x1, y1, ...].
+    A route with a single point covers that point's cell.
+    """
+    xy = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(xy) == 0:
+        return set()
+    # Cell of every point at once (same rounding as cell_of)
+    point_cells = np.clip(np.floor(xy * GRID_SIZE).astype(np.int64), 0, GRID_SIZE - 1)
+    # Unique cells via one integer per cell (much cheaper than unique rows)
+    cell_ids = np.unique(point_cells[:, 0] * GRID_SIZE + point_cells[:, 1])
+    cells = {(cell_id // GRID_SIZE, cell_id % GRID_SIZE) for cell_id in cell_ids.tolist()}
+    # Dense traces mostly step inside one cell, only segments that change cell
+    # have to walk the grid
+    changes = np.nonzero(np.any(point_cells[1:] != point_cells[:-1], axis=1))[0]
+    for i in changes.tolist():
+        x0, y0, x1, y1 = xy[i:i + 2].ravel().tolist()
+        cells.update(segment_cells(x0, y0, x1, y1))
+    return cells
+
+
+def cells_in_radius(x, y, radius):
+    """
+    Returns the (min_x, min_y, max_x, max_y) cell range of the box around (x, y) that
+    contains the circle of the given radius.
+    """
+    return cell_of(x - radius), cell_of(y - radius), cell_of(x + radius), cell_of(y + radius)
+
+
+def distance_to_polyline(xy, x, y):
+    """
+    Shortest distance from (x, y) to the polyline given as an (n, 2) array,
+    computed for all segments at once.
+    """
+    if len(xy) == 0:
+        return math.inf
+    point = np.array([x, y])
+    if len(xy) == 1:
+        return float(np.hypot(*(xy[0] - point)))
+
+    a = xy[:-1]
+    ab = xy[1:] - a
+    length_sq = np.einsum('ij,ij->i', ab, ab)
+    # Projection of the point onto each segment, clamped to the segment
+    t = np.divide(
+        np.einsum('ij,ij->i', point - a, ab), length_sq,
+        out=np.zeros_like(length_sq), where=length_sq > 0
+    )
+    closest = a + np.clip(t, 0.0, 1.0)[:, None] * ab
+    return float(np.min(np.hypot(*(closest - point).T)))
+
+
+def covered_cells(coords, cells):
+    """
+    Returns the cells out of `cells` that the polyline (a flat coordinate array)
+    passes through. Only the segments whose range of cells contains one of them are
+    walked, so checking a few cells against a long route stays cheap.
+    """
+    xy = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(xy) == 0 or not cells:
+        return set()
+    point_cells = np.clip(np.floor(xy * GRID_SIZE).astype(np.int64), 0, GRID_SIZE - 1)
+    if len(xy) == 1:
+        return {cell for cell in cells if cell == tuple(point_cells[0].tolist())}
+
+    low = np.minimum(point_cells[:-1], point_cells[1:])
+    high = np.maximum(point_cells[:-1], point_cells[1:])
+    covered = set()
+    for cell_x, cell_y in cells:
+        candidates = np.nonzero(
+            (low[:, 0] <= cell_x) & (cell_x <= high[:, 0]) & (low[:, 1] <= cell_y) & (cell_y <= high[:, 1])
+        )[0]
+        for i in candidates.tolist():
+            if (cell_x, cell_y) in segment_cells(*xy[i:i + 2].ravel().tolist()):
+                covered.add((cell_x, cell_y))
+                break
+    return covered
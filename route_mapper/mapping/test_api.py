@@ -6,12 +6,63 @@ from django.contrib.auth import get_user_model
 from rest_framework.authtoken.models import Token
 from django.urls import reverse # Used to get URLs by name
 from django.core.files.uploadedfile import SimpleUploadedFile # Needed for dummy image file
+from django.db import OperationalError, connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.core.signals import got_request_exception
+from django.core.management import call_command
+from django.core.cache import cache
+from io import BytesIO, StringIO
+from PIL import Image
+from array import array
+from unittest import mock, skipUnless
+import base64
+import os
+import random
+import sys
+import threading
+import time
 
-from .models import BackgroundImage, Route
+from .models import BackgroundImage, ImageHeatmap, Route, RoutePoint
+from .geometry import flatten_points, unpack_points
+from .ranks import RANK_GAP
+from .views import RoutePointViewSet, RouteViewSet
+from .encodings import decode_polyline
+from .heatmaps import rasterize
+from .renderers import msgpack
 
 # Get the User model
 User = get_user_model()
 
+class RouteApiFixtures:
+    """Shared fixture helpers: a user with an authenticated client, a background image and routes with points."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='apiuser', password='testpassword')
+        self.authenticated_client = APIClient()
+        self.authenticated_client.force_authenticate(user=self.user)
+
+        self.bg_image = BackgroundImage.objects.create(
+            name='API Map',
+            image=SimpleUploadedFile(name='api_map.jpg', content=b'fake image content', content_type='image/jpeg')
+        )
+
+    def create_route(self, points, user=None, image=None, name='Route'):
+        """A route with the given (x, y) points, appended through the bulk points endpoint."""
+        route = Route.objects.create(user=user or self.user, background_image=image or self.bg_image, name=name)
+        if points:
+            client = APIClient()
+            client.force_authenticate(user=route.user)
+            client.post(
+                reverse('route-points-bulk', kwargs={'route_pk': route.pk}),
+                [{'x': x, 'y': y} for x, y in points], format='json'
+            )
+        return route
+
+    def create_route_with_points(self, length):
+        """A route of `length` points along the image's diagonal."""
+        return self.create_route([(i / length, i / length) for i in range(length)], name=f'Route {length}')
+
 class RouteApiTests(APITestCase):
     """
     Integration tests for the Route API endpoints (/api/routes/).
@@ -121,7 +172,7 @@ class RouteApiTests(APITestCase):
         response = self.authenticated_client.get(self.routes_list_url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        response_data = response.json()
+        response_data = response.json()['results'] # The list is cursor-paginated
         self.assertEqual(len(response_data), 1) # Should only see their own route
         self.assertEqual(response_data[0]['id'], self.my_route.pk)
         self.assertEqual(response_data[0]['name'], 'My Awesome Route')
@@ -129,7 +180,7 @@ class RouteApiTests(APITestCase):
         # Check the other user's perspective
         response_another = self.another_authenticated_client.get(self.routes_list_url)
         self.assertEqual(response_another.status_code, status.HTTP_200_OK)
-        response_data_another = response_another.json()
+        response_data_another = response_another.json()['results']
         self.assertEqual(len(response_data_another), 1) # Should only see their own route
         self.assertEqual(response_data_another[0]['id'], self.another_users_route.pk)
 
@@ -219,4 +270,1648 @@ class RouteApiTests(APITestCase):
     # - Authentication is required
     # - User can create/list/retrieve/update/delete points ONLY on routes they own
     # - Attempting to interact with points on another user's route (even if providing a valid point ID)
-    #   returns 404 because the parent route is filtered by ownership in get_queryset.
\ No newline at end of file
+    #   returns 404 because the parent route is filtered by ownership in get_queryset.
+
+
+class RoutePointBulkApiTests(APITestCase):
+    """
+    Integration tests for the bulk point append endpoint (/api/routes/{route_pk}/points/bulk/).
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulkuser', password='testpassword')
+        self.another_user = User.objects.create_user(username='otherbulkuser', password='testpassword')
+
+        self.authenticated_client = APIClient()
+        self.authenticated_client.force_authenticate(user=self.user)
+
+        bg_image = BackgroundImage.objects.create(
+            name='Bulk Map',
+            image=SimpleUploadedFile(name='bulk_map.jpg', content=b'fake image content', content_type='image/jpeg')
+        )
+        self.route = Route.objects.create(user=self.user, background_image=bg_image, name='Bulk Route')
+        self.another_users_route = Route.objects.create(user=self.another_user, background_image=bg_image, name='Not Yours')
+
+        self.bulk_url = reverse('route-points-bulk', kwargs={'route_pk': self.route.pk})
+
+    def test_bulk_append_assigns_contiguous_orders(self):
+        """Points are appended after the existing ones with contiguous order values."""
+        RoutePoint.objects.create(route=self.route, x=0.0, y=0.0, order=0)
+        self.route.rebuild_packed_points()
+        data = [{'x': 0.1, 'y': 0.1}, {'x': 0.2, 'y': 0.2}, {'x': 0.3, 'y': 0.3}]
+
+        response = self.authenticated_client.post(self.bulk_url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([p['order'] for p in response.data], [1, 2, 3])
+        self.assertTrue(all(p['id'] is not None for p in response.data))
+        # The API numbers the points densely, the stored ranks leave gaps for inserts
+        listed = self.authenticated_client.get(reverse('route-points-list', kwargs={'route_pk': self.route.pk})).data
+        self.assertEqual([p['order'] for p in listed], [0, 1, 2, 3])
+        ranks = list(self.route.points.values_list('order', flat=True))
+        self.assertEqual(ranks[1:], [ranks[0] + RANK_GAP * i for i in range(1, 4)])
+
+    def test_bulk_append_query_count_does_not_grow_with_batch_size(self):
+        """A batch is written with a fixed number of queries, not one per point."""
+        # Kept under SQLite's bulk_create batch size (999 params / 5 fields),
+        # so the INSERT is a single statement.
+        data = [{'x': i / 150, 'y': i / 150} for i in range(150)]
+
+        # savepoint, rank reservation, route lookup, insert, route geometry update,
+        # spatial index insert, release
+        with self.assertNumQueries(7):
+            response = self.authenticated_client.post(self.bulk_url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.route.points.count(), 150)
+
+    def test_bulk_append_rejects_whole_batch_on_invalid_point(self):
+        """One invalid point rejects the whole batch and nothing is written."""
+        data = [{'x': 0.1, 'y': 0.1}, {'x': 1.5, 'y': 0.1}]
+
+        response = self.authenticated_client.post(self.bulk_url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.route.points.count(), 0)
+
+    def test_bulk_append_rejects_empty_list(self):
+        """An empty batch is a validation error."""
+        response = self.authenticated_client.post(self.bulk_url, [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_append_on_another_users_route_returns_404(self):
+        """Points cannot be appended to a route owned by someone else."""
+        url = reverse('route-points-bulk', kwargs={'route_pk': self.another_users_route.pk})
+        response = self.authenticated_client.post(url, [{'x': 0.1, 'y': 0.1}], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.another_users_route.points.count(), 0)
+
+
+class RoutePointDeleteApiTests(RouteApiFixtures, APITestCase):
+    """
+    Integration tests for deleting points (/api/routes/{route_pk}/points/{pk}/ and .../points/range/)
+    and the re-ordering of the remaining points.
+    """
+
+    def point_url(self, route, order):
+        point = route.points.all()[order]
+        return reverse('route-point-detail', kwargs={'route_pk': route.pk, 'pk': point.pk})
+
+    def listed_orders(self, route):
+        """The points' positions as the API shows them."""
+        response = self.authenticated_client.get(reverse('route-points-list', kwargs={'route_pk': route.pk}))
+        return [p['order'] for p in response.data]
+
+    def test_delete_point_renumbers_following_points(self):
+        """Deleting a point closes the gap in the positions the API shows."""
+        route = self.create_route_with_points(5)
+        deleted_point = route.points.all()[1]
+
+        response = self.authenticated_client.delete(self.point_url(route, 1))
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(RoutePoint.objects.filter(pk=deleted_point.pk).exists())
+        self.assertEqual(self.listed_orders(route), [0, 1, 2, 3])
+        # Relative order of the remaining points is preserved
+        self.assertEqual(list(route.points.values_list('x', flat=True)), [0.0, 0.4, 0.6, 0.8])
+
+    def test_delete_point_query_count_does_not_grow_with_route_length(self):
+        """Deleting near the start of a long route writes only the deleted row, as on a short one."""
+        short_route = self.create_route_with_points(5)
+        long_route = self.create_route_with_points(500)
+
+        short_url = self.point_url(short_route, 1)
+        long_url = self.point_url(long_route, 1)
+
+        # route lookup, point lookup + savepoint, route row update, route lookup,
+        # rank and position, delete, route geometry update, release. The straight
+        # test routes keep their cells, so the spatial index is not touched
+        with self.assertNumQueries(9):
+            self.authenticated_client.delete(short_url)
+        with self.assertNumQueries(9):
+            self.authenticated_client.delete(long_url)
+
+        self.assertEqual(self.listed_orders(long_route), list(range(499)))
+
+    def test_delete_range_renumbers_following_points(self):
+        """Deleting an inclusive range of positions removes those points and closes the gap."""
+        route = self.create_route_with_points(10)
+        url = reverse('route-points-range', kwargs={'route_pk': route.pk})
+
+        response = self.authenticated_client.delete(f'{url}?start=2&end=5')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted'], 4)
+        self.assertEqual(self.listed_orders(route), list(range(6)))
+        self.assertEqual(list(route.points.values_list('x', flat=True)), [0.0, 0.1, 0.6, 0.7, 0.8, 0.9])
+
+    def test_delete_range_rejects_inverted_range(self):
+        """End lower than start is a validation error."""
+        route = self.create_route_with_points(3)
+        url = reverse('route-points-range', kwargs={'route_pk': route.pk})
+
+        response = self.authenticated_client.delete(f'{url}?start=2&end=1')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(route.points.count(), 3)
+
+
+
+
+class RoutePointInsertApiTests(RouteApiFixtures, APITestCase):
+    """
+    Tests for inserting single points in the middle of a route (POST with "index")
+    and for the sparse ranks behind it.
+    """
+
+    def points_url(self, route):
+        return reverse('route-points-list', kwargs={'route_pk': route.pk})
+
+    def listed_xs(self, route):
+        """x of the points as listed by the API, checking positions and the packed copy."""
+        listed = self.authenticated_client.get(self.points_url(route)).data
+        self.assertEqual([p['order'] for p in listed], list(range(len(listed))))
+        packed = unpack_points(Route.objects.get(pk=route.pk).packed_points)
+        self.assertEqual([round(x, 5) for x in packed[0::2]], [round(p['x'], 5) for p in listed])
+        return [round(p['x'], 5) for p in listed]
+
+    def test_insert_in_the_middle_writes_only_the_new_row(self):
+        route = self.create_route_with_points(4)
+        ranks_before = list(route.points.values_list('id', 'order'))
+
+        response = self.authenticated_client.post(self.points_url(route), {'x': 0.9, 'y': 0.9, 'index': 2}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['order'], 2)
+        self.assertNotIn('index', response.data)
+        self.assertEqual(self.listed_xs(route), [0.0, 0.25, 0.9, 0.5, 0.75])
+        # The other points kept their ranks
+        self.assertEqual(list(route.points.exclude(pk=response.data['id']).values_list('id', 'order')), ranks_before)
+
+    def test_insert_query_count_does_not_grow_with_route_length(self):
+        short_route = self.create_route_with_points(5)
+        long_route = self.create_route_with_points(500)
+
+        # savepoint, rank reservation, route lookup, neighbour ranks, insert,
+        # route geometry update, spatial index insert of the detour's cells, release.
+        # The detour runs back along the diagonal, so no cell leaves the index
+        for route in (short_route, long_route):
+            with self.assertNumQueries(8):
+                self.authenticated_client.post(self.points_url(route), {'x': 0.9, 'y': 0.9, 'index': 1}, format='json')
+
+    def test_insert_at_the_front_and_past_the_end(self):
+        route = self.create_route_with_points(2)
+        self.authenticated_client.post(self.points_url(route), {'x': 0.9, 'y': 0.9, 'index': 0}, format='json')
+        response = self.authenticated_client.post(self.points_url(route), {'x': 1.0, 'y': 1.0, 'index': 99}, format='json')
+        self.assertEqual(response.data['order'], 3)
+        self.assertEqual(self.listed_xs(route), [0.9, 0.0, 0.5, 1.0])
+
+    def test_repeated_inserts_at_one_spot_respace_the_route(self):
+        """Once two neighbours have adjacent ranks, the route's ranks are spread out again."""
+        route = self.create_route_with_points(3)
+        for i in range(20): # Each insert halves the gap after the first point
+            response = self.authenticated_client.post(
+                self.points_url(route), {'x': i / 100, 'y': 0.1, 'index': 1}, format='json'
+            )
+            self.assertEqual(response.data['order'], 1)
+
+        self.assertEqual(self.listed_xs(route), [0.0] + [round(i / 100, 5) for i in range(19, -1, -1)] + [0.33333, 0.66667])
+        ranks = list(route.points.values_list('order', flat=True))
+        self.assertEqual(ranks, sorted(set(ranks)))
+
+    def test_batch_move_writes_only_the_moved_points(self):
+        route = self.create_route_with_points(6)
+        ranks_before = dict(route.points.values_list('id', 'order'))
+        last_id = route.points.all()[5].id
+
+        self.authenticated_client.patch(
+            self.points_url(route), {'operations': [{'op': 'move', 'start': 5, 'end': 5, 'to': 1}]}, format='json'
+        )
+
+        ranks_after = dict(route.points.values_list('id', 'order'))
+        self.assertEqual([point_id for point_id in ranks_before if ranks_before[point_id] != ranks_after[point_id]], [last_id])
+        self.assertEqual(self.listed_xs(route), [0.0, 0.83333, 0.16667, 0.33333, 0.5, 0.66667])
+
+
+def is_table_locked(error):
+    """True for SQLite's "database table is locked" error of a shared in-memory database."""
+    return isinstance(error, OperationalError) and 'locked' in str(error)
+
+
+class ConcurrentAppendApiTests(TransactionTestCase):
+    """
+    Several clients appending to the same route at once: every point must be stored
+    once, with its own rank, and the packed geometry must contain all of them.
+    """
+
+    def test_concurrent_appends_never_collide(self):
+        user = User.objects.create_user(username='stressuser', password='testpassword')
+        bg_image = BackgroundImage.objects.create(name='Stress Map', image='background_images/stress.jpg')
+        route = Route.objects.create(user=user, background_image=bg_image, name='Stress Route')
+        points_url = reverse('route-points-list', kwargs={'route_pk': route.pk})
+        bulk_url = reverse('route-points-bulk', kwargs={'route_pk': route.pk})
+
+        writers, rounds = 4, 10
+        barrier = threading.Barrier(writers)
+        errors = []
+
+        # The exception behind a 500, per thread: the handler runs in the posting
+        # thread, so got_request_exception is sent there
+        request_errors = threading.local()
+
+        def record_exception(sender, request=None, **kwargs):
+            request_errors.error = sys.exc_info()[1]
+
+        got_request_exception.connect(record_exception, dispatch_uid='concurrent-append-test')
+        self.addCleanup(got_request_exception.disconnect, dispatch_uid='concurrent-append-test')
+
+        def append(writer):
+            # raise_request_exception=False: the test client listens to got_request_exception,
+            # which is sent to the clients of all threads, so it would raise one writer's
+            # error in another; each thread reads its own error from request_errors instead
+            client = APIClient(raise_request_exception=False)
+            client.force_authenticate(user=user)
+            try:
+                barrier.wait() # Start all writers at (nearly) the same time
+                for i in range(rounds):
+                    x = writer / 10 + i / 1000
+                    # Alternate single points and small batches
+                    if i % 2:
+                        url, data = bulk_url, [{'x': x, 'y': 0.1}, {'x': x, 'y': 0.2}]
+                    else:
+                        url, data = points_url, {'x': x, 'y': 0.3}
+                    for attempt in range(500):
+                        request_errors.error = None
+                        response = client.post(url, data, format='json')
+                        # The SQLite test database is shared in-memory, which reports a
+                        # lock conflict ("database table is locked") instead of waiting
+                        # for it; the request was rolled back, just send it again.
+                        # Any other error (an IntegrityError on the ranks, ...) fails the test.
+                        if not is_table_locked(request_errors.error):
+                            break
+                        time.sleep(random.uniform(0.005, 0.02))
+                    if response.status_code != status.HTTP_201_CREATED:
+                        errors.append(request_errors.error or response.status_code)
+            except Exception as error: # Collected and reported by the main thread
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=append, args=(writer,)) for writer in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        expected = writers * (rounds // 2 * 2 + (rounds + 1) // 2)
+        ranks = list(route.points.values_list('order', flat=True))
+        self.assertEqual(len(ranks), expected)
+        self.assertEqual(len(set(ranks)), expected)
+        # No append was lost from the packed geometry either
+        route.refresh_from_db()
+        self.assertEqual(route.point_count, expected)
+        self.assertEqual(
+            unpack_points(route.packed_points).tolist(),
+            flatten_points(route.points.values_list('x', 'y')).tolist(),
+        )
+        self.assertGreater(route.next_rank, ranks[-1])
+
+class RoutePointBatchEditApiTests(APITestCase):
+    """
+    Integration tests for the batch edit endpoint (PATCH /api/routes/{route_pk}/points/).
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='batchuser', password='testpassword')
+        self.authenticated_client = APIClient()
+        self.authenticated_client.force_authenticate(user=self.user)
+        bg_image = BackgroundImage.objects.create(
+            name='Batch Map',
+            image=SimpleUploadedFile(name='batch_map.jpg', content=b'fake image content', content_type='image/jpeg')
+        )
+        self.route = Route.objects.create(user=self.user, background_image=bg_image, name='Batch Route')
+        # Points 0..5 at x = 0.0, 0.1, ..., 0.5, so x tells where a point came from
+        RoutePoint.objects.bulk_create(
+            RoutePoint(route=self.route, x=i / 10, y=0.5, order=i) for i in range(6)
+        )
+        self.route.rebuild_packed_points()
+        self.url = reverse('route-points-list', kwargs={'route_pk': self.route.pk})
+
+        other_user = User.objects.create_user(username='otherbatchuser', password='testpassword')
+        self.other_route = Route.objects.create(user=other_user, background_image=bg_image, name='Not Yours')
+
+    def edit(self, operations, **extra):
+        return self.authenticated_client.patch(self.url, {'operations': operations, **extra}, format='json')
+
+    def stored_xs(self):
+        """x of every point in order, checking the API's positions and that the packed copy matches."""
+        self.route.refresh_from_db()
+        listed = self.authenticated_client.get(self.url).data
+        self.assertEqual([p['order'] for p in listed], list(range(len(listed))))
+        packed = unpack_points(self.route.packed_points)
+        self.assertEqual([round(x, 5) for x in packed[0::2]], [round(p['x'], 5) for p in listed])
+        return [round(p['x'], 5) for p in listed]
+
+    def test_operations_apply_in_sequence(self):
+        version = self.route.version
+        response = self.edit([
+            {'op': 'delete', 'start': 1, 'end': 2},                      # 0 3 4 5
+            {'op': 'insert', 'index': 1, 'points': [{'x': 0.9, 'y': 0.9}, {'x': 0.8, 'y': 0.8}]}, # 0 .9 .8 3 4 5
+            {'op': 'move', 'start': 4, 'end': 5, 'to': 0},               # 4 5 0 .9 .8 3
+            {'op': 'update', 'index': 2, 'x': 0.05},                     # 4 5 .05 .9 .8 3
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.stored_xs(), [0.4, 0.5, 0.05, 0.9, 0.8, 0.3])
+        # One version bump for the whole batch
+        self.assertEqual(response.data, {'version': version + 1, 'point_count': 6})
+        self.assertEqual(self.route.version, version + 1)
+
+    def test_moved_points_keep_their_ids(self):
+        last_id = self.route.points.all()[5].id
+        self.edit([{'op': 'move', 'start': 5, 'end': 5, 'to': 0}])
+        self.assertEqual(self.route.points.all()[0].id, last_id)
+        self.assertEqual(self.stored_xs(), [0.5, 0.0, 0.1, 0.2, 0.3, 0.4])
+
+    def test_insert_at_the_end_appends(self):
+        self.edit([{'op': 'insert', 'index': 6, 'points': [{'x': 1.0, 'y': 1.0}]}])
+        self.assertEqual(self.stored_xs(), [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 1.0])
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        RoutePoint.objects.bulk_create(
+            RoutePoint(route=self.route, x=0.5, y=i / 200, order=6 + i) for i in range(150)
+        )
+        self.route.rebuild_packed_points()
+        operations = [{'op': 'move', 'start': 0, 'end': 20, 'to': 100}] + [
+            {'op': 'delete', 'start': 50, 'end': 50} for _ in range(30)
+        ] + [{'op': 'insert', 'index': 10, 'points': [{'x': 0.2, 'y': 0.2}] * 40}]
+
+        # savepoint, route row update, route lookup, points, delete, lift, bulk update,
+        # insert, next rank (the test's dense ranks are respaced), route geometry update,
+        # spatial index delete + insert, release
+        with self.assertNumQueries(13):
+            response = self.edit(operations)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['point_count'], 156 - 30 + 40)
+        self.assertEqual(len(self.stored_xs()), 166)
+
+    def test_out_of_range_operation_rolls_back_the_batch(self):
+        version = self.route.version
+        response = self.edit([
+            {'op': 'delete', 'start': 0, 'end': 0},
+            {'op': 'update', 'index': 5, 'x': 0.5}, # Only 5 points left
+        ])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Operation 1', response.data['operations'][0])
+        self.assertEqual(self.stored_xs(), [0.0, 0.1, 0.2, 0.3, 0.4, 0.5])
+        self.assertEqual(self.route.version, version)
+
+    def test_invalid_operations_are_rejected(self):
+        for operation in [
+            {'op': 'rotate'},
+            {'op': 'insert', 'index': 0},
+            {'op': 'insert', 'index': 0, 'points': [{'x': 1.5, 'y': 0.1}]},
+            {'op': 'delete', 'start': 3, 'end': 1},
+            {'op': 'update', 'index': 0},
+        ]:
+            response = self.edit([operation])
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, operation)
+        self.assertEqual(self.edit([]).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stale_version_is_a_conflict(self):
+        version = self.route.version
+        self.assertEqual(self.edit([{'op': 'delete', 'start': 0, 'end': 0}], version=version).status_code, 200)
+        response = self.edit([{'op': 'delete', 'start': 0, 'end': 0}], version=version)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['version'], version + 1)
+        self.assertEqual(self.stored_xs(), [0.1, 0.2, 0.3, 0.4, 0.5])
+
+    def test_another_users_route_returns_404(self):
+        url = reverse('route-points-list', kwargs={'route_pk': self.other_route.pk})
+        response = self.authenticated_client.patch(
+            url, {'operations': [{'op': 'insert', 'index': 0, 'points': [{'x': 0.1, 'y': 0.1}]}]}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(self.other_route.points.exists())
+
+class RoutePackedPointsApiTests(APITestCase):
+    """
+    Tests that Route.packed_points follows every point write made through the API
+    and can be served instead of the nested points.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='packeduser', password='testpassword')
+        self.authenticated_client = APIClient()
+        self.authenticated_client.force_authenticate(user=self.user)
+
+        bg_image = BackgroundImage.objects.create(
+            name='Packed Map',
+            image=SimpleUploadedFile(name='packed_map.jpg', content=b'fake image content', content_type='image/jpeg')
+        )
+        self.route = Route.objects.create(user=self.user, background_image=bg_image, name='Packed Route')
+        self.points_url = reverse('route-points-list', kwargs={'route_pk': self.route.pk})
+        self.detail_url = reverse('route-detail', kwargs={'pk': self.route.pk})
+
+    def packed_coords(self):
+        self.route.refresh_from_db()
+        return [round(value, 4) for value in unpack_points(self.route.packed_points)]
+
+    def test_packed_points_follow_point_writes(self):
+        """Create, bulk append, update, delete and range delete all keep the packed geometry in sync."""
+        self.authenticated_client.post(self.points_url, {'x': 0.1, 'y': 0.2}, format='json')
+        self.authenticated_client.post(
+            reverse('route-points-bulk', kwargs={'route_pk': self.route.pk}),
+            [{'x': 0.3, 'y': 0.4}, {'x': 0.5, 'y': 0.6}, {'x': 0.7, 'y': 0.8}],
+            format='json'
+        )
+        self.assertEqual(self.packed_coords(), [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8])
+        self.assertEqual(self.route.version, 2)
+
+        second_point = self.route.points.all()[1]
+        point_url = reverse('route-point-detail', kwargs={'route_pk': self.route.pk, 'pk': second_point.pk})
+        self.authenticated_client.patch(point_url, {'x': 0.9}, format='json')
+        self.assertEqual(self.packed_coords(), [0.1, 0.2, 0.9, 0.4, 0.5, 0.6, 0.7, 0.8])
+
+        self.authenticated_client.delete(point_url)
+        self.assertEqual(self.packed_coords(), [0.1, 0.2, 0.5, 0.6, 0.7, 0.8])
+
+        range_url = reverse('route-points-range', kwargs={'route_pk': self.route.pk})
+        self.authenticated_client.delete(f'{range_url}?start=0&end=1')
+        self.assertEqual(self.packed_coords(), [0.7, 0.8])
+        self.assertEqual(self.route.version, 5)
+
+    def test_route_edit_racing_an_append_keeps_the_points(self):
+        """
+        A route PATCH working on a copy read before an append must not write back
+        its stale next_rank and geometry: the next append would reuse a rank.
+        """
+        bulk_url = reverse('route-points-bulk', kwargs={'route_pk': self.route.pk})
+        self.authenticated_client.post(self.points_url, {'x': 0.1, 'y': 0.2}, format='json')
+        stale_route = Route.objects.get(pk=self.route.pk)
+        self.authenticated_client.post(bulk_url, [{'x': 0.3, 'y': 0.4}, {'x': 0.5, 'y': 0.6}], format='json')
+
+        # The PATCH gets the copy read before the append
+        with mock.patch.object(RouteViewSet, 'get_object', return_value=stale_route):
+            response = self.authenticated_client.patch(self.detail_url, {'name': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.authenticated_client.post(self.points_url, {'x': 0.7, 'y': 0.8}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.packed_coords(), [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8])
+        self.assertEqual(self.route.name, 'Renamed')
+        self.assertEqual(self.route.point_count, 4)
+        self.assertEqual(self.route.version, 3)
+
+    def test_point_writes_use_the_position_under_the_lock(self):
+        """
+        A point update or delete whose position was read before a point in front of it
+        was deleted still changes the right slot of the packed geometry.
+        """
+        self.authenticated_client.post(
+            reverse('route-points-bulk', kwargs={'route_pk': self.route.pk}),
+            [{'x': 0.1, 'y': 0.1}, {'x': 0.2, 'y': 0.2}, {'x': 0.3, 'y': 0.3}, {'x': 0.4, 'y': 0.4}],
+            format='json'
+        )
+        first, _, third, fourth = self.route.points.all()
+
+        def stale(point, position):
+            point.position = position # As read before the first point was deleted
+            return mock.patch.object(RoutePointViewSet, 'get_object', return_value=point)
+
+        self.authenticated_client.delete(
+            reverse('route-point-detail', kwargs={'route_pk': self.route.pk, 'pk': first.pk})
+        )
+        third_url = reverse('route-point-detail', kwargs={'route_pk': self.route.pk, 'pk': third.pk})
+        with stale(third, 2):
+            response = self.authenticated_client.patch(third_url, {'x': 0.9}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.packed_coords(), [0.2, 0.2, 0.9, 0.3, 0.4, 0.4])
+
+        fourth_url = reverse('route-point-detail', kwargs={'route_pk': self.route.pk, 'pk': fourth.pk})
+        with stale(fourth, 3):
+            response = self.authenticated_client.delete(fourth_url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.packed_coords(), [0.2, 0.2, 0.9, 0.3])
+
+        # A point deleted meanwhile is not written back
+        with stale(fourth, 2):
+            response = self.authenticated_client.patch(fourth_url, {'x': 0.5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.route.points.count(), 2)
+
+    def test_rebuild_packed_points_matches_rows(self):
+        """rebuild_packed_points recreates the geometry from the RoutePoint rows."""
+        RoutePoint.objects.create(route=self.route, x=0.25, y=0.5, order=1)
+        RoutePoint.objects.create(route=self.route, x=0.75, y=1.0, order=0)
+
+        self.route.rebuild_packed_points()
+
+        self.assertEqual(self.packed_coords(), [0.75, 1.0, 0.25, 0.5])
+
+    def test_retrieve_packed_points_skips_route_point_rows(self):
+        """?points=packed returns the base64 geometry without querying RoutePoint."""
+        self.authenticated_client.post(
+            reverse('route-points-bulk', kwargs={'route_pk': self.route.pk}),
+            [{'x': 0.5, 'y': 0.25}, {'x': 1.0, 'y': 0.0}],
+            format='json'
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authenticated_client.get(f'{self.detail_url}?points=packed')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('points', response.data)
+        self.assertEqual(response.data['version'], 1)
+        coords = unpack_points(base64.b64decode(response.data['packed_points']))
+        self.assertEqual(list(coords), [0.5, 0.25, 1.0, 0.0])
+        self.assertFalse(any('mapping_routepoint' in query['sql'] for query in queries.captured_queries))
+
+    def test_retrieve_defaults_to_nested_points(self):
+        """Without ?points= the nested points are returned and packed_points is left out."""
+        response = self.authenticated_client.get(self.detail_url)
+        self.assertIn('points', response.data)
+        self.assertNotIn('packed_points', response.data)
+
+
+class RouteListApiTests(APITestCase):
+    """
+    Tests for the cost and pagination of GET /api/routes/.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='listuser', password='testpassword')
+        self.authenticated_client = APIClient()
+        self.authenticated_client.force_authenticate(user=self.user)
+        self.list_url = reverse('route-list')
+
+        self.images = [
+            BackgroundImage.objects.create(
+                name=f'List Map {i}',
+                image=SimpleUploadedFile(name=f'list_map_{i}.jpg', content=b'fake image content', content_type='image/jpeg')
+            )
+            for i in range(3)
+        ]
+
+    def create_routes(self, count, points_per_route=3):
+        for i in range(count):
+            route = Route.objects.create(user=self.user, background_image=self.images[i % 3], name=f'Route {i}')
+            RoutePoint.objects.bulk_create(
+                RoutePoint(route=route, x=0.1 * j, y=0.1 * j, order=j) for j in range(points_per_route)
+            )
+
+    def test_list_query_count_does_not_grow_with_route_count(self):
+        """ETag query, routes + images in one query, renditions and points in one more each, for any page size."""
+        self.create_routes(2)
+        with self.assertNumQueries(4):
+            self.authenticated_client.get(self.list_url)
+
+        self.create_routes(30)
+        with self.assertNumQueries(4):
+            response = self.authenticated_client.get(self.list_url)
+        self.assertEqual(len(response.data['results']), 32)
+        self.assertEqual(len(response.data['results'][0]['points']), 3)
+
+    def test_list_without_points_skips_point_query(self):
+        """?points=none leaves points out and does not query them."""
+        self.create_routes(5)
+        with self.assertNumQueries(3):
+            response = self.authenticated_client.get(f'{self.list_url}?points=none')
+
+        first_route = response.data['results'][0]
+        self.assertNotIn('points', first_route)
+        self.assertNotIn('packed_points', first_route)
+        self.assertIn('background_image_details', first_route)
+
+    def test_cursor_pagination_walks_all_routes_newest_first(self):
+        """Following 'next' links visits every route exactly once, newest first."""
+        self.create_routes(7, points_per_route=0)
+
+        seen_ids = []
+        url = f'{self.list_url}?page_size=3&points=none'
+        while url:
+            response = self.authenticated_client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 3)
+            seen_ids.extend(route['id'] for route in response.data['results'])
+            url = response.data['next']
+
+        expected_ids = list(
+            Route.objects.filter(user=self.user).order_by('-created_at', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen_ids, expected_ids)
+
+
+class RouteConditionalGetApiTests(APITestCase):
+    """
+    Tests for ETag / Last-Modified and 304 responses on the route and point endpoints.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='pollinguser', password='testpassword')
+        self.authenticated_client = APIClient()
+        self.authenticated_client.force_authenticate(user=self.user)
+        self.bg_image = BackgroundImage.objects.create(
+            name='Polling Map',
+            image=SimpleUploadedFile(name='polling_map.jpg', content=b'fake image content', content_type='image/jpeg')
+        )
+        self.route = Route.objects.create(user=self.user, background_image=self.bg_image, name='Polled Route')
+        self.list_url = reverse('route-list')
+        self.detail_url = reverse('route-detail', kwargs={'pk': self.route.pk})
+        self.points_url = reverse('route-points-list', kwargs={'route_pk': self.route.pk})
+        self.authenticated_client.post(self.points_url, {'x': 0.1, 'y': 0.2}, format='json')
+
+    def test_unchanged_route_answers_304_with_a_single_query(self):
+        response = self.authenticated_client.get(self.detail_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"') and not etag.startswith('W/')) # Strong ETag
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            response = self.authenticated_client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_point_changes_change_the_route_and_points_etags(self):
+        route_etag = self.authenticated_client.get(self.detail_url)['ETag']
+        points_etag = self.authenticated_client.get(self.points_url)['ETag']
+
+        self.authenticated_client.post(self.points_url, {'x': 0.3, 'y': 0.4}, format='json')
+
+        response = self.authenticated_client.get(self.detail_url, HTTP_IF_NONE_MATCH=route_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['points']), 2)
+        response = self.authenticated_client.get(self.points_url, HTTP_IF_NONE_MATCH=points_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+    def test_renaming_the_route_changes_the_etag(self):
+        etag = self.authenticated_client.get(self.detail_url)['ETag']
+        self.authenticated_client.patch(self.detail_url, {'name': 'Renamed Route'}, format='json')
+        response = self.authenticated_client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Renamed Route')
+
+    def test_each_representation_has_its_own_etag(self):
+        full = self.authenticated_client.get(self.detail_url)['ETag']
+        without_points = self.authenticated_client.get(f'{self.detail_url}?points=none')['ETag']
+        self.assertNotEqual(full, without_points)
+        response = self.authenticated_client.get(f'{self.detail_url}?points=none', HTTP_IF_NONE_MATCH=full)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_route_list_304_until_a_route_is_added_or_deleted(self):
+        etag = self.authenticated_client.get(self.list_url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.authenticated_client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        other = Route.objects.create(user=self.user, background_image=self.bg_image, name='Second Route')
+        response = self.authenticated_client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        etag = response['ETag']
+        other.delete()
+        response = self.authenticated_client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_new_renditions_change_the_route_etag(self):
+        """The embedded background image is part of the route's representation."""
+        from django.utils import timezone
+        from datetime import timedelta
+
+        etag = self.authenticated_client.get(self.detail_url)['ETag']
+        BackgroundImage.objects.filter(pk=self.bg_image.pk).update(updated_at=timezone.now() + timedelta(seconds=1))
+        response = self.authenticated_client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_if_modified_since(self):
+        last_modified = self.authenticated_client.get(self.points_url)['Last-Modified']
+        response = self.authenticated_client.get(self.points_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_other_users_route_is_still_404(self):
+        other_user = User.objects.create_user(username='otherpoller', password='testpassword')
+        other_client = APIClient()
+        other_client.force_authenticate(user=other_user)
+        response = other_client.get(self.detail_url, HTTP_IF_NONE_MATCH='"anything"')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RouteExportApiTests(RouteApiFixtures, APITestCase):
+    """
+    Tests for the streaming export GET /api/routes/export/.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.export_url = reverse('route-export')
+
+        self.line = self.create_route([(0.1, 0.2), (0.3, 0.4), (0.5, 0.25)], name='Line, with comma')
+        self.single = self.create_route([(0.75, 0.5)], name='Single')
+        self.empty = self.create_route([], name='Empty')
+
+        other_user = User.objects.create_user(username='otherexporter', password='testpassword')
+        Route.objects.create(user=other_user, background_image=self.bg_image, name='Not Mine')
+
+    def export(self, export_format=None):
+        url = self.export_url if export_format is None else f'{self.export_url}?export_format={export_format}'
+        response = self.authenticated_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_geojson_is_the_default(self):
+        import json
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        self.assertIn('routes.geojson', response['Content-Disposition'])
+
+        collection = json.loads(content)
+        self.assertEqual(collection['type'], 'FeatureCollection')
+        features = {feature['properties']['name']: feature for feature in collection['features']}
+        self.assertEqual(set(features), {'Line, with comma', 'Single', 'Empty'})
+        self.assertEqual(features['Line, with comma']['geometry'], {
+            'type': 'LineString', 'coordinates': [[0.1, 0.2], [0.3, 0.4], [0.5, 0.25]],
+        })
+        self.assertEqual(features['Single']['geometry'], {'type': 'Point', 'coordinates': [0.75, 0.5]})
+        self.assertIsNone(features['Empty']['geometry'])
+        self.assertEqual(features['Single']['properties']['background_image'], self.bg_image.slug)
+
+    def test_geojson_geometry_follows_the_packed_points(self):
+        """A point_count out of step with the geometry does not break the stream."""
+        import json
+        Route.objects.filter(pk=self.empty.pk).update(point_count=1)
+        Route.objects.filter(pk=self.single.pk).update(point_count=0)
+
+        collection = json.loads(self.export()[1])
+
+        features = {feature['properties']['name']: feature for feature in collection['features']}
+        self.assertIsNone(features['Empty']['geometry'])
+        self.assertEqual(features['Single']['geometry'], {'type': 'Point', 'coordinates': [0.75, 0.5]})
+
+    def test_ndjson_has_one_route_per_line(self):
+        import json
+        response, content = self.export('ndjson')
+        lines = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(lines), 3)
+        by_name = {line['name']: line for line in lines}
+        self.assertEqual(by_name['Line, with comma']['points'], [[0.1, 0.2], [0.3, 0.4], [0.5, 0.25]])
+        self.assertEqual(by_name['Empty']['points'], [])
+
+    def test_csv_has_one_row_per_point(self):
+        import csv
+        response, content = self.export('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0], ['route_id', 'route_name', 'background_image', 'order', 'x', 'y'])
+        self.assertEqual(len(rows), 1 + 4)
+        self.assertIn([str(self.line.pk), 'Line, with comma', self.bg_image.slug, '2', '0.5', '0.25'], rows)
+
+    def test_long_routes_are_exported_completely(self):
+        import json
+        from array import array
+        from . import export
+        route = self.create_route([(i / 2500, 0.5) for i in range(2500)], name='Long')
+        self.assertLess(export.COORDINATE_CHUNK, 2500) # Spread over several output pieces
+
+        response, content = self.export('ndjson')
+        long_line = next(json.loads(line) for line in content.splitlines() if json.loads(line)['id'] == route.pk)
+        self.assertEqual(len(long_line['points']), 2500)
+        stored_x = array('f', [1234 / 2500])[0] # Exported from the float32 packed geometry
+        self.assertEqual(long_line['points'][1234][0], round(stored_x, 7))
+
+    def test_export_is_a_single_query(self):
+        for i in range(20):
+            self.create_route([(0.1, 0.1), (0.2, 0.2)], name=f'Extra {i}')
+        with self.assertNumQueries(1):
+            response = self.authenticated_client.get(self.export_url)
+            b''.join(response.streaming_content)
+
+    def test_metric_filters_apply(self):
+        import json
+        response = self.authenticated_client.get(f'{self.export_url}?export_format=ndjson&point_count_min=2')
+        names = [json.loads(line)['name'] for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(names, ['Line, with comma'])
+
+    def test_unknown_format_is_rejected(self):
+        response = self.authenticated_client.get(f'{self.export_url}?export_format=xml')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+class RouteImportApiTests(APITestCase):
+    """
+    Tests for the bulk import POST /api/routes/import/ and the import_routes command.
+    """
+
+    GPX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk><name>Morning Walk</name><trkseg>
+    <trkpt lat="52.0" lon="21.0"><ele>100</ele><name>Start</name></trkpt>
+    <trkpt lat="52.1" lon="21.1"></trkpt>
+  </trkseg><trkseg>
+    <trkpt lat="52.2" lon="21.2"></trkpt>
+  </trkseg></trk>
+  <rte><rtept lat="52.1" lon="21.2"/><rtept lat="52.0" lon="21.1"/></rte>
+</gpx>
+"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='importuser', password='testpassword')
+        self.authenticated_client = APIClient()
+        self.authenticated_client.force_authenticate(user=self.user)
+        self.bg_image = BackgroundImage.objects.create(
+            name='Import Map',
+            image=SimpleUploadedFile(name='import_map.jpg', content=b'fake image content', content_type='image/jpeg')
+        )
+        self.import_url = reverse('route-import-file')
+
+    def upload(self, name, content, **fields):
+        upload = SimpleUploadedFile(name=name, content=content)
+        return self.authenticated_client.post(
+            self.import_url, {'file': upload, 'background_image_id': self.bg_image.pk, **fields}, format='multipart'
+        )
+
+    def assertPoints(self, route, expected):
+        self.assertEqual(
+            [(round(point.x, 5), round(point.y, 5)) for point in route.points.order_by('order')],
+            [(round(x, 5), round(y, 5)) for x, y in expected],
+        )
+
+    def test_gpx_fit_stretches_the_tracks_over_the_image(self):
+        response = self.upload('walk.gpx', self.GPX)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['routes'], 2)
+        self.assertEqual(response.data['points'], 5)
+
+        walk, second = Route.objects.filter(pk__in=response.data['route_ids']).order_by('pk')
+        self.assertEqual(walk.name, 'Morning Walk') # Point names are not the track name
+        self.assertEqual(second.name, 'Track 2')
+        self.assertEqual(walk.user, self.user)
+        # Both segments of the track are one route; north is at the top of the image
+        self.assertPoints(walk, [(0.0, 1.0), (0.5, 0.5), (1.0, 0.0)])
+        self.assertPoints(second, [(1.0, 0.5), (0.5, 1.0)])
+
+    def test_gpx_with_bounds(self):
+        response = self.upload('walk.gpx', self.GPX, frame='bounds', bounds='20.8,51.8,21.2,52.2')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        walk = Route.objects.get(name='Morning Walk')
+        self.assertPoints(walk, [(0.5, 0.5), (0.75, 0.25), (1.0, 0.0)])
+
+    def test_packed_points_and_metrics_are_built(self):
+        response = self.upload('walk.gpx', self.GPX)
+        walk = Route.objects.get(pk=response.data['route_ids'][0])
+        self.assertEqual(walk.point_count, 3)
+        self.assertEqual(len(unpack_points(walk.packed_points)), 6)
+        self.assertAlmostEqual(walk.length, 2 * (0.5 ** 2 * 2) ** 0.5, places=5)
+        self.assertTrue(walk.segment_cells.exists())
+
+    def test_geojson_export_round_trip(self):
+        route = Route.objects.create(user=self.user, background_image=self.bg_image, name='Original')
+        RoutePoint.objects.bulk_create(
+            RoutePoint(route=route, x=x, y=y, order=i) for i, (x, y) in enumerate([(0.1, 0.2), (0.3, 0.4), (0.5, 0.25)])
+        )
+        route.rebuild_packed_points()
+        exported = b''.join(self.authenticated_client.get(reverse('route-export')).streaming_content)
+
+        response = self.upload('routes.geojson', exported)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        copy = Route.objects.get(pk=response.data['route_ids'][0])
+        self.assertEqual(copy.name, 'Original')
+        self.assertPoints(copy, [(0.1, 0.2), (0.3, 0.4), (0.5, 0.25)])
+
+    def test_geojson_features_key_only_counts_at_the_top_level(self):
+        """A "features" key in a nested object or a string before the real array is skipped."""
+        import json
+        from . import importers
+        collection = {
+            'metadata': {'note': 'escaped \\"features\\": [', 'features': [{'type': 'Feature', 'geometry': None}]},
+            'title': '"features"',
+            'type': 'FeatureCollection',
+            'features': [{
+                'type': 'Feature', 'properties': {'name': 'Real'},
+                'geometry': {'type': 'LineString', 'coordinates': [[0.1, 0.2], [0.3, 0.4]]},
+            }],
+        }
+        with mock.patch.object(importers, 'READ_SIZE', 16): # Keys and strings split across reads
+            response = self.upload('routes.geojson', json.dumps(collection).encode('utf-8'))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['routes'], 1)
+        route = Route.objects.get(pk=response.data['route_ids'][0])
+        self.assertEqual(route.name, 'Real')
+        self.assertPoints(route, [(0.1, 0.2), (0.3, 0.4)])
+
+    def test_csv_export_round_trip_in_several_chunks(self):
+        from . import importers
+        route = Route.objects.create(user=self.user, background_image=self.bg_image, name='Long, with comma')
+        points = [(i / 30, 1 - i / 30) for i in range(30)]
+        RoutePoint.objects.bulk_create(RoutePoint(route=route, x=x, y=y, order=i) for i, (x, y) in enumerate(points))
+        route.rebuild_packed_points()
+        exported = b''.join(
+            self.authenticated_client.get(reverse('route-export') + '?export_format=csv').streaming_content
+        )
+
+        original_chunk_size = importers.IMPORT_CHUNK_SIZE
+        try:
+            importers.IMPORT_CHUNK_SIZE = 7
+            response = self.upload('routes.csv', exported)
+        finally:
+            importers.IMPORT_CHUNK_SIZE = original_chunk_size
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        copy = Route.objects.get(pk=response.data['route_ids'][0])
+        self.assertEqual(copy.name, 'Long, with comma')
+        # Ranks continue evenly across the chunks
+        self.assertEqual(list(copy.points.values_list('order', flat=True)), [RANK_GAP * (i + 1) for i in range(30)])
+        self.assertPoints(copy, points)
+
+    def test_csv_pixel_frame(self):
+        self.bg_image.width, self.bg_image.height = 200, 100
+        self.bg_image.save()
+        response = self.upload('points.csv', b'x,y\n20,10\n100,50\n', frame='pixels')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertPoints(Route.objects.get(pk=response.data['route_ids'][0]), [(0.1, 0.1), (0.5, 0.5)])
+
+    def test_points_outside_the_image_roll_back_the_whole_import(self):
+        content = b'route_id,x,y\n1,0.1,0.1\n1,0.2,0.2\n2,0.3,0.3\n2,1.5,0.3\n'
+        response = self.upload('points.csv', content)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('outside the image', response.data['file'][0])
+        self.assertFalse(Route.objects.exists())
+        self.assertFalse(RoutePoint.objects.exists())
+
+    def test_invalid_requests_are_rejected(self):
+        self.assertEqual(self.upload('walk.txt', self.GPX).status_code, status.HTTP_400_BAD_REQUEST) # Unknown format
+        self.assertEqual(self.upload('walk.gpx', b'<gpx><trk>').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.upload('walk.gpx', self.GPX, frame='bounds').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.upload('points.csv', b'a,b\n1,2\n').status_code, status.HTTP_400_BAD_REQUEST)
+        for features in (b'[null]', b'[1]'): # Not feature objects
+            response = self.upload('routes.geojson', b'{"type": "FeatureCollection", "features": ' + features + b'}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Route.objects.exists())
+
+    def test_unauthenticated_import_is_rejected(self):
+        upload = SimpleUploadedFile(name='walk.gpx', content=self.GPX)
+        response = APIClient().post(
+            self.import_url, {'file': upload, 'background_image_id': self.bg_image.pk}, format='multipart'
+        )
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+    def test_management_command(self):
+        import os
+        import tempfile
+        with tempfile.NamedTemporaryFile(suffix='.gpx', delete=False) as gpx_file:
+            gpx_file.write(self.GPX)
+        self.addCleanup(os.remove, gpx_file.name)
+
+        out = StringIO()
+        call_command('import_routes', gpx_file.name, user='importuser', image=self.bg_image.slug, stdout=out)
+        self.assertIn('Imported 2 routes with 5 points', out.getvalue())
+        self.assertEqual(Route.objects.filter(user=self.user).count(), 2)
+
+class RouteSimplificationApiTests(APITestCase):
+    """
+    Tests for the level-of-detail parameters (?tolerance= / ?max_points=)
+    on GET /api/routes/{id}/ and GET /api/routes/{route_pk}/points/.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='loduser', password='testpassword')
+        self.authenticated_client = APIClient()
+        self.authenticated_client.force_authenticate(user=self.user)
+
+        bg_image = BackgroundImage.objects.create(
+            name='LOD Map',
+            image=SimpleUploadedFile(name='lod_map.jpg', content=b'fake image content', content_type='image/jpeg')
+        )
+        self.route = Route.objects.create(user=self.user, background_image=bg_image, name='Dense Route')
+        # A dense straight line with a single spike in the middle
+        data = [{'x': i / 200, 'y': 0.5} for i in range(201)]
+        data[100]['y'] = 0.9
+        self.authenticated_client.post(
+            reverse('route-points-bulk', kwargs={'route_pk': self.route.pk}), data, format='json'
+        )
+        self.detail_url = reverse('route-detail', kwargs={'pk': self.route.pk})
+        self.points_url = reverse('route-points-list', kwargs={'route_pk': self.route.pk})
+
+    def test_retrieve_with_tolerance_returns_simplified_points(self):
+        response = self.authenticated_client.get(f'{self.detail_url}?tolerance=0.01')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['order'] for p in response.data['points']], [0, 99, 100, 101, 200])
+        self.assertEqual(response.data['points'][2], {'order': 100, 'x': 0.5, 'y': 0.9})
+
+    def test_points_list_with_max_points(self):
+        response = self.authenticated_client.get(f'{self.points_url}?max_points=3')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['order'] for p in response.data], [0, 100, 200])
+
+    def test_simplified_retrieve_does_not_load_point_rows(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.authenticated_client.get(f'{self.detail_url}?max_points=10')
+        self.assertFalse(any('mapping_routepoint' in query['sql'] for query in queries.captured_queries))
+
+    def test_simplification_follows_route_changes(self):
+        """Cached results are keyed by route version, so edits are reflected immediately."""
+        self.authenticated_client.get(f'{self.points_url}?max_points=3')
+        spike = self.route.points.all()[100]
+        self.authenticated_client.delete(
+            reverse('route-point-detail', kwargs={'route_pk': self.route.pk, 'pk': spike.pk})
+        )
+
+        response = self.authenticated_client.get(f'{self.points_url}?max_points=3')
+        self.assertEqual(len(response.data), 3)
+        self.assertTrue(all(p['y'] == 0.5 for p in response.data))
+
+    def test_invalid_tolerance_returns_400(self):
+        response = self.authenticated_client.get(f'{self.points_url}?tolerance=-1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CompactEncodingApiTests(APITestCase):
+    """
+    Tests for the compact encodings (columnar JSON, polyline, MessagePack) of
+    GET /api/routes/{route_pk}/points/ and the route endpoints.
+    """
+
+    def setUp(self):
+        # Simplified routes are cached by route id and version, which the test database reuses
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='compactuser', password='testpassword')
+        self.authenticated_client = APIClient()
+        self.authenticated_client.force_authenticate(user=self.user)
+
+        bg_image = BackgroundImage.objects.create(
+            name='Compact Map',
+            image=SimpleUploadedFile(name='compact_map.jpg', content=b'fake image content', content_type='image/jpeg')
+        )
+        self.route = Route.objects.create(user=self.user, background_image=bg_image, name='Long Route')
+        # A wiggly line, like a traced path
+        self.coords = [(0.1 + i * 0.002, 0.5 + (i % 7) * 0.0013) for i in range(300)]
+        self.authenticated_client.post(
+            reverse('route-points-bulk', kwargs={'route_pk': self.route.pk}),
+            [{'x': x, 'y': y} for x, y in self.coords], format='json'
+        )
+        self.route.refresh_from_db()
+        self.detail_url = reverse('route-detail', kwargs={'pk': self.route.pk})
+        self.points_url = reverse('route-points-list', kwargs={'route_pk': self.route.pk})
+
+    def test_columnar_points_match_the_json_points(self):
+        points = self.authenticated_client.get(self.points_url).data
+        response = self.authenticated_client.get(
+            self.points_url, HTTP_ACCEPT='application/vnd.route-mapper.columnar+json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/vnd.route-mapper.columnar+json')
+        self.assertIn('Accept', response['Vary'])
+        data = response.json()
+        self.assertEqual(data['route'], self.route.pk)
+        self.assertEqual(data['version'], self.route.version)
+        self.assertEqual(data['count'], 300)
+        self.assertEqual(data['ids'], [p['id'] for p in points])
+        # Rounded to 7 decimals, like the other compact responses
+        self.assertEqual(data['xs'], [round(p['x'], 7) for p in points])
+        self.assertEqual(data['ys'], [round(p['y'], 7) for p in points])
+
+    def test_polyline_round_trip_and_size(self):
+        json_size = len(self.authenticated_client.get(self.points_url).content)
+        response = self.authenticated_client.get(f'{self.points_url}?format=polyline')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['precision'], 6)
+        decoded = decode_polyline(data['polyline'], data['precision'])
+        self.assertEqual(len(decoded), 300)
+        for (x, y), (expected_x, expected_y) in zip(decoded, self.coords):
+            self.assertAlmostEqual(x, expected_x, places=6)
+            self.assertAlmostEqual(y, expected_y, places=6)
+        # Ids included, still at least 5 times smaller than the JSON objects
+        self.assertLess(len(response.content) * 5, json_size)
+
+    def test_polyline_precision(self):
+        response = self.authenticated_client.get(f'{self.points_url}?format=polyline&precision=3')
+        decoded = decode_polyline(response.json()['polyline'], 3)
+        self.assertEqual(decoded[1], [0.102, 0.501])
+
+        response = self.authenticated_client.get(f'{self.points_url}?format=polyline&precision=9')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack_points(self):
+        response = self.authenticated_client.get(self.points_url, HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        data = msgpack.unpackb(response.content)
+        self.assertEqual(data['ids'], list(self.route.points.values_list('id', flat=True)))
+        xs = array('f', data['xs'])
+        self.assertEqual(list(xs), list(unpack_points(self.route.packed_points)[::2]))
+
+    def test_compact_route_uses_the_packed_geometry(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authenticated_client.get(f'{self.detail_url}?format=columnar')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertNotIn('points', data)
+        self.assertEqual(data['name'], 'Long Route')
+        self.assertEqual(len(data['xs']), 300)
+        self.assertAlmostEqual(data['ys'][3], self.coords[3][1], places=6)
+        self.assertFalse(any('mapping_routepoint' in query['sql'] for query in queries.captured_queries))
+
+    def test_compact_route_list(self):
+        response = self.authenticated_client.get(reverse('route-list') + '?format=polyline')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        route_data = response.json()['results'][0]
+        self.assertEqual(len(decode_polyline(route_data['polyline'])), 300)
+
+    def test_simplified_compact_points_list_their_positions(self):
+        points = self.authenticated_client.get(f'{self.points_url}?max_points=3').data
+        response = self.authenticated_client.get(f'{self.points_url}?format=columnar&max_points=3')
+
+        data = response.json()
+        self.assertEqual(data['orders'], [p['order'] for p in points])
+        self.assertEqual(data['xs'], [p['x'] for p in points])
+        self.assertNotIn('ids', data)
+
+    def test_each_encoding_has_its_own_etag(self):
+        json_etag = self.authenticated_client.get(self.points_url)['ETag']
+        columnar = self.authenticated_client.get(f'{self.points_url}?format=columnar')
+        self.assertNotEqual(columnar['ETag'], json_etag)
+
+        response = self.authenticated_client.get(
+            f'{self.points_url}?format=columnar', HTTP_IF_NONE_MATCH=columnar['ETag']
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_single_point_is_not_offered_compact(self):
+        point = self.route.points.first()
+        url = reverse('route-point-detail', kwargs={'route_pk': self.route.pk, 'pk': point.pk})
+
+        response = self.authenticated_client.get(url, HTTP_ACCEPT='application/vnd.route-mapper.polyline+json')
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+
+
+class RouteMetricsApiTests(APITestCase):
+    """
+    Tests for the denormalized route metrics: maintenance on point writes,
+    filtering/ordering on /api/routes/ and the backfill_route_metrics command.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='metricsuser', password='testpassword')
+        self.authenticated_client = APIClient()
+        self.authenticated_client.force_authenticate(user=self.user)
+
+        self.bg_image = BackgroundImage.objects.create(
+            name='Metrics Map',
+            image=SimpleUploadedFile(name='metrics_map.jpg', content=b'fake image content', content_type='image/jpeg')
+        )
+        # The dummy file is not a real image, so give the image a known size directly
+        BackgroundImage.objects.filter(pk=self.bg_image.pk).update(width=200, height=100)
+        self.route = Route.objects.create(user=self.user, background_image=self.bg_image, name='Measured Route')
+        self.list_url = reverse('route-list')
+
+    def append(self, route, points):
+        return self.authenticated_client.post(
+            reverse('route-points-bulk', kwargs={'route_pk': route.pk}),
+            [{'x': x, 'y': y} for x, y in points], format='json'
+        )
+
+    def test_metrics_follow_point_writes(self):
+        self.append(self.route, [(0.0, 0.0), (0.5, 0.0)])
+        self.authenticated_client.post(
+            reverse('route-points-list', kwargs={'route_pk': self.route.pk}), {'x': 0.5, 'y': 0.5}, format='json'
+        )
+        self.route.refresh_from_db()
+        self.assertEqual(self.route.point_count, 3)
+        self.assertAlmostEqual(self.route.length, 1.0)
+        self.assertAlmostEqual(self.route.length_px, 0.5 * 200 + 0.5 * 100)
+        self.assertEqual((self.route.min_x, self.route.min_y, self.route.max_x, self.route.max_y), (0.0, 0.0, 0.5, 0.5))
+
+        first_point = self.route.points.all()[0]
+        self.authenticated_client.delete(
+            reverse('route-point-detail', kwargs={'route_pk': self.route.pk, 'pk': first_point.pk})
+        )
+        self.route.refresh_from_db()
+        self.assertEqual(self.route.point_count, 2)
+        self.assertAlmostEqual(self.route.length, 0.5)
+        self.assertEqual((self.route.min_x, self.route.min_y), (0.5, 0.0))
+
+    def test_filter_and_order_routes_by_metrics(self):
+        short_route = self.route
+        long_route = Route.objects.create(user=self.user, background_image=self.bg_image, name='Long Route')
+        self.append(short_route, [(0.0, 0.0), (0.1, 0.0)])
+        self.append(long_route, [(0.5, 0.5), (0.5, 1.0), (1.0, 1.0)])
+
+        response = self.authenticated_client.get(f'{self.list_url}?points=none&length_min=0.5')
+        self.assertEqual([r['id'] for r in response.data['results']], [long_route.pk])
+
+        response = self.authenticated_client.get(f'{self.list_url}?points=none&bbox=0,0,0.2,0.2')
+        self.assertEqual([r['id'] for r in response.data['results']], [short_route.pk])
+
+        response = self.authenticated_client.get(f'{self.list_url}?points=none&ordering=-length')
+        self.assertEqual([r['id'] for r in response.data['results']], [long_route.pk, short_route.pk])
+        self.assertEqual(response.data['results'][0]['point_count'], 3)
+
+    def test_invalid_bbox_returns_400(self):
+        response = self.authenticated_client.get(f'{self.list_url}?bbox=1,2,3')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_backfill_command_recomputes_metrics_from_rows(self):
+        RoutePoint.objects.bulk_create([
+            RoutePoint(route=self.route, x=0.0, y=0.0, order=0),
+            RoutePoint(route=self.route, x=0.0, y=0.5, order=1),
+        ])
+
+        call_command('backfill_route_metrics', batch_size=1, stdout=StringIO())
+
+        self.route.refresh_from_db()
+        self.assertEqual(self.route.point_count, 2)
+        self.assertAlmostEqual(self.route.length, 0.5)
+        self.assertAlmostEqual(self.route.length_px, 50.0)
+        self.assertEqual(list(unpack_points(self.route.packed_points)), [0.0, 0.0, 0.0, 0.5])
+
+
+class RoutesNearApiTests(RouteApiFixtures, APITestCase):
+    """
+    Tests for GET /api/images/{slug}/routes-near/ and the spatial index behind it.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.another_user = User.objects.create_user(username='othernearuser', password='testpassword')
+        self.other_image = BackgroundImage.objects.create(
+            name='Other Near Map',
+            image=SimpleUploadedFile(name='other_near_map.jpg', content=b'fake image content', content_type='image/jpeg')
+        )
+        self.near_url = reverse('image-routes-near', kwargs={'slug': self.bg_image.slug})
+
+    def near(self, x, y, r):
+        response = self.authenticated_client.get(f'{self.near_url}?x={x}&y={y}&r={r}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [result['id'] for result in response.data]
+
+    def test_finds_routes_whose_segments_pass_nearby(self):
+        """A long diagonal segment is found near its middle, far from any stored point."""
+        diagonal = self.create_route([(0.0, 0.0), (1.0, 1.0)], name='Diagonal')
+        horizontal = self.create_route([(0.0, 0.9), (1.0, 0.9)], name='Horizontal')
+
+        self.assertEqual(self.near(0.52, 0.5, 0.05), [diagonal.pk])
+        self.assertEqual(self.near(0.5, 0.85, 0.06), [horizontal.pk])
+        self.assertEqual(self.near(0.5, 0.7, 0.25), [diagonal.pk, horizontal.pk]) # Sorted by distance
+        self.assertEqual(self.near(0.9, 0.1, 0.1), [])
+
+    def test_only_own_routes_on_this_image(self):
+        self.create_route([(0.4, 0.5), (0.6, 0.5)], user=self.another_user)
+        self.create_route([(0.4, 0.5), (0.6, 0.5)], image=self.other_image)
+        self.assertEqual(self.near(0.5, 0.5, 0.1), [])
+
+    def test_index_follows_point_deletes(self):
+        route = self.create_route([(0.1, 0.1), (0.9, 0.9), (0.1, 0.9)])
+        self.assertEqual(self.near(0.5, 0.9, 0.05), [route.pk])
+
+        last_point = route.points.all()[2]
+        self.authenticated_client.delete(
+            reverse('route-point-detail', kwargs={'route_pk': route.pk, 'pk': last_point.pk})
+        )
+
+        self.assertEqual(self.near(0.5, 0.9, 0.05), [])
+        self.assertEqual(self.near(0.5, 0.5, 0.05), [route.pk])
+
+    def test_index_follows_route_image_change(self):
+        route = self.create_route([(0.4, 0.5), (0.6, 0.5)])
+        self.authenticated_client.patch(
+            reverse('route-detail', kwargs={'pk': route.pk}), {'background_image_id': self.other_image.pk}, format='json'
+        )
+        self.assertEqual(self.near(0.5, 0.5, 0.1), [])
+
+    def test_invalid_query_returns_400(self):
+        response = self.authenticated_client.get(f'{self.near_url}?x=0.5&y=2&r=0.1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImageHeatmapApiTests(RouteApiFixtures, APITestCase):
+    """
+    Tests for GET /api/images/{slug}/heatmap/ and the density grid behind it.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.another_user = User.objects.create_user(username='otherheatuser', password='testpassword')
+        self.heatmap_url = reverse('image-heatmap', kwargs={'slug': self.bg_image.slug})
+
+    def get_grid(self, query='?resolution=64'):
+        response = self.authenticated_client.get(self.heatmap_url + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        resolution = response.data['resolution']
+        cells = array('f', base64.b64decode(response.data['grid']))
+        self.assertEqual(len(cells), resolution * resolution)
+        return response.data, [cells[row * resolution:(row + 1) * resolution] for row in range(resolution)]
+
+    def test_rasterize_counts_passes_per_cell(self):
+        # A horizontal line across the middle row, walked there and back
+        cells = rasterize([0.0, 0.5, 1.0, 0.5, 0.0, 0.5], 4)
+        self.assertEqual(cells.reshape(4, 4)[2].tolist(), [2.0, 2.0, 2.0, 2.0])
+        self.assertEqual(cells.sum(), 8.0)
+        self.assertEqual(rasterize([0.5, 0.5], 4).sum(), 0.0)
+
+    def test_grid_adds_up_all_users_routes(self):
+        self.create_route([(0.0, 0.25), (1.0, 0.25)])
+        self.create_route([(0.0, 0.25), (1.0, 0.25)], user=self.another_user)
+        self.create_route([(0.75, 0.0), (0.75, 1.0)], user=self.another_user)
+
+        data, rows = self.get_grid()
+
+        self.assertEqual(data['routes'], 3)
+        self.assertAlmostEqual(rows[16][10], 2.0, places=5) # Both horizontal routes
+        self.assertAlmostEqual(rows[40][48], 1.0, places=5) # The vertical one
+        self.assertAlmostEqual(rows[16][48], 3.0, places=5) # Where they cross
+        self.assertEqual(rows[40][10], 0.0)
+        self.assertAlmostEqual(data['max_value'], 3.0, places=5)
+
+    def test_grid_is_only_rebuilt_when_dirty(self):
+        route = self.create_route([(0.0, 0.25), (1.0, 0.25)])
+        self.get_grid()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.get_grid()
+        self.assertFalse(any('packed_points' in query['sql'] for query in queries.captured_queries))
+
+        # A point write makes the grid dirty
+        self.authenticated_client.post(
+            reverse('route-points-list', kwargs={'route_pk': route.pk}), {'x': 1.0, 'y': 0.75}, format='json'
+        )
+        _, rows = self.get_grid()
+        self.assertAlmostEqual(rows[40][63], 1.0, places=5)
+
+        # So does deleting a route
+        route.delete()
+        data, rows = self.get_grid()
+        self.assertEqual(data['routes'], 0)
+        self.assertEqual(data['max_value'], 0.0)
+        self.assertEqual(ImageHeatmap.objects.filter(background_image=self.bg_image).count(), 1)
+
+    def test_waiting_request_reuses_the_rebuilt_grid(self):
+        """A request that finds the grid dirty, then fresh once it holds the row lock, does not build it again."""
+        from . import heatmaps
+        from .models import RouteQuerySet
+
+        self.create_route([(0.0, 0.25), (1.0, 0.25)])
+        self.get_grid()
+        heatmap = ImageHeatmap.objects.get(background_image=self.bg_image)
+
+        # Dirty before the lock, rebuilt by the request holding it by the time we get it
+        with mock.patch.object(RouteQuerySet, 'state', side_effect=['changed', heatmap.routes_state]), \
+             mock.patch.object(heatmaps, 'build_grid') as build_grid:
+            self.assertEqual(heatmaps.get_heatmap(self.bg_image, 64).pk, heatmap.pk)
+        build_grid.assert_not_called()
+
+    def test_png_overlay(self):
+        self.create_route([(0.0, 0.25), (1.0, 0.25)])
+
+        response = self.authenticated_client.get(f'{self.heatmap_url}?resolution=128', HTTP_ACCEPT='image/png')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        with Image.open(BytesIO(response.content)) as overlay:
+            self.assertEqual((overlay.mode, overlay.size), ('RGBA', (128, 128)))
+            self.assertEqual(overlay.getpixel((10, 32))[3], 255) # The route
+            self.assertEqual(overlay.getpixel((10, 90))[3], 0) # Nothing there
+
+    def test_unchanged_heatmap_answers_304(self):
+        self.create_route([(0.0, 0.25), (1.0, 0.25)])
+        etag = self.authenticated_client.get(self.heatmap_url)['ETag']
+
+        response = self.authenticated_client.get(self.heatmap_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_invalid_requests(self):
+        response = self.authenticated_client.get(f'{self.heatmap_url}?resolution=100', HTTP_ACCEPT='image/png')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('resolution', response.json())
+
+        response = self.authenticated_client.get(reverse('image-heatmap', kwargs={'slug': 'no-such-image'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = APIClient().get(self.heatmap_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class BenchmarkApiTests(APITestCase):
+    """
+    Tests for the benchmark suite (mapping/benchmarks/) and the benchmark_api command.
+    """
+
+    def test_generated_dataset_matches_the_api_state(self):
+        from .benchmarks import generate_dataset
+
+        dataset = generate_dataset(users=2, routes_per_user=3, points_per_route=25, images=2)
+
+        self.assertEqual(dataset.summary()['points'], 150)
+        self.assertEqual(len(dataset.routes_of(dataset.users[0])), 3)
+        for route in Route.objects.filter(pk__in=[route.pk for route in dataset.routes]):
+            # Packed geometry, metrics and next_rank as if the points had been posted
+            self.assertEqual(
+                unpack_points(route.packed_points).tolist(),
+                flatten_points(route.points.values_list('x', 'y')).tolist(),
+            )
+            self.assertEqual(route.point_count, 25)
+            self.assertGreater(route.next_rank, route.points.last().order)
+            self.assertTrue(route.segment_cells.exists())
+
+    def test_command_writes_json_results_and_leaves_no_data(self):
+        import json
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = f'{directory}/results.json'
+            call_command(
+                'benchmark_api', users=2, routes=2, points=20, images=1, repeat=3, warmup=1,
+                output=output, stdout=StringIO(),
+            )
+            with open(output) as output_file:
+                report = json.load(output_file)
+
+            # A second run compared with the first one
+            out = StringIO()
+            call_command(
+                'benchmark_api', users=2, routes=2, points=20, images=1, repeat=3,
+                scenarios=['point_create'], output='-', compare=output, stdout=out,
+            )
+            self.assertIn('p50 before', out.getvalue())
+
+        self.assertEqual(report['dataset']['points'], 80)
+        self.assertEqual(
+            set(report['results']),
+            {'route_list', 'route_retrieve', 'export', 'point_list', 'point_polyline', 'point_create', 'point_delete'}
+        )
+        self.assertLess(report['results']['point_polyline']['response_kb'], report['results']['point_list']['response_kb'])
+        self.assertEqual(report['results']['route_list']['status_codes'], {'200': 3})
+        self.assertEqual(report['results']['point_create']['status_codes'], {'201': 3})
+        self.assertEqual(report['results']['point_delete']['status_codes'], {'204': 3})
+        self.assertEqual(report['results']['export']['queries_max'], 1)
+        for result in report['results'].values():
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['peak_memory_kb'], 0)
+        # Everything was rolled back
+        self.assertFalse(Route.objects.exists())
+        self.assertFalse(User.objects.filter(username__startswith='benchmark-').exists())
+
+
+class ChunkedUploadApiTests(APITestCase):
+    """
+    Tests for resumable chunked uploads of background images (/api/uploads/, mapping/chunked_uploads.py).
+    """
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test import override_settings
+        from io import BytesIO
+        from PIL import Image
+
+        # Partial and finished files are written below MEDIA_ROOT, keep them out of the project
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.user = User.objects.create_user(username='scanner', password='testpassword')
+        self.other_user = User.objects.create_user(username='otherscanner', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+
+        buffer = BytesIO()
+        Image.effect_noise((120, 80), 64).save(buffer, 'PNG') # Noise, so it does not compress to nothing
+        self.content = buffer.getvalue()
+
+    def start_upload(self, content=None, name='Floor Plan Scan'):
+        content = self.content if content is None else content
+        response = self.client.post(
+            reverse('image-upload-list'),
+            {'name': name, 'description': 'Scanned', 'filename': 'scan.png', 'size': len(content)},
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['offset'], 0)
+        return response.data['id']
+
+    def put_chunk(self, upload_id, start, data, total=None):
+        total = len(self.content) if total is None else total
+        return self.client.generic(
+            'PUT', reverse('image-upload-detail', kwargs={'pk': upload_id}), data,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{start + len(data) - 1}/{total}',
+        )
+
+    def send_in_chunks(self, upload_id, chunk_size=1000):
+        for start in range(0, len(self.content), chunk_size):
+            response = self.put_chunk(upload_id, start, self.content[start:start + chunk_size])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['offset'], len(self.content))
+
+    def finalize(self, upload_id):
+        return self.client.post(reverse('image-upload-finalize', kwargs={'pk': upload_id}))
+
+    def test_chunked_upload_creates_the_image(self):
+        import hashlib
+        upload_id = self.start_upload()
+        self.send_in_chunks(upload_id)
+
+        response = self.finalize(upload_id)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        image = BackgroundImage.objects.get(pk=response.data['id'])
+        self.assertEqual((image.name, image.slug, image.uploader), ('Floor Plan Scan', 'floor-plan-scan', self.user))
+        self.assertEqual((image.width, image.height, image.format), (120, 80, 'PNG'))
+        self.assertEqual(image.content_hash, hashlib.sha256(self.content).hexdigest())
+        with image.image.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        # The upload and its partial file are gone
+        detail = self.client.get(reverse('image-upload-detail', kwargs={'pk': upload_id}))
+        self.assertEqual(detail.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads', 'partial')), [])
+
+    def test_interrupted_chunk_is_resumed_from_the_offset(self):
+        upload_id = self.start_upload()
+        self.put_chunk(upload_id, 0, self.content[:1000])
+        # The connection drops after 300 bytes of the second chunk: the stream simply ends early
+        from .chunked_uploads import append_chunk
+        from .models import ImageUpload
+        from io import BytesIO
+        append_chunk(ImageUpload.objects.get(pk=upload_id), BytesIO(self.content[1000:1300]), 1000, 1000)
+
+        status_response = self.client.get(reverse('image-upload-detail', kwargs={'pk': upload_id}))
+        self.assertEqual(status_response.data['offset'], 1300)
+
+        # A chunk sent from the wrong place is refused with the offset to continue from
+        conflict = self.put_chunk(upload_id, 1000, self.content[1000:2000])
+        self.assertEqual(conflict.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(conflict.data['offset'], 1300)
+
+        self.assertEqual(self.put_chunk(upload_id, 1300, self.content[1300:]).status_code, status.HTTP_200_OK)
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with BackgroundImage.objects.get(pk=response.data['id']).image.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_failed_finalize_keeps_the_partial_file(self):
+        """If the image cannot be saved, the moved file goes back and the upload can be finalized again."""
+        from django.db import DatabaseError
+        from .chunked_uploads import finalize_upload
+        from .models import ImageUpload
+        upload_id = self.start_upload()
+        self.send_in_chunks(upload_id)
+        upload = ImageUpload.objects.get(pk=upload_id)
+
+        with mock.patch.object(BackgroundImage, 'save', side_effect=DatabaseError('disk full')):
+            with self.assertRaises(DatabaseError):
+                finalize_upload(upload)
+
+        self.assertTrue(ImageUpload.objects.filter(pk=upload_id).exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'background_images')), [])
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with BackgroundImage.objects.get(pk=response.data['id']).image.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_finalize_refuses_incomplete_and_non_image_uploads(self):
+        upload_id = self.start_upload()
+        self.put_chunk(upload_id, 0, self.content[:1000])
+        self.assertEqual(self.finalize(upload_id).status_code, status.HTTP_400_BAD_REQUEST)
+
+        not_an_image = b'%PDF-1.4 not an image' * 10
+        upload_id = self.start_upload(not_an_image, name='Not An Image')
+        self.put_chunk(upload_id, 0, not_an_image, total=len(not_an_image))
+        self.assertEqual(self.finalize(upload_id).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(BackgroundImage.objects.exists())
+
+    def test_bad_ranges_are_refused(self):
+        upload_id = self.start_upload()
+        url = reverse('image-upload-detail', kwargs={'pk': upload_id})
+        missing_range = self.client.generic('PUT', url, self.content[:10], content_type='application/octet-stream')
+        self.assertEqual(missing_range.status_code, status.HTTP_400_BAD_REQUEST)
+        wrong_total = self.put_chunk(upload_id, 0, self.content[:10], total=len(self.content) + 1)
+        self.assertEqual(wrong_total.status_code, status.HTTP_400_BAD_REQUEST)
+        too_long = self.put_chunk(upload_id, 0, self.content + b'extra')
+        self.assertEqual(too_long.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_uploads_are_private_and_can_be_abandoned(self):
+        upload_id = self.start_upload()
+        self.put_chunk(upload_id, 0, self.content[:1000])
+
+        # Another user cannot see or continue it
+        self.client.force_authenticate(user=self.other_user)
+        self.assertEqual(self.put_chunk(upload_id, 1000, self.content[1000:2000]).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.finalize(upload_id).status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.delete(reverse('image-upload-detail', kwargs={'pk': upload_id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads', 'partial')), [])
@@ -0,0 +1,167 @@
+# mapping/test_live.py
+"""
+Tests for live route editing: the WebSocket consumer (mapping/consumers.py) and the
+deltas the point API sends to it (mapping/live.py).
+"""
+
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
+from django.urls import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from .models import BackgroundImage, Route, RoutePoint
+from .routing import websocket_urlpatterns
+
+User = get_user_model()
+
+
+class LiveRouteEditingTests(APITestCase):
+    """
+    The API is called as usual; commit callbacks are executed so the deltas are sent,
+    and a WebSocketCommunicator plays the subscribed client.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='liveeditor', password='testpassword')
+        self.other_user = User.objects.create_user(username='onlooker', password='testpassword')
+        bg_image = BackgroundImage.objects.create(name='Live Image', image=SimpleUploadedFile('live.jpg', b'content'))
+        self.route = Route.objects.create(user=self.user, background_image=bg_image, name='Live Route')
+        self.points = [
+            RoutePoint.objects.create(route=self.route, x=x, y=x, order=rank)
+            for rank, x in enumerate((0.125, 0.25, 0.5))
+        ]
+        self.route.rebuild_packed_points()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def communicator(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/routes/{self.route.pk}/')
+        communicator.scope['user'] = user
+        return communicator
+
+    def run_session(self, write, user=None):
+        """
+        Connects as `user` (the route's owner by default), runs write() (API calls, their
+        commit callbacks executed) and returns the messages received after the hello.
+        """
+        async def session():
+            communicator = self.communicator(user or self.user)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            hello = await communicator.receive_json_from()
+            await database_sync_to_async(write)()
+            messages = []
+            while not await communicator.receive_nothing(timeout=0.1):
+                messages.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return hello, messages
+
+        return async_to_sync(session)()
+
+    def api(self, call):
+        """Wraps an API call so its commit callbacks (the broadcasts) run."""
+        def write():
+            with self.captureOnCommitCallbacks(execute=True):
+                response = call()
+            self.assertLess(response.status_code, 300, response.data)
+        return write
+
+    def test_hello_tells_the_current_version(self):
+        hello, messages = self.run_session(lambda: None)
+        self.route.refresh_from_db()
+        self.assertEqual(hello, {'route': self.route.pk, 'op': 'hello', 'version': self.route.version})
+        self.assertEqual(messages, [])
+
+    def test_other_users_and_anonymous_clients_are_refused(self):
+        from django.contrib.auth.models import AnonymousUser
+
+        async def connect(user):
+            communicator = self.communicator(user)
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+
+        self.assertFalse(async_to_sync(connect)(self.other_user))
+        self.assertFalse(async_to_sync(connect)(AnonymousUser()))
+
+    def test_appended_points_are_sent_as_a_delta(self):
+        points_url = reverse('route-points-list', kwargs={'route_pk': self.route.pk})
+        bulk_url = reverse('route-points-bulk', kwargs={'route_pk': self.route.pk})
+
+        def write():
+            self.api(lambda: self.client.post(points_url, {'x': 0.75, 'y': 0.75}, format='json'))()
+            self.api(lambda: self.client.post(bulk_url, [{'x': 0.875, 'y': 0.875}, {'x': 1.0, 'y': 1.0}], format='json'))()
+
+        hello, messages = self.run_session(write)
+
+        self.assertEqual([message['op'] for message in messages], ['append', 'append'])
+        self.assertEqual(messages[0]['version'], hello['version'] + 1)
+        self.assertEqual(messages[1]['version'], hello['version'] + 2)
+        self.assertEqual(messages[0]['position'], 3)
+        self.assertEqual([(point['x'], point['y']) for point in messages[0]['points']], [(0.75, 0.75)])
+        self.assertEqual(messages[1]['position'], 4)
+        self.assertEqual([point['x'] for point in messages[1]['points']], [0.875, 1.0])
+
+    def test_inserted_moved_and_deleted_points_are_sent_as_deltas(self):
+        points_url = reverse('route-points-list', kwargs={'route_pk': self.route.pk})
+        detail_url = reverse('route-point-detail', kwargs={'route_pk': self.route.pk, 'pk': self.points[1].pk})
+        range_url = reverse('route-points-range', kwargs={'route_pk': self.route.pk}) + '?start=0&end=1'
+
+        def write():
+            self.api(lambda: self.client.post(points_url, {'x': 0.375, 'y': 0.375, 'index': 1}, format='json'))()
+            self.api(lambda: self.client.patch(detail_url, {'x': 0.3}, format='json'))()
+            self.api(lambda: self.client.delete(detail_url))()
+            self.api(lambda: self.client.delete(range_url))()
+
+        hello, messages = self.run_session(write)
+
+        self.assertEqual([message['op'] for message in messages], ['insert', 'move', 'delete', 'delete'])
+        self.assertEqual([message['version'] for message in messages], [hello['version'] + n for n in range(1, 5)])
+        insert, move, delete, delete_range = messages
+        self.assertEqual((insert['position'], insert['points'][0]['x']), (1, 0.375))
+        self.assertEqual((move['position'], move['point']['id'], move['point']['x']), (2, self.points[1].pk, 0.3))
+        self.assertEqual((delete['position'], delete['count']), (2, 1))
+        self.assertEqual((delete_range['position'], delete_range['count']), (0, 2))
+
+    def test_batch_edits_and_route_changes_ask_for_a_reload(self):
+        points_url = reverse('route-points-list', kwargs={'route_pk': self.route.pk})
+        route_url = reverse('route-detail', kwargs={'pk': self.route.pk})
+
+        def write():
+            operations = {'operations': [{'op': 'delete', 'start': 0, 'end': 0}, {'op': 'delete', 'start': 0, 'end': 0}]}
+            self.api(lambda: self.client.patch(points_url, operations, format='json'))()
+            self.api(lambda: self.client.patch(route_url, {'name': 'Renamed'}, format='json'))()
+            self.api(lambda: self.client.delete(route_url))()
+
+        _, messages = self.run_session(write)
+
+        self.assertEqual([message['op'] for message in messages], ['reload', 'reload', 'deleted'])
+
+    def test_nothing_is_sent_when_the_write_fails(self):
+        points_url = reverse('route-points-list', kwargs={'route_pk': self.route.pk})
+
+        def write():
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(points_url, {'x': 5, 'y': 0.5}, format='json') # Outside the image
+            self.assertEqual(response.status_code, 400)
+
+        _, messages = self.run_session(write)
+        self.assertEqual(messages, [])
+
+    def test_deleted_is_not_sent_when_the_route_delete_fails(self):
+        route_url = reverse('route-detail', kwargs={'pk': self.route.pk})
+
+        def write():
+            with mock.patch.object(Route, 'delete', side_effect=DatabaseError('locked')):
+                with self.captureOnCommitCallbacks(execute=True), self.assertRaises(DatabaseError):
+                    self.client.delete(route_url)
+
+        _, messages = self.run_session(write)
+        self.assertEqual(messages, [])
@@ -0,0 +1,340 @@
+# mapping/test_query_budgets.py
+"""
+Query budgets: how many SQL queries each endpoint may run.
+
+test_api.py and test_views.py check what the endpoints return; these tests check
+what answering costs. Every endpoint has a declared maximum (QUERY_BUDGETS) that must
+not depend on the size of the result, so each one is requested with a growing
+fixture (more routes, points, images, ... depending on the endpoint) and has to
+stay within the same budget at every size. A serializer change that brings back
+one query per route or per point fails here, listing the SQL that was run.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from .models import BackgroundImage, BackgroundImageRendition, Route, RoutePoint
+from .test_views import GIF_1PX
+
+User = get_user_model()
+
+# Maximum number of queries per request, whatever the number of routes / points / images
+QUERY_BUDGETS = {
+    # API (force_authenticate, so no session or user lookups)
+    'route-list': 4,
+    'route-list?points=none': 3,
+    'route-list?max_points': 3,
+    'route-detail': 4,
+    'route-create': 4,
+    'route-update': 8,
+    'route-delete': 8, # Savepoint around the delete and its 'deleted' broadcast
+    'route-export': 1,
+    'route-import-file': 9,
+    'image-list': 2,
+    'image-detail': 2,
+    'image-routes-near': 3,
+    'route-points-list': 3,
+    'route-points-create': 7,
+    'route-points-insert': 9,
+    # The point writes below start with an UPDATE of the route row (RoutePointViewSet.lock_route)
+    'route-points-batch-edit': 11,
+    'route-points-bulk': 7,
+    'route-points-range': 10,
+    'route-point-detail': 5,
+    'route-point-update': 12,
+    'route-point-delete': 12,
+    # Web pages (logged in through the session: session + user lookups included)
+    'homepage': 5,
+    'add-background-image': 2,
+    'routes-on-image': 7,
+    'user-routes-list': 3,
+    'tile-descriptor': 1,
+    'tile': 0,
+}
+
+# Fixture sizes every endpoint is requested with (routes, points, ... as the test decides)
+FIXTURE_SIZES = [1, 5, 25]
+
+
+class QueryBudgetMixin:
+    """
+    assertQueryBudget() requests an endpoint once per fixture size and checks the
+    number of queries against its declared budget.
+    """
+
+    def assertQueryBudget(self, endpoint, grow, request, status_code=None, sizes=FIXTURE_SIZES):
+        """
+        grow(size) makes the fixture `size` big (it is called with increasing sizes),
+        request(size) sends the request and returns the response. Fails if a request
+        runs more queries than QUERY_BUDGETS[endpoint] or answers with an unexpected
+        status (any 4xx/5xx when status_code is not given).
+        """
+        budget = QUERY_BUDGETS[endpoint]
+        for size in sizes:
+            grow(size)
+            cache.clear() # Cached pages / fragments would hide the queries
+            with CaptureQueriesContext(connection) as queries:
+                response = request(size)
+                # Streaming responses run their queries while the content is read
+                if getattr(response, 'streaming', False):
+                    b''.join(response.streaming_content)
+
+            if status_code is None:
+                self.assertLess(response.status_code, 400, f"{endpoint} (size {size}) answered {response.status_code}")
+            else:
+                self.assertEqual(response.status_code, status_code, f"{endpoint} (size {size})")
+            if len(queries) > budget:
+                listing = '\n'.join(f"  {number}. {query['sql']}" for number, query in enumerate(queries.captured_queries, 1))
+                self.fail(
+                    f"{endpoint} ran {len(queries)} queries with fixture size {size}, "
+                    f"its budget is {budget}:\n{listing}"
+                )
+
+
+class QueryBudgetFixtures(QueryBudgetMixin):
+    """Shared fixture helpers: a user, a background image and routes with points."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='budgetuser', password='testpassword')
+        # A real (1 pixel) file: the route management page reads the image's size
+        self.bg_image = BackgroundImage.objects.create(
+            name='Budget Map', image=SimpleUploadedFile('budget.gif', GIF_1PX, content_type='image/gif')
+        )
+        self.route = self.create_route(3)
+
+    def create_route(self, point_count, image=None, name='Budget Route'):
+        """A route with point_count points along a diagonal, packed geometry included."""
+        route = Route.objects.create(user=self.user, background_image=image or self.bg_image, name=name)
+        self.add_points(route, point_count)
+        return route
+
+    def add_points(self, route, count):
+        """Appends `count` points to the route's rows and packed geometry."""
+        route.refresh_from_db()
+        start = route.point_count
+        xs = [(start + i) % 100 / 100 for i in range(count)]
+        RoutePoint.objects.insert_points(route.pk, xs, xs, first_rank=route.next_rank)
+        route.refresh_from_db()
+        route.rebuild_packed_points()
+
+    def grow_routes(self, size):
+        """Gives the user `size` routes of 3 points (self.route being the first one)."""
+        for number in range(self.user.routes.count(), size):
+            self.create_route(3, name=f'Budget Route {number}')
+
+    def grow_points(self, size, route=None):
+        """Gives the route (self.route by default) `size` points."""
+        route = route or self.route
+        missing = size - route.points.count()
+        if missing > 0:
+            self.add_points(route, missing)
+
+
+class ApiQueryBudgetTests(QueryBudgetFixtures, APITestCase):
+    """
+    Query budgets of the API endpoints (/api/...).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.list_url = reverse('route-list')
+        self.points_url = reverse('route-points-list', kwargs={'route_pk': self.route.pk})
+
+    def route_url(self, route=None):
+        return reverse('route-detail', kwargs={'pk': (route or self.route).pk})
+
+    def point_url(self, point):
+        return reverse('route-point-detail', kwargs={'route_pk': point.route_id, 'pk': point.pk})
+
+    # --- Routes ---
+
+    def test_route_list(self):
+        self.assertQueryBudget('route-list', self.grow_routes, lambda size: self.client.get(self.list_url))
+
+    def test_route_list_without_points(self):
+        self.assertQueryBudget(
+            'route-list?points=none', self.grow_routes, lambda size: self.client.get(f'{self.list_url}?points=none')
+        )
+
+    def test_route_list_simplified(self):
+        self.assertQueryBudget(
+            'route-list?max_points', self.grow_routes, lambda size: self.client.get(f'{self.list_url}?max_points=2')
+        )
+
+    def test_route_detail(self):
+        self.assertQueryBudget('route-detail', self.grow_points, lambda size: self.client.get(self.route_url()))
+
+    def test_route_create(self):
+        data = {'name': 'New Route', 'background_image_id': self.bg_image.pk}
+        self.assertQueryBudget('route-create', self.grow_routes, lambda size: self.client.post(self.list_url, data, format='json'))
+
+    def test_route_update(self):
+        self.assertQueryBudget(
+            'route-update', self.grow_points,
+            lambda size: self.client.patch(self.route_url(), {'name': f'Renamed {size}'}, format='json'),
+        )
+
+    def test_route_delete(self):
+        routes = {}
+
+        def grow(size):
+            routes[size] = self.create_route(size)
+
+        self.assertQueryBudget('route-delete', grow, lambda size: self.client.delete(self.route_url(routes[size])))
+
+    def test_route_export(self):
+        self.assertQueryBudget(
+            'route-export', self.grow_routes, lambda size: self.client.get(reverse('route-export'))
+        )
+
+    def test_route_import(self):
+        def import_file(size):
+            lines = ['x,y'] + [f'{i / size},{i / size}' for i in range(size)]
+            upload = SimpleUploadedFile('points.csv', '\n'.join(lines).encode(), content_type='text/csv')
+            return self.client.post(
+                reverse('route-import-file'),
+                {'file': upload, 'background_image_id': self.bg_image.pk}, format='multipart',
+            )
+
+        self.assertQueryBudget('route-import-file', lambda size: None, import_file)
+
+    # --- Images ---
+
+    def grow_images(self, size):
+        """`size` background images, each with two renditions."""
+        for number in range(BackgroundImage.objects.count(), size):
+            image = BackgroundImage.objects.create(name=f'Budget Image {number}', image='background_images/budget.jpg')
+            BackgroundImageRendition.objects.bulk_create([
+                BackgroundImageRendition(background_image=image, kind=kind, format='webp', width=width, height=width,
+                                         image='background_images/renditions/budget.webp')
+                for kind, width in (('thumbnail', 320), ('medium', 640))
+            ])
+
+    def test_image_list(self):
+        self.assertQueryBudget('image-list', self.grow_images, lambda size: self.client.get(reverse('image-list')))
+
+    def test_image_detail(self):
+        self.assertQueryBudget(
+            'image-detail', self.grow_images,
+            lambda size: self.client.get(reverse('image-detail', kwargs={'slug': self.bg_image.slug})),
+        )
+
+    def test_routes_near(self):
+        url = reverse('image-routes-near', kwargs={'slug': self.bg_image.slug})
+        self.assertQueryBudget('image-routes-near', self.grow_routes, lambda size: self.client.get(f'{url}?x=0.5&y=0.5&r=0.5'))
+
+    # --- Points ---
+
+    def test_point_list(self):
+        self.assertQueryBudget('route-points-list', self.grow_points, lambda size: self.client.get(self.points_url))
+
+    def test_point_append(self):
+        self.assertQueryBudget(
+            'route-points-create', self.grow_points,
+            lambda size: self.client.post(self.points_url, {'x': 0.5, 'y': 0.5}, format='json'),
+        )
+
+    def test_point_insert(self):
+        self.assertQueryBudget(
+            'route-points-insert', self.grow_points,
+            lambda size: self.client.post(self.points_url, {'x': 0.5, 'y': 0.5, 'index': 1}, format='json'),
+        )
+
+    def test_point_batch_edit(self):
+        operations = [
+            {'op': 'insert', 'index': 0, 'points': [{'x': 0.1, 'y': 0.1}]},
+            {'op': 'move', 'start': 0, 'end': 0, 'to': 1},
+            {'op': 'update', 'index': 2, 'x': 0.9},
+            {'op': 'delete', 'start': 3, 'end': 3},
+        ]
+        self.assertQueryBudget(
+            'route-points-batch-edit', self.grow_points,
+            lambda size: self.client.patch(self.points_url, {'operations': operations}, format='json'),
+        )
+
+    def test_point_bulk_append(self):
+        bulk_url = reverse('route-points-bulk', kwargs={'route_pk': self.route.pk})
+        self.assertQueryBudget(
+            'route-points-bulk', lambda size: None,
+            lambda size: self.client.post(bulk_url, [{'x': i / size, 'y': 0.5} for i in range(size)], format='json'),
+        )
+
+    def test_point_range_delete(self):
+        range_url = reverse('route-points-range', kwargs={'route_pk': self.route.pk})
+        # Grows the route to twice the size, then deletes `size` points from its middle
+        self.assertQueryBudget(
+            'route-points-range', lambda size: self.grow_points(2 * size + 2),
+            lambda size: self.client.delete(f'{range_url}?start=1&end={size}'),
+        )
+
+    def test_point_detail(self):
+        self.assertQueryBudget(
+            'route-point-detail', self.grow_points,
+            lambda size: self.client.get(self.point_url(self.route.points.last())),
+        )
+
+    def test_point_update(self):
+        self.assertQueryBudget(
+            'route-point-update', self.grow_points,
+            lambda size: self.client.put(self.point_url(self.route.points.all()[1]), {'x': 0.3, 'y': 0.3}, format='json'),
+        )
+
+    def test_point_delete(self):
+        self.assertQueryBudget(
+            'route-point-delete', lambda size: self.grow_points(size + 2),
+            lambda size: self.client.delete(self.point_url(self.route.points.all()[1])),
+        )
+
+
+class WebQueryBudgetTests(QueryBudgetFixtures, APITestCase):
+    """
+    Query budgets of the web pages (mapping/web_urls.py).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def grow_images(self, size):
+        for number in range(BackgroundImage.objects.count(), size):
+            BackgroundImage.objects.create(name=f'Budget Image {number}', image='background_images/budget.jpg')
+
+    def test_homepage(self):
+        self.assertQueryBudget('homepage', self.grow_images, lambda size: self.client.get(reverse('mapping:homepage')))
+
+    def test_add_background_image_form(self):
+        self.assertQueryBudget(
+            'add-background-image', self.grow_images,
+            lambda size: self.client.get(reverse('mapping:add_background_image')),
+        )
+
+    def test_routes_on_image(self):
+        url = reverse('mapping:routes_on_image', kwargs={'image_slug': self.bg_image.slug})
+        self.assertQueryBudget('routes-on-image', self.grow_routes, lambda size: self.client.get(url))
+
+    def test_user_routes_list(self):
+        self.assertQueryBudget(
+            'user-routes-list', self.grow_routes, lambda size: self.client.get(reverse('mapping:user_routes_list'))
+        )
+
+    def test_tiles_not_built(self):
+        # No pyramid yet: one lookup for the descriptor, none at all for a tile
+        self.assertQueryBudget(
+            'tile-descriptor', self.grow_images,
+            lambda size: self.client.get(reverse('mapping:tile_descriptor', kwargs={'image_slug': self.bg_image.slug})),
+            status_code=404,
+        )
+        self.assertQueryBudget(
+            'tile', self.grow_images,
+            lambda size: self.client.get(reverse('mapping:tile', kwargs={
+                'image_id': self.bg_image.pk, 'version': 1, 'level': 0, 'column': 0, 'row': 0,
+            })),
+            status_code=404,
+        )
@@ -1,17 +1,28 @@
 # mapping/tests.py
 
-from django.test import TestCase, Client # Import Client
+import json
+
+from django.test import TestCase, Client, override_settings # Import Client
 from django.contrib.auth import get_user_model
 from django.db.utils import IntegrityError
 from django.utils.text import slugify
 from django.urls import reverse # Import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from .models import BackgroundImage, Route, RoutePoint
 
 # Get the User model
 User = get_user_model()
 
+# Smallest valid GIF (1x1 pixel), for forms that validate the uploaded image
+GIF_1PX = (
+    b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00'
+    b',\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;'
+)
+
 # Keep your ModelTests class here (from previous step)
 class ModelTests(TestCase):
     # ... (your existing ModelTests code) ...
@@ -30,6 +41,8 @@ class WebViewTests(TestCase):
         """
         # Use the default Django test client
         self.client = Client()
+        # The homepage grid is cached, don't let it leak between tests
+        cache.clear()
 
         # Create a test user
         self.user = User.objects.create_user(username='testuser', password='testpassword')
@@ -120,6 +133,22 @@ class WebViewTests(TestCase):
         # We cannot reliably test *which* images are displayed due to randomness,
         # but we can test the number.
 
+    def test_homepage_grid_is_cached_briefly(self):
+        """A second anonymous homepage hit within the cache time does not query the images again."""
+        self.client.get(self.homepage_url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.homepage_url)
+        self.assertEqual(response.content.decode('utf-8').count('<div class="image-item">'), 9)
+
+    def test_homepage_reads_only_sampled_images(self):
+        """Sampling the grid reads the id bounds and about 9 image rows, not the whole table."""
+        for i in range(40):
+            BackgroundImage.objects.create(name=f'Extra Image {i}', image=SimpleUploadedFile(f'extra_{i}.jpg', b'img'))
+        # Bounds + one IN query + the renditions prefetch when every guess hits an id
+        with self.assertNumQueries(3):
+            response = self.client.get(self.homepage_url)
+        self.assertEqual(len(response.context['random_images']()), 9)
+
     # --- Background Image Upload Page Tests (/add-background-image/ - mapping:add_background_image) ---
 
     def test_add_image_page_requires_login(self):
@@ -140,6 +169,22 @@ class WebViewTests(TestCase):
         self.assertTemplateUsed(response, 'mapping/add_background_image.html')
         self.assertContains(response, "Upload a New Background Image") # Check for key text
 
+    def test_add_image_schedules_renditions_after_commit(self):
+        """A successful upload queues rendition generation for after the commit instead of resizing inline."""
+        self.client.login(username='testuser', password='testpassword')
+        data = {
+            'name': 'Uploaded Map',
+            'description': 'A map I uploaded',
+            'image': SimpleUploadedFile(name='uploaded.gif', content=GIF_1PX, content_type='image/gif'),
+        }
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.post(self.add_image_url, data)
+
+        self.assertRedirects(response, self.homepage_url)
+        self.assertTrue(BackgroundImage.objects.filter(name='Uploaded Map', uploader=self.user).exists())
+        self.assertEqual(len(callbacks), 1) # Renditions only, tiles are built by build_tile_pyramids
+
     # Note: You would also add tests here for POSTing the form,
     # checking validation errors, successful save, redirection, etc.
     # Example (basic):
@@ -314,4 +359,266 @@ class WebViewTests(TestCase):
 
 
     # Add tests for DELETE route via web form if implemented (currently API only)
-    # Add tests for other web pages as you create them (e.g., route detail page if separate)
\ No newline at end of file
+    # Add tests for other web pages as you create them (e.g., route detail page if separate)
+
+
+class ContentAddressedUploadTests(TestCase):
+    """
+    Uploads through BackgroundImageForm are stored by content (mapping/uploads.py).
+    """
+
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        # Uploaded files are written below MEDIA_ROOT, keep them out of the project
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.user = User.objects.create_user(username='uploader', password='testpassword')
+        self.client.force_login(self.user)
+        self.add_image_url = reverse('mapping:add_background_image')
+
+    def upload(self, name, file_name, content=GIF_1PX):
+        data = {'name': name, 'image': SimpleUploadedFile(file_name, content, content_type='image/gif')}
+        self.assertEqual(self.client.post(self.add_image_url, data).status_code, 302)
+        return BackgroundImage.objects.get(name=name)
+
+    def stored_files(self):
+        import os
+        return sorted(os.listdir(os.path.join(self.media_root, 'background_images')))
+
+    def test_upload_records_size_format_and_hash(self):
+        import hashlib
+
+        image = self.upload('Uploaded Map', 'map.gif')
+
+        content_hash = hashlib.sha256(GIF_1PX).hexdigest()
+        self.assertEqual((image.width, image.height, image.format), (1, 1, 'GIF'))
+        self.assertEqual(image.content_hash, content_hash)
+        self.assertEqual(image.image.name, f'background_images/{content_hash}.gif')
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.upload('First Copy', 'test_map.gif')
+        second = self.upload('Second Copy', 'test_map_copy.gif')
+
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(self.stored_files(), [first.image.name.split('/')[-1]])
+
+    def test_different_uploads_get_their_own_files(self):
+        other_gif = GIF_1PX.replace(b'\xff\xff\xff', b'\x00\x80\x00') # Another palette colour
+        first = self.upload('White Pixel', 'pixel.gif')
+        second = self.upload('Green Pixel', 'pixel.gif', other_gif)
+
+        self.assertNotEqual(first.content_hash, second.content_hash)
+        self.assertEqual(len(self.stored_files()), 2)
+
+    def test_dedupe_command_merges_existing_copies(self):
+        from django.core.management import call_command
+        from io import StringIO
+
+        # Uploaded before the hashes existed: every upload got its own file
+        images = [
+            BackgroundImage.objects.create(name=f'Old Copy {number}', image=SimpleUploadedFile('test_map.gif', GIF_1PX))
+            for number in range(3)
+        ]
+        self.assertEqual(len(self.stored_files()), 3)
+
+        call_command('dedupe_background_images', '--delete', stdout=StringIO())
+
+        for image in images:
+            image.refresh_from_db()
+            self.assertEqual(image.image.name, images[0].image.name)
+            self.assertEqual(image.format, 'GIF')
+        self.assertEqual(self.stored_files(), [images[0].image.name.split('/')[-1]])
+
+
+class EmbeddedRoutesTests(TestCase):
+    """
+    The route management page embeds the user's routes on the image with their
+    points (mapping/embedded.py), cached until one of those routes changes.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='embedder', password='testpassword')
+        self.other_user = User.objects.create_user(username='someoneelse', password='testpassword')
+        self.bg_image = BackgroundImage.objects.create(
+            name='Embedded Image', image=SimpleUploadedFile('embedded.gif', GIF_1PX, content_type='image/gif')
+        )
+        self.other_image = BackgroundImage.objects.create(
+            name='Other Image', image=SimpleUploadedFile('other.gif', GIF_1PX, content_type='image/gif')
+        )
+        self.route = Route.objects.create(user=self.user, background_image=self.bg_image, name='Embedded Route')
+        # Created out of order, the rank decides the order
+        for x, rank in ((0.75, 2), (0.25, 0), (0.5, 1)):
+            RoutePoint.objects.create(route=self.route, x=x, y=x / 2, order=rank)
+        Route.objects.create(user=self.user, background_image=self.other_image, name='Route On Other Image')
+        Route.objects.create(user=self.other_user, background_image=self.bg_image, name='Their Route')
+
+        self.client.force_login(self.user)
+        self.url = reverse('mapping:routes_on_image', kwargs={'image_slug': self.bg_image.slug})
+
+    def embedded_routes(self, response):
+        """The routes JSON the page's JavaScript reads."""
+        content = response.content.decode()
+        start = content.index('<script id="userRoutesJson" type="application/json">')
+        blob = content[content.index('>', start) + 1:content.index('</script>', start)]
+        return json.loads(blob)
+
+    def test_page_embeds_only_own_routes_on_that_image_with_points_in_order(self):
+        response = self.client.get(self.url)
+
+        routes = self.embedded_routes(response)
+        self.assertEqual([route['name'] for route in routes], ['Embedded Route'])
+        points = routes[0]['points']
+        self.assertEqual([(point['order'], point['x'], point['y']) for point in points], [(0, 0.25, 0.125), (1, 0.5, 0.25), (2, 0.75, 0.375)])
+        self.assertContains(response, 'Embedded Route')
+        self.assertNotContains(response, 'Their Route')
+
+    def test_second_view_uses_the_cached_routes(self):
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(self.url)
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(self.url)
+
+        self.assertLess(len(second), len(first))
+        self.assertFalse(any('mapping_routepoint' in query['sql'] for query in second.captured_queries))
+        self.assertEqual(len(self.embedded_routes(response)[0]['points']), 3)
+
+    def test_editing_a_route_refreshes_the_embedded_routes(self):
+        self.client.get(self.url) # Cached now
+
+        points_url = reverse('route-points-list', kwargs={'route_pk': self.route.pk})
+        self.assertEqual(self.client.post(points_url, {'x': 1.0, 'y': 0.5}).status_code, 201)
+        routes = self.embedded_routes(self.client.get(self.url))
+        self.assertEqual([point['x'] for point in routes[0]['points']], [0.25, 0.5, 0.75, 1.0])
+
+        Route.objects.create(user=self.user, background_image=self.bg_image, name='Newer Route')
+        routes = self.embedded_routes(self.client.get(self.url))
+        self.assertEqual([route['name'] for route in routes], ['Embedded Route', 'Newer Route'])
+
+    def test_route_names_cannot_break_out_of_the_script_element(self):
+        self.route.name = '</script><script>alert(1)</script>'
+        self.route.save()
+
+        response = self.client.get(self.url)
+
+        self.assertNotContains(response, '</script><script>alert(1)')
+        self.assertEqual(self.embedded_routes(response)[0]['name'], self.route.name)
+
+
+class TileViewTests(TestCase):
+    """
+    Tests for the deep zoom tile pyramid (mapping/tiles.py) and the views serving it.
+    """
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from io import BytesIO
+        from PIL import Image
+        from . import tiles
+
+        # Tile archives are written below MEDIA_ROOT, keep them out of the project
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        tiles._open_archives.clear() # Ids are reused between tests
+
+        buffer = BytesIO()
+        Image.new('RGB', (1000, 600), color=(10, 120, 40)).save(buffer, 'PNG')
+        self.bg_image = BackgroundImage.objects.create(
+            name='Large Floor Plan',
+            image=SimpleUploadedFile('floor_plan.png', buffer.getvalue(), content_type='image/png'),
+        )
+        self.descriptor_url = reverse('mapping:tile_descriptor', kwargs={'image_slug': self.bg_image.slug})
+
+    def build_tiles(self):
+        from .tiles import generate_tile_archive
+        version = generate_tile_archive(self.bg_image.pk)
+        self.bg_image.refresh_from_db()
+        return version
+
+    def tile_url(self, level, column, row, version=None):
+        return reverse('mapping:tile', kwargs={
+            'image_id': self.bg_image.pk, 'version': version or self.bg_image.tiles_version,
+            'level': level, 'column': column, 'row': row,
+        })
+
+    def tile_size(self, response):
+        from io import BytesIO
+        from PIL import Image
+        return Image.open(BytesIO(response.content)).size
+
+    def test_descriptor_is_404_until_tiles_are_built(self):
+        self.assertEqual(self.client.get(self.descriptor_url).status_code, 404)
+
+    def test_descriptor_describes_the_pyramid(self):
+        self.build_tiles()
+        response = self.client.get(self.descriptor_url)
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode('utf-8')
+        self.assertIn('<Size Width="1000" Height="600"/>', content)
+        self.assertIn(f'Url="/tiles/{self.bg_image.pk}/1/"', content)
+        self.assertIn('TileSize="256"', content)
+
+    def test_tiles_cover_every_level(self):
+        """Level 10 is full size (2^10 >= 1000): 4 x 3 tiles, the last ones cut to the image edge."""
+        self.build_tiles()
+        self.assertEqual(self.tile_size(self.client.get(self.tile_url(10, 0, 0))), (256, 256))
+        self.assertEqual(self.tile_size(self.client.get(self.tile_url(10, 3, 2))), (1000 - 768, 600 - 512))
+        self.assertEqual(self.tile_size(self.client.get(self.tile_url(9, 1, 1))), (500 - 256, 300 - 256))
+        self.assertEqual(self.tile_size(self.client.get(self.tile_url(0, 0, 0))), (1, 1))
+
+    def test_tile_is_served_without_queries_and_cached_for_good(self):
+        self.build_tiles()
+        url = self.tile_url(10, 0, 0)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+    def test_missing_tiles_are_404(self):
+        self.build_tiles()
+        self.assertEqual(self.client.get(self.tile_url(10, 4, 0)).status_code, 404) # Past the last column
+        self.assertEqual(self.client.get(self.tile_url(11, 0, 0)).status_code, 404) # Past the top level
+        self.assertEqual(self.client.get(self.tile_url(0, 0, 0, version=7)).status_code, 404)
+
+    def test_rebuilding_switches_to_a_new_version(self):
+        first = self.build_tiles()
+        second = self.build_tiles()
+        self.assertEqual(second, first + 1)
+        self.assertEqual(self.client.get(self.tile_url(0, 0, 0, version=second)).status_code, 200)
+        self.assertEqual(self.client.get(self.tile_url(0, 0, 0, version=first)).status_code, 404)
+
+    def test_build_tile_pyramids_command_skips_images_with_tiles(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        call_command('build_tile_pyramids', stdout=StringIO())
+        self.bg_image.refresh_from_db()
+        self.assertEqual(self.bg_image.tiles_version, 1)
+
+        call_command('build_tile_pyramids', stdout=StringIO())
+        self.bg_image.refresh_from_db()
+        self.assertEqual(self.bg_image.tiles_version, 1)
+
+    def test_too_large_image_is_refused_before_decoding(self):
+        from unittest import mock
+        from PIL import Image, ImageFile
+        from . import renditions
+
+        with mock.patch.object(renditions, 'MAX_SOURCE_PIXELS', 1000 * 600 - 1), \
+             mock.patch.object(ImageFile.ImageFile, 'load') as load:
+            with self.assertRaises(ValueError):
+                self.build_tiles()
+        load.assert_not_called()
+        self.assertEqual(Image.MAX_IMAGE_PIXELS, 89478485) # Pillow's own limit is untouched
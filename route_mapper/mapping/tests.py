@@ -1,9 +1,17 @@
-from django.test import TestCase
+import shutil
+import tempfile
+
+from django.test import TestCase, SimpleTestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.db.utils import IntegrityError # For testing database constraints
 from django.utils.text import slugify # Helper for slug generation verification
 
-from .models import BackgroundImage, Route, RoutePoint
+from .models import BackgroundImage, BackgroundImageRendition, Route, RoutePoint
+from .renditions import generate_renditions
+from .geometry import flatten_points, measure_points, pack_points, unpack_points
+from .simplification import coords_array, simplify_indices
+from .spatial import GRID_SIZE, polyline_cells, segment_cells
+from .ranks import RANK_GAP, assign_ranks, ranks_between
 
 # Get the User model
 User = get_user_model()
@@ -140,6 +148,47 @@ class ModelTests(TestCase):
                 uploader=self.user
             )
 
+    def test_background_image_slug_lookup_is_one_query(self):
+        """Finding the next free slug costs one query, however many duplicates exist."""
+        for i in range(12):
+            BackgroundImage.objects.create(name='Test Map', image=self.dummy_image_file)
+
+        # Slug lookup + SAVEPOINT, INSERT, RELEASE SAVEPOINT
+        with self.assertNumQueries(4):
+            image = BackgroundImage.objects.create(name='Test Map', image=self.dummy_image_file)
+        self.assertEqual(image.slug, 'test-map-12') # Suffixes compare as numbers, 12 after 11
+
+    def test_background_image_slug_with_a_number_at_the_end(self):
+        """A name ending in a number gets its own copies and does not shift the suffixes of the shorter name."""
+        for i in range(3):
+            BackgroundImage.objects.create(name='Floor', image=self.dummy_image_file) # floor, floor-1, floor-2
+
+        floor_2 = BackgroundImage.objects.create(name='Floor 2', image=self.dummy_image_file)
+        floor_2_copy = BackgroundImage.objects.create(name='Floor 2', image=self.dummy_image_file)
+        floor_copy = BackgroundImage.objects.create(name='Floor', image=self.dummy_image_file)
+
+        self.assertEqual(floor_2.slug, 'floor-2-1') # "floor-2" is the third "Floor"
+        self.assertEqual(floor_2_copy.slug, 'floor-2-2')
+        self.assertEqual(floor_copy.slug, 'floor-3') # "floor-2-1" and "floor-2-2" are not copies of "floor"
+
+    def test_background_image_slug_retries_when_a_concurrent_upload_wins(self):
+        """If another upload takes the allocated slug before the insert, the slug is allocated again."""
+        from unittest import mock
+        from . import slugs
+
+        BackgroundImage.objects.create(name='Race', image=self.dummy_image_file)
+        real_allocate = slugs.allocate_slug
+
+        def stale_first(queryset, base_slug, field='slug'):
+            # First answer is stale, as if the concurrent upload's row was
+            # inserted right after our lookup
+            return 'race' if allocate.call_count == 1 else real_allocate(queryset, base_slug, field)
+
+        with mock.patch.object(slugs, 'allocate_slug', side_effect=stale_first) as allocate:
+            image = BackgroundImage.objects.create(name='Race', image=self.dummy_image_file)
+        self.assertEqual(image.slug, 'race-1')
+        self.assertEqual(allocate.call_count, 2)
+
     # Note: Testing unique=True on a field is often done by attempting to save
     # two objects with the same value and expecting an IntegrityError.
     # The initial prompt mentioned BackgroundImage.title (or name), but our model
@@ -284,6 +333,290 @@ class ModelTests(TestCase):
         self.assertIsNone(image_no_uploader.uploader)
 
 
+class ConcurrentSlugTests(TransactionTestCase):
+    """
+    Uploads with the same name from several threads at once must all get distinct slugs.
+    """
+
+    def test_concurrent_uploads_get_unique_slugs(self):
+        import threading
+        import time
+        from django.db import OperationalError, connection
+
+        uploads = 5 # At most SAVE_ATTEMPTS, every collision round has one winner
+        barrier = threading.Barrier(uploads)
+        errors = []
+
+        def upload():
+            try:
+                barrier.wait() # Start all lookups at (nearly) the same time
+                for _ in range(100):
+                    try:
+                        BackgroundImage.objects.create(name='Concurrent Map', image='background_images/concurrent.jpg')
+                        break
+                    except OperationalError as error:
+                        # The SQLite test database is shared in-memory, which reports a
+                        # lock conflict instead of waiting for it; just try again
+                        if 'locked' not in str(error):
+                            raise
+                        time.sleep(0.005)
+            except Exception as error: # Collected and reported by the main thread
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=upload) for _ in range(uploads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        slugs = list(BackgroundImage.objects.values_list('slug', flat=True))
+        self.assertEqual(len(slugs), uploads)
+        self.assertEqual(len(set(slugs)), uploads)
+
+
+class SimplificationTests(SimpleTestCase):
+    """
+    Unit tests for the Douglas-Peucker simplification in mapping/simplification.py.
+    """
+
+    def xy(self, points):
+        return coords_array(pack_points(flatten_points(points)))
+
+    def test_collinear_points_reduce_to_endpoints(self):
+        """Points on a straight line are all within any tolerance."""
+        xy = self.xy([(i / 10, i / 10) for i in range(11)])
+        self.assertEqual(simplify_indices(xy, tolerance=0.001), [0, 10])
+
+    def test_tolerance_keeps_significant_corner(self):
+        """A corner farther than the tolerance survives, small jitter does not."""
+        xy = self.xy([(0.0, 0.0), (0.25, 0.251), (0.5, 0.5), (0.75, 0.251), (1.0, 0.0)])
+        self.assertEqual(simplify_indices(xy, tolerance=0.01), [0, 2, 4])
+        self.assertEqual(simplify_indices(xy, tolerance=0.0), [0, 1, 2, 3, 4])
+
+    def test_max_points_keeps_most_significant_points(self):
+        """With max_points the points that deviate most are picked first."""
+        xy = self.xy([(0.0, 0.0), (0.2, 0.05), (0.4, 0.0), (0.6, 0.3), (0.8, 0.0), (1.0, 0.0)])
+        self.assertEqual(simplify_indices(xy, max_points=3), [0, 3, 5])
+        self.assertEqual(len(simplify_indices(xy, max_points=4)), 4)
+
+    def test_short_or_unbounded_input_is_returned_whole(self):
+        """Two points, or no limits at all, keep everything."""
+        self.assertEqual(simplify_indices(self.xy([(0.0, 0.0), (1.0, 1.0)]), tolerance=1.0), [0, 1])
+        xy = self.xy([(0.0, 0.0), (0.5, 0.5), (1.0, 1.0)])
+        self.assertEqual(simplify_indices(xy), [0, 1, 2])
+
+
+
+class RankTests(SimpleTestCase):
+    """
+    Unit tests for the sparse point ranks in mapping/ranks.py.
+    """
+
+    def test_ranks_between_neighbours(self):
+        self.assertEqual(ranks_between(100, 200, 1), [150])
+        self.assertEqual(ranks_between(100, 200, 3), [125, 150, 175])
+        self.assertEqual(ranks_between(None, 3, 3), [0, 1, 2]) # Rank 0 is free before the first point
+        self.assertEqual(ranks_between(7, None, 2), [7 + RANK_GAP, 7 + 2 * RANK_GAP])
+        self.assertIsNone(ranks_between(100, 101, 1)) # No room left
+
+    def test_points_in_order_keep_their_ranks(self):
+        """Only the moved point (the 60) and the new one get new ranks."""
+        ranks = assign_ranks([10, 20, None, 60, 30, 40, 50])
+        self.assertEqual([ranks[i] for i in (0, 1, 4, 5, 6)], [10, 20, 30, 40, 50])
+        self.assertEqual(ranks, sorted(set(ranks)))
+
+    def test_new_points_after_the_end_are_spaced(self):
+        self.assertEqual(assign_ranks([None, None]), [RANK_GAP, 2 * RANK_GAP])
+        self.assertEqual(assign_ranks([5, None]), [5, 5 + RANK_GAP])
+
+    def test_no_room_needs_respacing(self):
+        self.assertIsNone(assign_ranks([10, None, 11]))
+
+class SpatialGridTests(SimpleTestCase):
+    """
+    Unit tests for the grid traversal in mapping/spatial.py.
+    """
+
+    def test_horizontal_segment_covers_each_cell_once(self):
+        cells = segment_cells(0.0, 0.5, 1.0, 0.5)
+        self.assertEqual(cells, [(i, GRID_SIZE // 2) for i in range(GRID_SIZE)])
+
+    def test_diagonal_segment_cells_are_connected(self):
+        """Consecutive cells share an edge, so no cell the segment crosses is skipped."""
+        cells = segment_cells(0.01, 0.02, 0.93, 0.71)
+        self.assertEqual(cells[0], (0, 1))
+        self.assertEqual(cells[-1], (59, 45))
+        for (ax, ay), (bx, by) in zip(cells, cells[1:]):
+            self.assertEqual(abs(ax - bx) + abs(ay - by), 1)
+
+    def test_single_point_route_covers_its_cell(self):
+        self.assertEqual(polyline_cells([0.5, 0.25]), {(GRID_SIZE // 2, GRID_SIZE // 4)})
+        self.assertEqual(polyline_cells([]), set())
+
+
+class PackedPointsSpliceTests(TestCase):
+    """
+    Route.splice_packed_points adjusts the metrics and segment cells around the splice;
+    the result must match rebuilding them from scratch.
+    """
+
+    def setUp(self):
+        user = User.objects.create_user(username='splicer', password='testpassword')
+        image = BackgroundImage.objects.create(name='Splice Map', image='background_images/splice.jpg')
+        BackgroundImage.objects.filter(pk=image.pk).update(width=2000, height=1000)
+        self.route = Route.objects.create(user=user, background_image=image, name='Spliced')
+        self.route.refresh_from_db()
+
+    def assertMatchesRebuild(self):
+        route = self.route
+        expected = measure_points(unpack_points(route.packed_points), *route.image_size())
+        for field, value in route.get_metrics().items():
+            if isinstance(value, float):
+                self.assertAlmostEqual(value, expected[field], places=4, msg=field)
+            else:
+                self.assertEqual(value, expected[field], msg=field)
+        cells = set(route.segment_cells.values_list('cell_x', 'cell_y'))
+        self.assertEqual(cells, polyline_cells(unpack_points(route.packed_points)))
+
+    def test_random_splices_match_a_rebuild(self):
+        import random
+        rng = random.Random(7)
+        self.route.splice_packed_points(0, 0, [(rng.random(), rng.random()) for _ in range(40)])
+        self.assertMatchesRebuild()
+        for _ in range(60):
+            count = self.route.point_count
+            start = rng.randrange(count + 1)
+            stop = min(count, start + rng.choice([0, 1, 1, 2, 5]))
+            points = [(rng.random(), rng.random()) for _ in range(rng.choice([0, 0, 1, 3]))]
+            self.route.splice_packed_points(start, stop, points)
+            self.assertMatchesRebuild()
+
+    def test_removing_the_extreme_point_shrinks_the_box(self):
+        self.route.splice_packed_points(0, 0, [(0.1, 0.1), (0.9, 0.95), (0.2, 0.3)])
+        self.route.splice_packed_points(1, 2)
+        self.assertAlmostEqual(self.route.max_x, 0.2, places=6)
+        self.assertAlmostEqual(self.route.max_y, 0.3, places=6)
+        self.assertMatchesRebuild()
+
+    def test_removing_everything_clears_the_metrics(self):
+        self.route.splice_packed_points(0, 0, [(0.1, 0.1), (0.9, 0.95)])
+        self.route.splice_packed_points(0, 2)
+        self.assertEqual((self.route.point_count, self.route.length, self.route.min_x), (0, 0.0, None))
+        self.assertFalse(self.route.segment_cells.exists())
+
+
+class RandomSampleTests(TestCase):
+    """
+    Tests for BackgroundImage.objects.random_sample().
+    """
+
+    def create_images(self, count):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return [
+            BackgroundImage.objects.create(name=f'Sample {i}', image=SimpleUploadedFile(f'sample_{i}.jpg', b'img'))
+            for i in range(count)
+        ]
+
+    def test_returns_k_distinct_images(self):
+        self.create_images(20)
+        sample = BackgroundImage.objects.random_sample(9)
+        self.assertEqual(len(sample), 9)
+        self.assertEqual(len({image.pk for image in sample}), 9)
+
+    def test_returns_everything_when_there_are_fewer_than_k(self):
+        images = self.create_images(4)
+        sample = BackgroundImage.objects.random_sample(9)
+        self.assertEqual({image.pk for image in sample}, {image.pk for image in images})
+
+    def test_empty_table(self):
+        self.assertEqual(BackgroundImage.objects.random_sample(9), [])
+
+    def test_sparse_ids_still_fill_the_sample(self):
+        """With most ids deleted, the guesses miss and the contiguous fallback fills up the sample."""
+        images = self.create_images(60)
+        survivors = images[0:60:12] # 5 images spread over the id range
+        BackgroundImage.objects.exclude(pk__in=[image.pk for image in survivors]).delete()
+
+        sample = BackgroundImage.objects.random_sample(5)
+        self.assertEqual({image.pk for image in sample}, {image.pk for image in survivors})
+
+
+class RenditionTests(TestCase):
+    """
+    Tests for the resized copies made by mapping/renditions.py.
+    """
+
+    def setUp(self):
+        # Renditions are written below MEDIA_ROOT, keep them out of the project
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+    def create_image(self, width, height):
+        from io import BytesIO
+        from PIL import Image
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), color=(200, 30, 30)).save(buffer, 'PNG')
+        return BackgroundImage.objects.create(
+            name='Rendition Source',
+            image=SimpleUploadedFile('rendition_source.png', buffer.getvalue(), content_type='image/png')
+        )
+
+    def test_image_size_is_read_on_save(self):
+        background_image = self.create_image(2000, 1000)
+        self.assertEqual((background_image.width, background_image.height), (2000, 1000))
+
+    def test_generate_renditions_creates_every_size_and_format(self):
+        background_image = self.create_image(2000, 1000)
+
+        generate_renditions(background_image.pk)
+
+        sizes = {
+            (r.kind, r.format): (r.width, r.height)
+            for r in BackgroundImageRendition.objects.filter(background_image=background_image)
+        }
+        self.assertEqual(sizes, {
+            ('thumbnail', 'webp'): (320, 160), ('thumbnail', 'jpeg'): (320, 160),
+            ('medium', 'webp'): (1280, 640), ('medium', 'jpeg'): (1280, 640),
+            ('full', 'webp'): (2000, 1000), ('full', 'jpeg'): (2000, 1000),
+        })
+
+    def test_small_images_are_not_enlarged_and_srcset_lists_widths(self):
+        background_image = self.create_image(100, 50)
+        generate_renditions(background_image.pk)
+
+        srcset = background_image.webp_srcset
+        self.assertEqual(srcset.count(' 100w'), 3)
+        self.assertTrue(all(part.split()[0].endswith('.webp') for part in srcset.split(', ')))
+
+    def test_full_webp_of_a_very_wide_source_is_scaled_to_the_webp_limit(self):
+        """WebP cannot go past 16383 px a side; the JPEG keeps the full size."""
+        background_image = self.create_image(16400, 1)
+
+        generate_renditions(background_image.pk)
+
+        sizes = {r.format: (r.width, r.height) for r in background_image.renditions.filter(kind='full')}
+        self.assertEqual(sizes, {'webp': (16383, 1), 'jpeg': (16400, 1)})
+
+    def test_regenerating_replaces_existing_renditions(self):
+        background_image = self.create_image(400, 400)
+        generate_renditions(background_image.pk)
+        first_names = set(background_image.renditions.values_list('image', flat=True))
+        generate_renditions(background_image.pk)
+        self.assertEqual(background_image.renditions.count(), 6)
+        # The old files are replaced under the same names, not left behind next to suffixed copies
+        self.assertEqual(set(background_image.renditions.values_list('image', flat=True)), first_names)
+        for rendition in background_image.renditions.all():
+            self.assertTrue(rendition.image.storage.exists(rendition.image.name))
+
+
 # Note: For full test coverage, you'd also test:
 # - Model field verbose_name, help_text (less critical)
 # - __str__ methods
@@ -0,0 +1,213 @@
+# mapping/tiles.py
+"""
+Deep Zoom (DZI) tile pyramids for large background images.
+
+A pyramid has levels 0..max_level: level max_level is the image at full size and
+every level below is half the size of the one above, down to 1x1 pixel at level 0.
+Each level is cut into TILE_SIZE x TILE_SIZE JPEG tiles (the last row and column
+may be smaller), so a client only needs the tiles in its viewport at its zoom.
+
+All tiles of one pyramid are packed into a single archive file instead of thousands
+of small files:
+
+    header  MAGIC, tile_size, width, height, level count
+    index   (offset, length) of every tile, level 0 first, rows top to bottom,
+            columns left to right within a row
+    data    the JPEG bytes of the tiles
+
+Archives are versioned (BackgroundImage.tiles_version) and never modified after they
+are written, so they can be memory-mapped and tiles served with immutable caching.
+
+Building a pyramid decodes the whole image and takes a while for large scans, so it
+never runs in a web process: the build_tile_pyramids management command builds the
+archives of all images that have none yet, run periodically (e.g. from cron).
+"""
+
+from collections import OrderedDict
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from io import BytesIO
+
+from django.conf import settings
+from django.utils import timezone
+from PIL import Image
+
+from .renditions import open_source_image
+
+TILE_SIZE = 256
+TILE_FORMAT = 'jpg'
+TILE_QUALITY = 85
+
+MAGIC = b'RMTILES1'
+HEADER = struct.Struct('<8sIIII') # magic, tile_size, width, height, levels
+INDEX_ENTRY = struct.Struct('<QI') # offset, length
+
+# Archives kept memory-mapped per process, least recently used ones are closed first
+OPEN_ARCHIVES_LIMIT = 32
+
+
+def max_level(width, height):
+    """Highest pyramid level; at that level the image has its full size."""
+    return math.ceil(math.log2(max(width, height, 1)))
+
+
+def level_size(width, height, level):
+    """(width, height) of the image at a pyramid level."""
+    scale = 2 ** (max_level(width, height) - level)
+    return max(1, math.ceil(width / scale)), max(1, math.ceil(height / scale))
+
+
+def level_grid(width, height, level):
+    """(columns, rows) of tiles at a pyramid level."""
+    level_width, level_height = level_size(width, height, level)
+    return math.ceil(level_width / TILE_SIZE), math.ceil(level_height / TILE_SIZE)
+
+
+def _level_offsets(width, height):
+    """Index position of the first tile of every level (plus the total tile count at the end)."""
+    offsets = [0]
+    for level in range(max_level(width, height) + 1):
+        columns, rows = level_grid(width, height, level)
+        offsets.append(offsets[-1] + columns * rows)
+    return offsets
+
+
+def archive_path(image_id, version):
+    """Filesystem path of one version of an image's tile archive."""
+    return os.path.join(settings.MEDIA_ROOT, 'background_images', 'tiles', str(image_id), f'{version}.tiles')
+
+
+def write_tile_archive(source, path):
+    """
+    Cuts a PIL image into a tile pyramid and writes the archive to `path`.
+    Levels are produced from the top down, each one by halving the previous one,
+    so the full-size image is only decoded once.
+    """
+    width, height = source.size
+    offsets = _level_offsets(width, height)
+    index = [None] * offsets[-1]
+    data_start = HEADER.size + INDEX_ENTRY.size * len(index)
+
+    with open(path, 'wb') as archive:
+        archive.seek(data_start) # The index is filled in once all tile sizes are known
+        level_image = source
+        for level in range(max_level(width, height), -1, -1):
+            level_width, level_height = level_size(width, height, level)
+            if level_image.size != (level_width, level_height):
+                level_image = level_image.resize((level_width, level_height), Image.BOX)
+            columns, rows = level_grid(width, height, level)
+            for row in range(rows):
+                for column in range(columns):
+                    box = (
+                        column * TILE_SIZE, row * TILE_SIZE,
+                        min((column + 1) * TILE_SIZE, level_width), min((row + 1) * TILE_SIZE, level_height),
+                    )
+                    buffer = BytesIO()
+                    level_image.crop(box).save(buffer, 'JPEG', quality=TILE_QUALITY)
+                    index[offsets[level] + row * columns + column] = (archive.tell(), buffer.tell())
+                    archive.write(buffer.getvalue())
+
+        archive.seek(0)
+        archive.write(HEADER.pack(MAGIC, TILE_SIZE, width, height, len(offsets) - 1))
+        archive.write(b''.join(INDEX_ENTRY.pack(*entry) for entry in index))
+
+
+def generate_tile_archive(image_id):
+    """
+    Builds a new version of the tile archive of one background image, then switches
+    the image over to it and removes the older versions.
+    Returns the new tiles_version.
+    """
+    from .models import BackgroundImage
+
+    background_image = BackgroundImage.objects.get(pk=image_id)
+    source = open_source_image(background_image)
+    if source.mode != 'RGB':
+        source = source.convert('RGB') # JPEG tiles, no transparency
+
+    version = background_image.tiles_version + 1
+    path = archive_path(image_id, version)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Write under a temporary name, so a half written archive is never served
+    handle, temporary_path = tempfile.mkstemp(dir=directory, suffix='.partial')
+    os.close(handle)
+    try:
+        write_tile_archive(source, temporary_path)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+    BackgroundImage.objects.filter(pk=image_id).update(tiles_version=version, updated_at=timezone.now())
+    for name in os.listdir(directory):
+        if name != os.path.basename(path) and name.endswith('.tiles'):
+            os.remove(os.path.join(directory, name))
+    return version
+
+
+class TileArchive:
+    """
+    Read access to one memory-mapped archive. Looking up a tile is two slices of the
+    mapping (index entry and tile bytes); the operating system's page cache keeps the
+    hot parts of the file in memory for every worker process.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as archive:
+            self.data = mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.tile_size, self.width, self.height, self.levels = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            self.data.close()
+            raise ValueError(f"{path} is not a tile archive")
+        self.offsets = _level_offsets(self.width, self.height)
+
+    def tile(self, level, column, row):
+        """Returns the JPEG bytes of a tile, or None if there is no such tile."""
+        if not 0 <= level < self.levels:
+            return None
+        columns, rows = level_grid(self.width, self.height, level)
+        if not (0 <= column < columns and 0 <= row < rows):
+            return None
+        position = HEADER.size + INDEX_ENTRY.size * (self.offsets[level] + row * columns + column)
+        offset, length = INDEX_ENTRY.unpack_from(self.data, position)
+        return self.data[offset:offset + length]
+
+
+_open_archives = OrderedDict()
+_open_archives_lock = threading.Lock()
+
+
+def open_archive(image_id, version):
+    """
+    Returns the TileArchive for (image_id, version), mapping it on first use.
+    Raises FileNotFoundError if that version does not exist.
+    """
+    key = (image_id, version)
+    with _open_archives_lock:
+        archive = _open_archives.get(key)
+        if archive is not None:
+            _open_archives.move_to_end(key)
+            return archive
+        archive = TileArchive(archive_path(image_id, version))
+        _open_archives[key] = archive
+        if len(_open_archives) > OPEN_ARCHIVES_LIMIT:
+            # Not closed explicitly: a request may still be slicing it, the
+            # mapping is released once the last reference is gone
+            _open_archives.popitem(last=False)
+        return archive
+
+
+def dzi_descriptor(width, height, tiles_url):
+    """Deep Zoom image descriptor (XML) pointing at the tile view."""
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+        f'Url="{tiles_url}" Format="{TILE_FORMAT}" Overlap="0" TileSize="{TILE_SIZE}">\n'
+        f'  <Size Width="{width}" Height="{height}"/>\n'
+        '</Image>\n'
+    )
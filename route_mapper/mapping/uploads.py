@@ -0,0 +1,100 @@
+# mapping/uploads.py
+"""
+Content-addressed storage of uploaded images (BackgroundImageForm).
+
+An upload is hashed (SHA-256) while it is read chunk by chunk, so it is never held
+in memory as a whole. The file is stored as background_images/<hash>.<extension>,
+and an upload whose bytes are already stored reuses that file instead of writing
+another copy. The pixel size, format and hash are saved on the model at the same
+time, read from the image header Pillow already parsed while validating the form,
+so later reads never have to open the file.
+"""
+
+import hashlib
+
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+
+# File extension per Pillow format name (other formats use the lowercased name)
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'TIFF': 'tif'}
+
+
+def hash_upload(uploaded_file):
+    """SHA-256 (hex) of the upload, read in chunks (a spooled temp file for big uploads)."""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def read_image_info(uploaded_file):
+    """
+    (width, height, format) of the upload. forms.ImageField leaves the Pillow image it
+    verified on the file as `.image`, otherwise only the header is parsed here.
+    """
+    image = getattr(uploaded_file, 'image', None)
+    if image is None:
+        image = Image.open(uploaded_file) # Lazy, reads the header only
+        uploaded_file.seek(0)
+    return image.width, image.height, image.format or ''
+
+
+def content_name(content_hash, image_format):
+    """File name (without the upload_to directory) for the given content."""
+    extension = FORMAT_EXTENSIONS.get(image_format, image_format.lower() or 'bin')
+    return f'{content_hash}.{extension}'
+
+
+def find_stored_copy(instance, field_name, content_hash, name):
+    """
+    Name of a stored file with the same content, or None: the file of another row with
+    the same hash (one indexed query), else the content-addressed name if it exists.
+    """
+    storage = instance._meta.get_field(field_name).storage
+    stored_names = (
+        type(instance)._default_manager.filter(content_hash=content_hash)
+        .exclude(**{field_name: ''}).values_list(field_name, flat=True)[:1]
+    )
+    for stored_name in stored_names:
+        if storage.exists(stored_name):
+            return stored_name
+    return name if storage.exists(name) else None
+
+
+def store_image(instance, uploaded_file, field_name='image'):
+    """
+    Puts the upload into instance.<field_name> by content and sets instance.width,
+    height, format and content_hash. Writes the file only if its bytes are not stored
+    yet (two simultaneous first uploads of the same bytes may still both write one,
+    the storage then gives the second a suffixed name).
+    """
+    content_hash = hash_upload(uploaded_file)
+    instance.width, instance.height, instance.format = read_image_info(uploaded_file)
+    instance.content_hash = content_hash
+
+    field_file = getattr(instance, field_name)
+    name = field_file.field.generate_filename(instance, content_name(content_hash, instance.format))
+    stored_name = find_stored_copy(instance, field_name, content_hash, name)
+    if stored_name:
+        setattr(instance, field_name, stored_name) # Committed name, nothing is written on save
+    else:
+        field_file.save(content_name(content_hash, instance.format), uploaded_file, save=False)
+
+
+class ContentAddressedImageFormMixin:
+    """
+    ModelForm mixin: a newly uploaded image is stored with store_image() when the form
+    is saved (also with commit=False, so views can still set other fields first).
+    """
+    image_field_name = 'image'
+
+    def save(self, commit=True):
+        instance = super().save(commit=False)
+        uploaded_file = self.cleaned_data.get(self.image_field_name)
+        if isinstance(uploaded_file, UploadedFile): # Not when the stored image is kept
+            store_image(instance, uploaded_file, self.image_field_name)
+        if commit:
+            instance.save()
+            self._save_m2m()
+        return instance
@@ -3,11 +3,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 # Import the ViewSets
-from .views import RouteViewSet, RoutePointViewSet
+from .views import RouteViewSet, RoutePointViewSet, BackgroundImageViewSet, ImageUploadViewSet
 
 # Create a router for top-level API endpoints (like /routes/)
 router = DefaultRouter()
 router.register(r'routes', RouteViewSet, basename='route')
+router.register(r'images', BackgroundImageViewSet, basename='image') # /images/{slug}/, /images/{slug}/routes-near/
+router.register(r'uploads', ImageUploadViewSet, basename='image-upload') # Chunked uploads, /uploads/{id}/finalize/
 
 # Manually define the nested URL patterns for RoutePointViewSet
 # Use .as_view() to map HTTP methods to ViewSet actions for specific paths
@@ -18,10 +20,23 @@ urlpatterns = [
     # URL pattern for listing points on a route and creating a new point
     # GET /api/routes/{route_pk}/points/ -> list
     # POST /api/routes/{route_pk}/points/ -> create
+    # PATCH /api/routes/{route_pk}/points/ -> batch_edit (insert / move / delete / update)
     path('routes/<int:route_pk>/points/',
-         RoutePointViewSet.as_view({'get': 'list', 'post': 'create'}),
+         RoutePointViewSet.as_view({'get': 'list', 'post': 'create', 'patch': 'batch_edit'}),
          name='route-points-list'),
 
+    # URL pattern for appending many points in one request
+    # POST /api/routes/{route_pk}/points/bulk/ -> bulk_append
+    path('routes/<int:route_pk>/points/bulk/',
+         RoutePointViewSet.as_view({'post': 'bulk_append'}),
+         name='route-points-bulk'),
+
+    # URL pattern for deleting a range of points by order (inclusive)
+    # DELETE /api/routes/{route_pk}/points/range/?start=<order>&end=<order> -> destroy_range
+    path('routes/<int:route_pk>/points/range/',
+         RoutePointViewSet.as_view({'delete': 'destroy_range'}),
+         name='route-points-range'),
+
     # URL pattern for retrieving, updating, or deleting a specific point
     # GET /api/routes/{route_pk}/points/{pk}/ -> retrieve
     # PUT /api/routes/{route_pk}/points/{pk}/ -> update
@@ -1,35 +1,90 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib.auth.decorators import login_required
-from django.db import models
+from django.db import models, transaction
 
-from .models import BackgroundImage, Route, RoutePoint
+from .models import BackgroundImage, ImageUpload, Route, RoutePoint, RouteSegmentCell
 from .forms import BackgroundImageForm
-from .serializers import RouteSerializer, RoutePointSerializer
-
-from rest_framework import viewsets, status
+from .serializers import (
+    BackgroundImageSerializer, RouteSerializer, RoutePointSerializer,
+    PointRangeSerializer, SimplifyParamsSerializer, RoutesNearParamsSerializer,
+    RouteExportParamsSerializer, RouteImportParamsSerializer, PointBatchSerializer,
+    ImageUploadSerializer, HeatmapParamsSerializer,
+)
+from .pagination import RouteCursorPagination
+from .renditions import schedule_renditions
+from .tiles import dzi_descriptor, open_archive
+from .filters import RouteMetricsFilter
+from . import conditional
+from .export import EXPORT_FORMATS, EXPORT_STREAMS
+from .importers import RouteImportError, import_routes
+from .editing import PointEditError, edit_points
+from .embedded import routes_on_image_json
+from .live import broadcast_route_delta, delta_point
+from .chunked_uploads import (
+    UploadError, UploadOffsetMismatch, append_chunk, delete_upload, finalize_upload, parse_content_range,
+)
+from .ranks import RANK_GAP
+from .renderers import HEATMAP_RENDERERS, CompactEncodingMixin
+
+from rest_framework import filters, mixins, viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
-import random
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.core.cache.utils import make_template_fragment_key
+
+from functools import partial
+
+HOMEPAGE_IMAGE_COUNT = 9 # Images shown in the homepage grid
+HOMEPAGE_GRID_CACHE_SECONDS = 30 # Short, so new uploads show up quickly
+TILE_CACHE_SECONDS = 365 * 24 * 60 * 60 # Tile URLs include the archive version
+CHUNKED_UPLOAD_THRESHOLD = 20 * 1024 * 1024 # Larger uploads go through /api/uploads/
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024 # Bytes per PUT of a chunked upload
 
 
 # --- Keep your existing homepage_view here ---
 def homepage_view(request):
     """
     Displays a list of random background images on the homepage.
-    """
-    all_images = BackgroundImage.objects.all()
-    image_list = list(all_images) # Evaluate queryset before shuffling
-    random_images = random.sample(image_list, min(len(image_list), 9)) # Get up to 9
 
+    The image grid is cached for HOMEPAGE_GRID_CACHE_SECONDS (see the {% cache %} block in
+    the template). The images are passed as a callable, so they are only sampled when
+    the cached grid has expired.
+    """
+    images = BackgroundImage.objects.prefetch_related('renditions')
     context = {
-        'random_images': random_images,
+        'random_images': partial(
+            BackgroundImage.objects.random_sample, HOMEPAGE_IMAGE_COUNT, queryset=images
+        ),
+        'grid_cache_seconds': HOMEPAGE_GRID_CACHE_SECONDS,
     }
     return render(request, 'mapping/homepage.html', context)
 # --------------------------------------------
 
 
+def image_uploaded(background_image):
+    """
+    Follow-up work for a newly saved BackgroundImage, from the upload form
+    or a finalized chunked upload (ImageUploadViewSet).
+    """
+    # Resized versions are made by a background worker after the commit,
+    # so the upload request does not wait for them (the tile pyramid is
+    # built later by the build_tile_pyramids command)
+    schedule_renditions(background_image)
+    # Drop the cached homepage grid (both the logged-in and anonymous variant),
+    # so an almost empty grid does not hide the new image
+    cache.delete_many([
+        make_template_fragment_key('homepage_grid', [authenticated])
+        for authenticated in (True, False)
+    ])
+
+
 @login_required # Ensures only logged-in users can access this view
 def add_background_image_view(request):
     """
@@ -47,6 +102,7 @@ def add_background_image_view(request):
             # Now save the instance to the database
             # The model's save method will handle slug generation here
             background_image.save()
+            image_uploaded(background_image)
 
             # Redirect to a success page or another relevant page
             # Using reverse_lazy is preferred for redirects within views/forms
@@ -57,6 +113,9 @@ def add_background_image_view(request):
 
     context = {
         'form': form,
+        # Files larger than this are sent in chunks through /api/uploads/ by the page's JavaScript
+        'chunked_upload_threshold': CHUNKED_UPLOAD_THRESHOLD,
+        'upload_chunk_size': UPLOAD_CHUNK_SIZE,
     }
     return render(request, 'mapping/add_background_image.html', context)
 
@@ -64,26 +123,64 @@ def add_background_image_view(request):
 def routes_on_image_view(request, image_slug):
     """
     Displays a specific background image and the logged-in user's routes on it.
+    All of those routes and their points are embedded in the page as one JSON blob
+    (cached per user, image and routes version, see mapping/embedded.py), so opening
+    a route does not need an API request per route.
     """
     # Retrieve the background image based on the slug, or return 404 if not found
-    background_image = get_object_or_404(BackgroundImage, slug=image_slug)
+    background_image = get_object_or_404(BackgroundImage.objects.prefetch_related('renditions'), slug=image_slug)
 
-    # Retrieve all Route objects associated with this specific image
-    # AND the currently logged-in user.
-    user_routes_on_image = Route.objects.filter(
-        background_image=background_image,
-        user=request.user
-    )
+    # The currently logged-in user's routes on this specific image, with their points
+    user_routes_on_image, routes_json_script = routes_on_image_json(request.user, background_image)
 
     context = {
         'background_image': background_image,
         'user_routes_on_image': user_routes_on_image,
-        # We'll add route points data here later, potentially via the API or direct query
-        # 'route_points_data': ...
+        'routes_json_script': routes_json_script,
     }
     return render(request, 'mapping/route_management.html', context)
 
 
+def tile_descriptor_view(request, image_slug):
+    """
+    Deep Zoom (.dzi) descriptor of a background image's tile pyramid, for
+    deep zoom viewers. 404 until the pyramid has been built.
+    """
+    background_image = get_object_or_404(BackgroundImage, slug=image_slug)
+    if not background_image.tiles_version:
+        raise Http404("Tiles for this image are not ready yet.")
+    try:
+        archive = open_archive(background_image.pk, background_image.tiles_version)
+    except FileNotFoundError:
+        raise Http404("Tiles for this image are not ready yet.")
+
+    tiles_url = reverse('mapping:tile', kwargs={
+        'image_id': background_image.pk, 'version': background_image.tiles_version,
+        'level': 0, 'column': 0, 'row': 0,
+    }).removesuffix('0/0_0.jpg') # Viewers append "<level>/<column>_<row>.jpg" themselves
+    response = HttpResponse(dzi_descriptor(archive.width, archive.height, tiles_url), content_type='application/xml')
+    # Points at the current archive version, so it must not be cached for long
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+
+def tile_view(request, image_id, version, level, column, row):
+    """
+    Serves one tile straight from the memory-mapped tile archive, without touching
+    the database. A (image, version) archive never changes, so tiles are cached
+    by browsers and proxies for good.
+    """
+    try:
+        tile = open_archive(image_id, version).tile(level, column, row)
+    except FileNotFoundError:
+        tile = None
+    if tile is None:
+        raise Http404("No such tile.")
+    response = HttpResponse(tile, content_type='image/jpeg')
+    patch_cache_control(response, public=True, max_age=TILE_CACHE_SECONDS, immutable=True)
+    return response
+
+
 @login_required # Requires login to see user's routes list
 def user_routes_list_view(request):
     """
@@ -92,7 +189,8 @@ def user_routes_list_view(request):
     """
     # Get all routes for the current logged-in user
     # The related_name='routes' on the user field in the Route model is used here
-    user_routes = request.user.routes.all().order_by('-created_at') # Order by creation date, newest first
+    # select_related: the template shows each route's image name and slug
+    user_routes = request.user.routes.select_related('background_image').order_by('-created_at') # Order by creation date, newest first
 
     context = {
         'user_routes': user_routes,
@@ -102,22 +200,154 @@ def user_routes_list_view(request):
 
 # --- API ViewSets ---
 
+def get_simplify_params(request):
+    """
+    Returns the validated level-of-detail parameters of the request
+    ({'tolerance': ..., 'max_points': ...}, only the ones given),
+    or an empty dict when the full polyline was requested.
+    Invalid values are reported as a 400 response.
+    """
+    params = SimplifyParamsSerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    return dict(params.validated_data)
+
+
 # Route ViewSet (Keep existing RouteViewSet)
-class RouteViewSet(viewsets.ModelViewSet):
+class RouteViewSet(CompactEncodingMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows routes to be viewed or edited.
     Limited to routes owned by the authenticated user.
+    list and retrieve also answer in the compact encodings (see mapping/renderers.py).
     """
     serializer_class = RouteSerializer
+    pagination_class = RouteCursorPagination
+    # ?length_min=, ?bbox=, ... and ?ordering=-length etc. (the metrics are plain columns on Route)
+    filter_backends = [RouteMetricsFilter, filters.OrderingFilter]
+    ordering_fields = ['created_at', 'name', 'point_count', 'length', 'length_px']
+    ordering = ['-created_at', 'id']
     # permission_classes = [IsAuthenticated] # Explicitly mention if needed
 
     def get_queryset(self):
         """
         Return a list of all the routes for the currently authenticated user.
+        The background image is joined in, its renditions and the points are prefetched
+        (the points only when they are serialized), so a page of routes costs a fixed
+        number of queries whatever its size.
+        """
+        if not self.request.user.is_authenticated:
+            return Route.objects.none()
+
+        routes = (
+            self.request.user.routes
+            .select_related('background_image')
+            .prefetch_related('background_image__renditions')
+            .order_by('-created_at', 'id')
+        )
+        # The compact encodings read the packed geometry, never the RoutePoint rows
+        if (self.request.query_params.get('points', 'full') == 'full' and not get_simplify_params(self.request)
+                and not self.compact_encoding()):
+            routes = routes.prefetch_related('points')
+        return routes
+
+    # Conditional GET: an unchanged route list / route is answered with 304 Not Modified
+    # after one small query, without loading points or serializing (see mapping/conditional.py)
+    @method_decorator(condition(
+        etag_func=conditional.route_list_etag, last_modified_func=conditional.route_list_last_modified
+    ))
+    def list(self, request, *args, **kwargs):
+        encoding = self.compact_encoding()
+        if not encoding:
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        return self.get_paginated_response(self.compact_routes_data(page, encoding))
+
+    @method_decorator(condition(
+        etag_func=conditional.route_etag, last_modified_func=conditional.route_last_modified
+    ))
+    def retrieve(self, request, *args, **kwargs):
+        encoding = self.compact_encoding()
+        if not encoding:
+            return super().retrieve(request, *args, **kwargs)
+        return Response(self.compact_routes_data([self.get_object()], encoding)[0])
+
+    def compact_routes_data(self, routes, encoding):
+        """
+        The routes in a compact encoding: the usual route fields without 'points',
+        plus the geometry encoded from the packed points (see mapping/encodings.py).
+        ?points=none leaves the geometry out, as in the JSON response.
         """
-        if self.request.user.is_authenticated:
-            return self.request.user.routes.all().order_by('-created_at')
-        return Route.objects.none()
+        context = self.get_serializer_context()
+        context['points_mode'] = 'none'
+        data = self.get_serializer_class()(routes, many=True, context=context).data
+        if self.request.query_params.get('points') == 'none':
+            return data
+        # Imported here so NumPy is only loaded when a compact encoding is actually used
+        from .encodings import route_geometry
+
+        precision = self.get_polyline_precision()
+        for route, route_data in zip(routes, data):
+            route_data.update(route_geometry(route, encoding, precision, context['simplify']))
+        return data
+
+    def get_serializer_context(self):
+        """
+        Passes the level-of-detail parameters (?tolerance= / ?max_points=) to the serializer.
+        """
+        context = super().get_serializer_context()
+        context['simplify'] = get_simplify_params(self.request)
+        return context
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Streams all of the user's routes with their points in one download.
+        GET /api/routes/export/?export_format=geojson|ndjson|csv (default geojson)
+        The metric filters of the list (?length_min=, ?bbox=, ...) apply here too.
+
+        The response is generated while it is sent, from one iterated query over the
+        routes' packed geometry, so memory stays flat however much is exported.
+        """
+        params = RouteExportParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        export_format = params.validated_data['export_format']
+
+        routes = RouteMetricsFilter().filter_queryset(
+            request, Route.objects.filter(user=request.user), self
+        ).order_by('-created_at', 'id')
+        content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(EXPORT_STREAMS[export_format](routes), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="routes.{extension}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_file(self, request):
+        """
+        Creates routes from an uploaded GPX, GeoJSON or CSV file (multipart form).
+        POST /api/routes/import/ with file, background_image_id and optionally
+        file_format, frame (normalized|pixels|bounds|fit) and bounds (west,south,east,north).
+
+        The file is parsed as a stream and the points written in chunks (one multi-row insert each),
+        all in one transaction: either every route is imported or none.
+        Returns {"routes": n, "points": n, "route_ids": [...]}.
+        """
+        params = RouteImportParamsSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        try:
+            routes = import_routes(
+                data['file'], data['file_format'], request.user, data['background_image'],
+                frame=data.get('frame'), bounds=data.get('bounds'),
+            )
+        except RouteImportError as error:
+            return Response({'file': [str(error)]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {
+                'routes': len(routes),
+                'points': sum(route.point_count for route in routes),
+                'route_ids': [route.pk for route in routes],
+            },
+            status=status.HTTP_201_CREATED,
+        )
 
     def perform_create(self, serializer):
         """
@@ -125,22 +355,172 @@ class RouteViewSet(viewsets.ModelViewSet):
         """
         serializer.save(user=self.request.user)
 
+    def perform_update(self, serializer):
+        """
+        Saves the route and, if it was moved to another background image,
+        moves its spatial index entries along with it.
+        """
+        with transaction.atomic():
+            route = serializer.save()
+            route.segment_cells.exclude(background_image=route.background_image).update(
+                background_image=route.background_image
+            )
+            # Name, description or image changed (the points did not)
+            broadcast_route_delta(route, 'reload')
+
+    def perform_destroy(self, instance):
+        # In one transaction, so 'deleted' is sent once the delete has committed
+        # and not at all if it fails (the route's pk is gone after delete())
+        with transaction.atomic():
+            broadcast_route_delta(instance, 'deleted')
+            instance.delete()
+
+
+class BackgroundImageViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint for reading background images, looked up by slug (/api/images/{slug}/).
+    """
+    queryset = BackgroundImage.objects.prefetch_related('renditions').order_by('-uploaded_at')
+    serializer_class = BackgroundImageSerializer
+    lookup_field = 'slug'
+
+    @action(detail=True, methods=['get'], url_path='routes-near')
+    def routes_near(self, request, slug=None):
+        """
+        Lists the authenticated user's routes on this image that pass within r of (x, y).
+        GET /api/images/{slug}/routes-near/?x=<x>&y=<y>&r=<r> (normalized image units)
+
+        The spatial grid index (RouteSegmentCell) narrows the search down to the routes
+        crossing the cells around the point, then the exact distance is checked on
+        their packed geometry. Results are sorted by distance.
+        """
+        # Imported here so NumPy is only loaded when the spatial helpers are actually used
+        from .simplification import coords_array
+        from .spatial import cells_in_radius, distance_to_polyline
+
+        params = RoutesNearParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        x, y, r = (params.validated_data[key] for key in ('x', 'y', 'r'))
+
+        background_image = self.get_object()
+        min_cell_x, min_cell_y, max_cell_x, max_cell_y = cells_in_radius(x, y, r)
+        candidate_ids = RouteSegmentCell.objects.filter(
+            background_image=background_image,
+            cell_x__gte=min_cell_x, cell_x__lte=max_cell_x,
+            cell_y__gte=min_cell_y, cell_y__lte=max_cell_y,
+        ).values('route_id')
+        candidates = Route.objects.filter(pk__in=candidate_ids, user=request.user).only('id', 'name', 'packed_points')
+
+        results = []
+        for route in candidates:
+            distance = distance_to_polyline(coords_array(route.packed_points), x, y)
+            if distance <= r:
+                results.append({'id': route.pk, 'name': route.name, 'distance': distance})
+        results.sort(key=lambda result: result['distance'])
+        return Response(results)
+
+    @action(detail=True, methods=['get'], renderer_classes=HEATMAP_RENDERERS)
+    @method_decorator(condition(etag_func=conditional.image_heatmap_etag))
+    def heatmap(self, request, slug=None):
+        """
+        Route density of this image over the routes of all users.
+        GET /api/images/{slug}/heatmap/?resolution=64|128|256|512|1024 (default 256)
+
+        As JSON (or MessagePack) the grid is resolution x resolution little-endian float32
+        cells, row by row from the top, each about how many times routes pass through it
+        (base64 encoded in JSON). With Accept: image/png or ?format=png it is a transparent
+        PNG overlay of resolution x resolution pixels, to be stretched over the image.
+        The grid is stored and only rebuilt when the image's routes changed (see
+        mapping/heatmaps.py); unchanged heatmaps answer If-None-Match with 304.
+        """
+        # Imported here so NumPy is only loaded when heatmaps are actually used
+        from .heatmaps import get_heatmap, heatmap_data, heatmap_png
+
+        params = HeatmapParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        heatmap = get_heatmap(self.get_object(), params.validated_data['resolution'])
+        if request.accepted_renderer.format == 'png':
+            return Response(heatmap_png(heatmap))
+        return Response(heatmap_data(heatmap, binary=request.accepted_renderer.format == 'msgpack'))
+
+
+class ImageUploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                         mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    API endpoint for resumable chunked uploads of background images
+    (see mapping/chunked_uploads.py). Only the uploading user sees an upload.
+
+    POST   /api/uploads/                -> start: {name, description, filename, size}
+    GET    /api/uploads/{id}/           -> progress, `offset` is where the next chunk starts
+    PUT    /api/uploads/{id}/           -> one chunk as the raw body,
+                                           with Content-Range: bytes <first>-<last>/<size>
+    POST   /api/uploads/{id}/finalize/  -> create the BackgroundImage once all bytes are in
+    DELETE /api/uploads/{id}/           -> abandon the upload
+    """
+    serializer_class = ImageUploadSerializer
+
+    def get_queryset(self):
+        return ImageUpload.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def update(self, request, pk=None):
+        """
+        Appends one chunk. The body is streamed into the partial file, never read
+        into memory (request.data is not touched, so no parser runs).
+        A chunk that does not start at the current offset gets 409 with that offset.
+        """
+        upload = self.get_object()
+        try:
+            start, length, total = parse_content_range(request.headers.get('Content-Range'))
+            if total != upload.size:
+                raise UploadError(f"The Content-Range total must be the upload size, {upload.size}.")
+            if length != int(request.META.get('CONTENT_LENGTH') or 0):
+                raise UploadError("The Content-Length must match the Content-Range.")
+            upload = append_chunk(upload, request.stream, start, length)
+        except UploadOffsetMismatch as error:
+            return Response({'detail': str(error), 'offset': error.offset}, status=status.HTTP_409_CONFLICT)
+        except UploadError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(upload).data)
+
+    def perform_destroy(self, instance):
+        delete_upload(instance)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """
+        Creates the BackgroundImage from a completely received upload
+        POST /api/uploads/{id}/finalize/ -> 201 with the new image
+        """
+        try:
+            background_image = finalize_upload(self.get_object())
+        except UploadError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        image_uploaded(background_image)
+        serializer = BackgroundImageSerializer(background_image, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 # Route Point ViewSet (Nested under Route)
-class RoutePointViewSet(viewsets.ModelViewSet):
+class RoutePointViewSet(CompactEncodingMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows route points to be viewed, added, updated, or deleted.
     Nested under a specific route (/api/routes/{route_pk}/points/).
     Limited to points on routes owned by the authenticated user.
+    The point list also answers in the compact encodings (see mapping/renderers.py).
     """
     serializer_class = RoutePointSerializer
+    compact_actions = ('list',)
     # permission_classes = [IsAuthenticated] # Default IsAuthenticated applies
 
-    def get_queryset(self):
+    def get_route(self, lock=False):
         """
-        This view should return a list of all the points
-        for the route specified in the URL, ensuring the route belongs
+        Returns the route specified in the URL, ensuring it belongs
         to the authenticated user.
+        With lock=True the route row is locked for the rest of the current transaction
+        (used by the write paths, which update the route's packed geometry).
         """
         # Get the route_pk from the URL keyword arguments
         route_pk = self.kwargs.get('route_pk')
@@ -151,59 +531,239 @@ class RoutePointViewSet(viewsets.ModelViewSet):
         # Using filter().first() + check could return 403 if needed.
         # Let's use get_object_or_404 for simplicity as a non-existent *user-owned*
         # route resource should appear as Not Found.
-        route = get_object_or_404(Route.objects.filter(user=self.request.user), pk=route_pk)
+        routes = Route.objects.filter(user=self.request.user)
+        if lock:
+            # The image size is needed for the route's pixel metrics, lock only the route row
+            routes = routes.select_related('background_image').select_for_update(of=('self',))
+        return get_object_or_404(routes, pk=route_pk)
+
+    def get_queryset(self):
+        """
+        This view should return a list of all the points
+        for the route specified in the URL, ensuring the route belongs
+        to the authenticated user.
+        """
+        route = self.get_route()
 
         # Return the points for this specific route, ordered by 'order' (Meta class default)
+        # (their dense positions are numbered by RoutePointListSerializer)
         return route.points.all()
 
-
-    def perform_create(self, serializer):
+    def get_object(self):
         """
-        Sets the route and the order field for a new route point.
+        The point, with its dense position in the route (the number of points before it).
+        The write paths read it under the route lock instead (see locate_point).
         """
-        # Get the route_pk from the URL keyword arguments
-        route_pk = self.kwargs.get('route_pk')
+        point = super().get_object()
+        if self.action == 'retrieve':
+            point.position = RoutePoint.objects.filter(route_id=point.route_id, order__lt=point.order).count()
+        return point
+
+    @method_decorator(condition(
+        etag_func=conditional.route_points_etag, last_modified_func=conditional.route_points_last_modified
+    ))
+    def list(self, request, *args, **kwargs):
+        """
+        Lists the route's points. With ?tolerance= and/or ?max_points= the route is
+        simplified first and only the kept points are returned, as {"order", "x", "y"}.
+        In a compact encoding all of the points come from one query, without the serializer.
+        Answers 304 Not Modified when the route's version is unchanged (If-None-Match).
+        """
+        simplify = get_simplify_params(request)
+        encoding = self.compact_encoding()
+        if encoding:
+            from .encodings import route_points_payload # NumPy, see RouteViewSet.compact_routes_data
+            return Response(route_points_payload(self.get_route(), encoding, self.get_polyline_precision(), simplify))
+        if not simplify:
+            return super().list(request, *args, **kwargs)
+        return Response(self.get_route().simplified_points(**simplify))
+
+    @method_decorator(condition(
+        etag_func=conditional.route_points_etag, last_modified_func=conditional.route_points_last_modified
+    ))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def reserve_ranks(self, count):
+        """
+        Reserves `count` ranks at the end of the route specified in the URL and returns
+        (route, first reserved rank); the ranks are RANK_GAP apart.
+
+        The reservation is a single "SET next_rank = next_rank + n" UPDATE, so two
+        requests appending at the same time can never be handed the same rank (no
+        Max('order') lookup racing the other writer on unique_together). Because it
+        is the transaction's first statement, it also makes concurrent writers to the
+        route wait for each other before they read the route's packed geometry,
+        including on SQLite, where select_for_update does nothing.
+        """
+        Route.objects.filter(user=self.request.user, pk=self.kwargs.get('route_pk')).update(
+            next_rank=models.F('next_rank') + count * RANK_GAP
+        )
+        route = self.get_route(lock=True) # 404 if the route is not the user's
+        return route, route.next_rank - count * RANK_GAP
 
-        # Fetch the Route object again, ensuring it belongs to the user
-        route = get_object_or_404(Route.objects.filter(user=self.request.user), pk=route_pk)
+    def lock_route(self):
+        """
+        Locks the route specified in the URL for the rest of the transaction and returns it.
+        Like reserve_ranks(), it starts with an UPDATE of the route row, so the writers
+        that do not append still wait for the others on SQLite too.
+        """
+        route, _ = self.reserve_ranks(0)
+        return route
 
-        # Determine the next sequential order number for this route's points
-        # Get the highest existing order number for this route
-        # Use 0 if no points exist yet.
-        highest_order = route.points.aggregate(models.Max('order'))['order__max']
-        next_order = (highest_order or -1) + 1  # Start with 0 if max is None (first point)
+    def locate_point(self, route, point):
+        """
+        Re-reads the point's rank and dense position once the route is locked: the ones
+        read by get_object() may be out of date if a point was inserted or deleted in
+        front of it meanwhile. 404 if the point itself was deleted.
+        """
+        points_before = (
+            RoutePoint.objects.filter(route_id=models.OuterRef('route_id'), order__lt=models.OuterRef('order'))
+            .values('route_id').annotate(count=models.Count('pk')).values('count')
+        )
+        row = (
+            route.points.filter(pk=point.pk)
+            .annotate(position=models.functions.Coalesce(models.Subquery(points_before), 0))
+            .values_list('order', 'position').first()
+        )
+        if row is None:
+            raise Http404
+        point.order, point.position = row
 
-        # Check if the next_order value already exists in the route's points
-        while route.points.filter(order=next_order).exists():
-            next_order += 1  # Increment order until it's unique
+    def perform_create(self, serializer):
+        """
+        Sets the route and the rank for a new route point: appended to the end, or
+        with "index" in the data, inserted at that position (with a rank between its
+        neighbours, see mapping/ranks.py). Either way only the new row is written.
+        """
+        with transaction.atomic():
+            # An end rank is reserved even for inserts, the reservation orders concurrent writers
+            route, end_rank = self.reserve_ranks(1)
+            index = serializer.validated_data.pop('index', None)
+            rank = None
+            if index is not None and index < route.point_count:
+                rank = RoutePoint.objects.rank_at(route.pk, index)
+
+            if rank is None:
+                point = serializer.save(route=route, order=end_rank)
+                point.position = route.point_count
+                route.append_packed_points([(point.x, point.y)])
+                broadcast_route_delta(route, 'append', position=point.position, points=[delta_point(point)])
+            else:
+                point = serializer.save(route=route, order=rank)
+                route.splice_packed_points(index, index, [(point.x, point.y)])
+                point.position = index
+                broadcast_route_delta(route, 'insert', position=index, points=[delta_point(point)])
+
+    def perform_update(self, serializer):
+        """
+        Saves the new coordinates and updates the point in the route's packed geometry.
+        """
+        with transaction.atomic():
+            route = self.lock_route()
+            self.locate_point(route, serializer.instance)
+            point = serializer.save()
+            route.splice_packed_points(point.position, point.position + 1, [(point.x, point.y)])
+            broadcast_route_delta(route, 'move', position=point.position, point=delta_point(point))
+
+    def bulk_append(self, request, *args, **kwargs):
+        """
+        Appends a list of points ([{"x": ..., "y": ...}, ...]) to the end of the route.
+        POST /api/routes/{route_pk}/points/bulk/
 
-        # Save the serializer, associating the point with the fetched route
-        # and setting the determined order.
-        # The serializer's validated_data already contains x and y.
-        serializer.save(route=route, order=next_order)
+        The whole list is validated in one pass and written with a single bulk_create,
+        so a long trace costs a handful of queries instead of one request per point.
+        """
+        # many=True wraps RoutePointSerializer in a ListSerializer, so every item
+        # goes through the same x/y validation as a single POST.
+        serializer = self.get_serializer(data=request.data, many=True, allow_empty=False)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            # One UPDATE reserves evenly spaced ranks for the whole batch
+            route, first_order = self.reserve_ranks(len(serializer.validated_data))
+            first_position = route.point_count
+
+            new_points = []
+            for i, point_data in enumerate(serializer.validated_data):
+                point_data.pop('index', None)
+                new_points.append(RoutePoint(route=route, order=first_order + i * RANK_GAP, **point_data))
+            RoutePoint.objects.bulk_create(new_points)
+            route.append_packed_points((point.x, point.y) for point in new_points)
+            for i, point in enumerate(new_points):
+                point.position = first_position + i
+            broadcast_route_delta(route, 'append', position=first_position, points=[delta_point(point) for point in new_points])
+
+        response_serializer = self.get_serializer(new_points, many=True)
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+
+    def batch_edit(self, request, *args, **kwargs):
+        """
+        Applies a list of operations (insert, move, delete, update; see mapping/editing.py)
+        to the route's points, all or nothing, in one transaction.
+        PATCH /api/routes/{route_pk}/points/
+        {"operations": [{"op": "delete", "start": 2, "end": 4}, ...], "version": 7}
 
-    # Optional: Override perform_destroy to re-order points after deletion if needed
-    # This adds complexity. A simpler approach is to leave gaps or re-order client-side
-    # on retrieve and only renumber in a specific reorder API call.
-    # Given "Simple Sequential" order logic decision, reordering on delete *is* required
-    # for strict sequential ordering without gaps.
+        The points are renumbered once for the whole batch. Returns the route's new
+        version and point count; 409 if "version" was given and the route has changed since.
+        """
+        serializer = PointBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        expected_version = serializer.validated_data.get('version')
+
+        with transaction.atomic():
+            route = self.lock_route()
+            if expected_version is not None and expected_version != route.version:
+                return Response(
+                    {'detail': "The route has been changed in the meantime.", 'version': route.version},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            try:
+                edit_points(route, serializer.validated_data['operations'])
+            except PointEditError as error:
+                # Nothing has been written yet, the positions are checked before saving
+                return Response({'operations': [str(error)]}, status=status.HTTP_400_BAD_REQUEST)
+            # Several operations at once, subscribers simply fetch the route again
+            broadcast_route_delta(route, 'reload')
+
+        return Response({'version': route.version, 'point_count': route.point_count}, status=status.HTTP_200_OK)
+
+    # Ranks may have gaps, so deleting never renumbers the following points:
+    # their dense positions shift down by themselves.
 
     def perform_destroy(self, instance):
         """
-        Deletes the point and re-orders subsequent points for the same route.
+        Deletes the point (a single row) and removes it from the packed geometry.
         """
-        # Get the route before deletion
-        route = instance.route
-        deleted_order = instance.order
-
-        # Delete the instance
-        instance.delete()
-
-        # Renumber points after the deleted point
-        # Retrieve points for the route that had an order greater than the deleted one
-        points_to_renumber = route.points.filter(order__gt=deleted_order).order_by('order')
-
-        # Update the order of subsequent points
-        for i, point in enumerate(points_to_renumber):
-            point.order = deleted_order + i # Assign new sequential order
-            point.save()
\ No newline at end of file
+        with transaction.atomic():
+            route = self.lock_route()
+            self.locate_point(route, instance)
+            instance.delete()
+            route.splice_packed_points(instance.position, instance.position + 1)
+            broadcast_route_delta(route, 'delete', position=instance.position, count=1)
+
+    def destroy_range(self, request, *args, **kwargs):
+        """
+        Deletes the points at positions start..end (inclusive).
+        DELETE /api/routes/{route_pk}/points/range/?start=<position>&end=<position>
+        """
+        range_serializer = PointRangeSerializer(data=request.query_params)
+        range_serializer.is_valid(raise_exception=True)
+        start = range_serializer.validated_data['start']
+        end = range_serializer.validated_data['end']
+
+        with transaction.atomic():
+            route = self.lock_route()
+            # Ranks of the first and the last point of the range
+            ranks = route.points.order_by('order').values_list('order', flat=True)
+            first_rank = ranks[start:start + 1].first()
+            last_rank = ranks[end:end + 1].first()
+            if last_rank is None: # The range runs past the end
+                last_rank = ranks.last()
+            deleted_count = 0
+            if first_rank is not None:
+                deleted_count, _ = route.points.filter(order__gte=first_rank, order__lte=last_rank).delete()
+                route.splice_packed_points(start, start + deleted_count)
+                broadcast_route_delta(route, 'delete', position=start, count=deleted_count)
+
+        return Response({'deleted': deleted_count}, status=status.HTTP_200_OK)
@@ -10,6 +10,10 @@ urlpatterns = [
     path('add-background-image/', views.add_background_image_view, name='add_background_image'),
     path('on/<slug:image_slug>/', views.routes_on_image_view, name='routes_on_image'),
 
+    # Deep zoom tile pyramid of an image (see mapping/tiles.py)
+    path('tiles/<slug:image_slug>.dzi', views.tile_descriptor_view, name='tile_descriptor'),
+    path('tiles/<int:image_id>/<int:version>/<int:level>/<int:column>_<int:row>.jpg', views.tile_view, name='tile'),
+
     # New URL for listing all routes for the user
     path('routes/', views.user_routes_list_view, name='user_routes_list'), # <-- Add this line
 
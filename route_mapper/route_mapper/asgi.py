@@ -2,6 +2,9 @@
 ASGI config for route_mapper project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django as usual, WebSockets (live route editing, see mapping/routing.py)
+to Channels, with the session user in the scope. Channels is optional (like in
+mapping/live.py): without it this is the plain Django application, HTTP only.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +16,21 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'route_mapper.settings')
 
-application = get_asgi_application()
+# Set up Django before the consumers (and the models they import) are loaded
+django_asgi_application = get_asgi_application()
+
+try:
+    from channels.auth import AuthMiddlewareStack
+    from channels.routing import ProtocolTypeRouter, URLRouter
+    from channels.security.websocket import AllowedHostsOriginValidator
+except ImportError: # Channels not installed, no WebSockets
+    application = django_asgi_application
+else:
+    import mapping.routing
+
+    application = ProtocolTypeRouter({
+        'http': django_asgi_application,
+        'websocket': AllowedHostsOriginValidator(
+            AuthMiddlewareStack(URLRouter(mapping.routing.websocket_urlpatterns))
+        ),
+    })
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -76,6 +77,22 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'route_mapper.wsgi.application'
+# WebSockets (live route editing) need the optional channels package and an ASGI server,
+# e.g. daphne route_mapper.asgi:application. Without channels the ASGI app serves HTTP only.
+ASGI_APPLICATION = 'route_mapper.asgi.application'
+
+# Channel layer carrying the live route deltas (see mapping/live.py). The in-memory layer
+# only reaches consumers in the same process; with several processes (or WSGI workers
+# writing the points), set REDIS_URL to use Redis (needs channels_redis).
+if os.environ.get('REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.environ['REDIS_URL']]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
 
 # Media files (user uploads)
 MEDIA_URL = '/media/'
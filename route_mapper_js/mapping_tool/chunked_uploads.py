@@ -0,0 +1,161 @@
+# mapping_tool/chunked_uploads.py
+"""
+Wznawialne wgrywanie map w kawałkach (endpointy /api/uploads/).
+
+Duży skan nie jest wysyłany jednym POST-em multipart, który blokuje workera na cały
+transfer. Klient tworzy MapUpload (tytuł, nazwa pliku, rozmiar), a potem wysyła plik
+PUT-ami w kawałkach, każdy z nagłówkiem Content-Range mówiącym, gdzie się zaczyna.
+Każdy kawałek jest strumieniowany z żądania prosto do pliku częściowego w storage
+(bez buforowania w pamięci ani w pliku tymczasowym), a MapUpload.offset zapisuje,
+ile dotarło. Po przerwaniu klient odczytuje offset i kontynuuje od tego miejsca.
+Finalizacja przenosi plik częściowy na miejsce (zmiana nazwy, bez wczytywania do
+pamięci) i tworzy Map zwykłym save(), razem z generowaniem slugu.
+
+Kawałki są dopisywane do pliku na dysku, więc potrzebny jest storage z lokalnymi
+ścieżkami (FileSystemStorage, domyślny w projekcie).
+"""
+
+import os
+import re
+
+from django.core.files import File
+from django.db import transaction
+from PIL import Image
+
+from .models import Map, MapUpload
+from .uploads import store_image
+
+# Największy przyjmowany plik (bajty)
+MAX_UPLOAD_SIZE = 2 * 1024 ** 3
+# Ile bajtów naraz czytamy z żądania i zapisujemy do pliku
+READ_SIZE = 64 * 1024
+
+CONTENT_RANGE_PATTERN = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadError(ValueError):
+    """Kawałek albo gotowy upload został odrzucony (zły zakres, to nie obrazek, ...)."""
+
+
+class UploadOffsetMismatch(UploadError):
+    """Kawałek nie zaczyna się tam, gdzie kończą się odebrane dane; `offset` mówi gdzie."""
+
+    def __init__(self, offset):
+        super().__init__(f"Kawałek musi zaczynać się od bajtu {offset}.")
+        self.offset = offset
+
+
+class PartialUploadFile(File):
+    """
+    Gotowy plik częściowy. Dzięki temporary_file_path() FileSystemStorage przenosi go
+    na miejsce zamiast kopiować (tak jak TemporaryUploadedFile w Django).
+    """
+
+    def temporary_file_path(self):
+        return self.name
+
+
+def _storage():
+    return Map._meta.get_field('image').storage
+
+
+def parse_content_range(header):
+    """(start, długość, całość) z nagłówka Content-Range "bytes <pierwszy>-<ostatni>/<całość>"."""
+    match = CONTENT_RANGE_PATTERN.match(header or '')
+    if not match:
+        raise UploadError('Content-Range musi mieć postać "bytes <pierwszy>-<ostatni>/<całość>".')
+    first, last, total = (int(group) for group in match.groups())
+    if last < first:
+        raise UploadError("Ostatni bajt w Content-Range jest przed pierwszym.")
+    return first, last - first + 1, total
+
+
+def append_chunk(upload, stream, start, length):
+    """
+    Zapisuje `length` bajtów czytanych ze `stream` od bajtu `start` pliku częściowego
+    i zwraca zaktualizowany upload. Wiersz uploadu jest w tym czasie zablokowany, więc
+    dwa żądania nie piszą naraz do tego samego uploadu. Jeśli strumień skończy się
+    wcześniej (klient się rozłączył), to, co dotarło, zostaje, a offset mówi ile.
+    """
+    with transaction.atomic():
+        upload = MapUpload.objects.select_for_update().get(pk=upload.pk)
+        if start != upload.offset:
+            raise UploadOffsetMismatch(upload.offset)
+        if start + length > upload.size:
+            raise UploadError(f"Kawałek kończy się za zadeklarowanym rozmiarem {upload.size} B.")
+
+        path = _storage().path(upload.partial_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        remaining = length
+        with open(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as partial_file:
+            partial_file.seek(start)
+            partial_file.truncate() # Bajty wcześniej przerwanego zapisu nie zostały policzone
+            while remaining:
+                data = stream.read(min(READ_SIZE, remaining))
+                if not data:
+                    break
+                partial_file.write(data)
+                remaining -= len(data)
+
+        upload.offset = start + length - remaining
+        upload.save(update_fields=['offset', 'updated_at'])
+    return upload
+
+
+def finalize_upload(upload):
+    """
+    Zamienia w pełni odebrany upload na Map: plik częściowy jest zapisywany według
+    zawartości (zob. mapping_tool/uploads.py: przeniesiony albo pominięty, jeśli te
+    bajty już są zapisane), a mapa zapisywana, co generuje jej slug.
+    Usuwa upload i zwraca nową mapę.
+
+    Jeśli zapis się nie uda po przeniesieniu pliku, plik wraca na swoje miejsce, więc
+    upload (wycofany razem z transakcją) można sfinalizować jeszcze raz.
+    """
+    storage = _storage()
+    partial_name = upload.partial_name # delete() czyści upload.pk
+    map_instance = Map()
+    try:
+        with transaction.atomic():
+            upload = MapUpload.objects.select_for_update().get(pk=upload.pk)
+            if upload.offset != upload.size:
+                raise UploadError(f"Odebrano dopiero {upload.offset} z {upload.size} B.")
+            if Map.objects.filter(title=upload.title).exists():
+                raise UploadError("Mapa o tym tytule już istnieje.")
+
+            map_instance = Map(title=upload.title, uploader=upload.uploader)
+            path = storage.path(partial_name)
+            try:
+                with Image.open(path): # Czyta tylko nagłówek
+                    pass
+            except (OSError, Image.DecompressionBombError): # Brak pliku albo Pillow go nie odczyta
+                raise UploadError("Wgrany plik nie jest poprawnym obrazkiem.")
+            with PartialUploadFile(open(path, 'rb'), name=path) as partial_file:
+                store_image(map_instance, partial_file)
+            map_instance.save()
+            upload.delete()
+    except Exception:
+        _restore_partial_file(storage, map_instance.image, partial_name)
+        raise
+
+    # Zostaje, jeśli ta zawartość była już zapisana
+    if storage.exists(partial_name):
+        storage.delete(partial_name)
+    return map_instance
+
+
+def _restore_partial_file(storage, field_file, partial_name):
+    # Pliku częściowego nie ma tylko wtedy, gdy store_image() przeniósł go pod nazwę
+    # obrazka (użyta już zapisana kopia zostawia go na miejscu i nie wolno jej ruszać)
+    path = storage.path(partial_name)
+    if field_file.name and not os.path.exists(path) and storage.exists(field_file.name):
+        os.replace(storage.path(field_file.name), path)
+
+
+def delete_upload(upload):
+    """Usuwa niedokończony upload razem z plikiem częściowym."""
+    partial_name = upload.partial_name
+    upload.delete()
+    storage = _storage()
+    if storage.exists(partial_name):
+        storage.delete(partial_name)
@@ -1,8 +1,11 @@
 # mapping_tool/forms.py
 from django import forms
 from .models import Map
+from .uploads import ContentAddressedImageFormMixin
 
-class MapForm(forms.ModelForm):
+class MapForm(ContentAddressedImageFormMixin, forms.ModelForm):
+    # Obrazek jest zapisywany według zawartości: ten sam plik wgrany ponownie używa
+    # zapisanej kopii, a rozmiar, format i hash trafiają do modelu (zob. mapping_tool/uploads.py)
     class Meta:
         model = Map
         fields = ['title', 'image'] # Wykluczamy uploader i slug
@@ -0,0 +1,31 @@
+# mapping_tool/management/commands/clear_stale_uploads.py
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mapping_tool.chunked_uploads import delete_upload
+from mapping_tool.models import MapUpload
+
+
+class Command(BaseCommand):
+    """
+    Usuwa uploady w kawałkach (zob. mapping_tool/chunked_uploads.py), do których od
+    --hours godzin nie dotarł żaden kawałek, razem z ich plikami częściowymi.
+    Do uruchamiania okresowo, np. z crona.
+    Użycie: python manage.py clear_stale_uploads --hours 48
+    """
+    help = "Usuwa porzucone uploady map w kawałkach i ich pliki częściowe."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24,
+                            help="Uploady nieruszane od tylu godzin są usuwane.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        deleted = 0
+        for upload in MapUpload.objects.filter(updated_at__lt=cutoff).iterator():
+            delete_upload(upload)
+            deleted += 1
+        self.stdout.write(self.style.SUCCESS(f"Usunięto {deleted} porzuconych uploadów."))
@@ -4,6 +4,8 @@ from django.conf import settings
 from django.utils.text import slugify
 import uuid
 
+from .slugs import save_with_unique_slug
+
 # Predefiniowane kolory dla Kamieni Drogi (Waystones)
 # Zgodnie z założeniami z "Master Prompt" (10 kolorów)
 WAYSTONE_COLORS = [
@@ -29,23 +31,54 @@ class Map(models.Model):
     image = models.ImageField(upload_to='maps/')
     slug = models.SlugField(max_length=220, unique=True, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Rozmiar w pikselach, format Pillow (JPEG, PNG, ...) i SHA-256 pliku, zapisywane przy
+    # uploadzie (zob. mapping_tool/uploads.py); mapy o tym samym content_hash dzielą jeden plik
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    format = models.CharField(max_length=10, blank=True, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
 
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            base_slug = slugify(self.title)
-            slug_candidate = base_slug
-            # Prosta obsługa unikalności slugu, można rozbudować
-            num = 1
-            while Map.objects.filter(slug=slug_candidate).exists():
-                slug_candidate = f"{base_slug}-{num}"
-                num += 1
-            self.slug = slug_candidate
+            # Jedno zapytanie o wolny slug + ponowne próby przy kolizji
+            # z równoległym uploadem (zob. mapping_tool/slugs.py)
+            save_with_unique_slug(self, slugify(self.title), lambda: super(Map, self).save(*args, **kwargs))
+            return
         super().save(*args, **kwargs)
 
 
+class MapUpload(models.Model):
+    """
+    Mapa wgrywana w kawałkach (zob. mapping_tool/chunked_uploads.py).
+    Kawałki są dopisywane do pliku częściowego w storage; `offset` to liczba bajtów,
+    które już dotarły, więc przerwany upload jest kontynuowany od tego miejsca.
+    Finalizacja tworzy Map i usuwa ten wiersz.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploader = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='map_uploads'
+    )
+    title = models.CharField(max_length=200) # Tytuł mapy tworzonej przy finalizacji
+    filename = models.CharField(max_length=255) # Nazwa pliku na komputerze użytkownika
+    size = models.PositiveBigIntegerField() # Całkowity rozmiar pliku w bajtach
+    offset = models.PositiveBigIntegerField(default=0, editable=False) # Ile bajtów już dotarło
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size} B)"
+
+    @property
+    def partial_name(self):
+        """Nazwa (w storage) pliku, do którego dopisywane są kawałki."""
+        return f'uploads/partial/{self.pk}.part'
+
+
 class Board(models.Model):
     creator = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -1,7 +1,8 @@
 # mapping_tool/serializers.py
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Map, Board, Waystone, WAYSTONE_COLORS, UserPathSegment
+from .models import Map, MapUpload, Board, Waystone, WAYSTONE_COLORS, UserPathSegment
+from .chunked_uploads import MAX_UPLOAD_SIZE
 from collections import Counter # Do zliczania kolorów
 
 User = get_user_model()
@@ -17,8 +18,8 @@ class MapSerializer(serializers.ModelSerializer):
     class Meta:
         model = Map
         # UPEWNIJ SIĘ, ŻE 'image' JEST NA LIŚCIE PÓL
-        fields = ['id', 'title', 'image', 'slug', 'uploader', 'uploaded_at']
-        read_only_fields = ['slug', 'uploader', 'uploaded_at']
+        fields = ['id', 'title', 'image', 'width', 'height', 'slug', 'uploader', 'uploaded_at']
+        read_only_fields = ['width', 'height', 'slug', 'uploader', 'uploaded_at']
 
     # Ta metoda jest kluczowa dla uzyskania pełnego URL obrazka
     def to_representation(self, instance):
@@ -38,6 +39,26 @@ class MapSerializer(serializers.ModelSerializer):
 
 # --- Nowe serializery ---
 
+class MapUploadSerializer(serializers.ModelSerializer):
+    # Wgrywanie mapy w kawałkach (zob. mapping_tool/chunked_uploads.py):
+    # tworzony z tytułem, nazwą pliku i rozmiarem, `offset` mówi, gdzie zaczyna się następny kawałek
+    class Meta:
+        model = MapUpload
+        fields = ['id', 'title', 'filename', 'size', 'offset', 'created_at', 'updated_at']
+        read_only_fields = ['offset', 'created_at', 'updated_at']
+
+    def validate_title(self, value):
+        # Map.title jest unikalny, lepiej dowiedzieć się o tym przed wysłaniem całego pliku
+        if Map.objects.filter(title=value).exists():
+            raise serializers.ValidationError("Mapa o tym tytule już istnieje.")
+        return value
+
+    def validate_size(self, value):
+        if not 0 < value <= MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError(f"Rozmiar musi być między 1 a {MAX_UPLOAD_SIZE} B.")
+        return value
+
+
 class WaystoneSerializer(serializers.ModelSerializer):
     class Meta:
         model = Waystone
@@ -111,8 +132,8 @@ class BoardSerializer(serializers.ModelSerializer):
         # creator jest ustawiany w perform_create ViewSetu, więc nie ma go w validated_data na tym etapie
         # jeśli by nie był, to: validated_data['creator'] = self.context['request'].user
         board = Board.objects.create(**validated_data)
-        for waystone_data in waystones_data:
-            Waystone.objects.create(board=board, **waystone_data)
+        # Jedno zapytanie na wszystkie kamienie zamiast jednego na kamień
+        Waystone.objects.bulk_create(Waystone(board=board, **waystone_data) for waystone_data in waystones_data)
         return board
 
     def update(self, instance, validated_data):
@@ -128,8 +149,7 @@ class BoardSerializer(serializers.ModelSerializer):
         # Aktualizuj Waystones (jeśli zostały dostarczone)
         if waystones_data is not None: # Jeśli przekazano waystones_input (nawet jako pustą listę)
             instance.waystones.all().delete() # Usuń stare waystones
-            for waystone_data in waystones_data:
-                Waystone.objects.create(board=instance, **waystone_data)
+            Waystone.objects.bulk_create(Waystone(board=instance, **waystone_data) for waystone_data in waystones_data)
         
         return instance
     
@@ -0,0 +1,66 @@
+# mapping_tool/slugs.py
+"""
+Przydzielanie unikalnych slugów (Map.slug).
+
+Slugi mają postać base, base-1, base-2, ... Następny wolny slug jest wyznaczany
+jednym zapytaniem agregującym (najwyższy użyty sufiks liczbowy dla danej bazy),
+zamiast sprawdzania base-1, base-2, ... po jednym zapytaniu na próbę.
+"""
+
+import re
+
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Cast, Length, Substr
+
+# Liczba prób zapisu, zanim poddamy się przy ciągłych kolizjach slugu
+SAVE_ATTEMPTS = 5
+
+
+def allocate_slug(queryset, base_slug, field='slug'):
+    """
+    Zwraca pierwszy wolny slug dla `base_slug`: sam base_slug, jeśli jest wolny,
+    w przeciwnym razie base_slug-N, gdzie N jest o jeden większe od najwyższego
+    użytego sufiksu.
+
+    Baza kończąca się już liczbą (np. "pietro-2") działa tak samo: jej kopie to
+    "pietro-2-1", ..., i nie są brane za numerowane kopie "pietro" (za sufiks
+    uznajemy tylko slugi pasujące dokładnie do base-<cyfry>).
+    """
+    suffix_pattern = rf'^{re.escape(base_slug)}-[0-9]+$'
+    suffix_start = len(base_slug) + 2 # Substr() liczy od 1, pomijamy "base-"
+    # Prefiks może użyć indeksu na slugu, regex sprawdza już tylko znalezione wiersze
+    taken = queryset.filter(
+        models.Q(**{field: base_slug}) | models.Q(**{f'{field}__startswith': f'{base_slug}-'})
+    ).aggregate(
+        base_taken=models.Count('pk', filter=models.Q(**{field: base_slug})),
+        # Sufiksy porównujemy jako liczby, żeby base-10 było po base-9
+        highest_suffix=models.Max(
+            Cast(Substr(field, suffix_start, Length(field)), models.IntegerField()),
+            filter=models.Q(**{f'{field}__regex': suffix_pattern}),
+        ),
+    )
+    if not taken['base_taken']:
+        return base_slug
+    return f"{base_slug}-{(taken['highest_suffix'] or 0) + 1}"
+
+
+def save_with_unique_slug(instance, base_slug, save, field='slug'):
+    """
+    Ustawia nowo przydzielony slug na `instance` i zapisuje obiekt wywołując `save()`.
+
+    Dwa równoległe uploady mogą dostać ten sam slug, zanim którykolwiek zostanie
+    zapisany - przegrany trafia na unikalny indeks. Wtedy slug jest przydzielany
+    ponownie (już widząc wiersz zwycięzcy) i zapis powtarzany, łącznie najwyżej
+    SAVE_ATTEMPTS razy (w każdej rundzie kolizji ktoś wygrywa).
+    """
+    queryset = type(instance)._default_manager.all()
+    for attempt in range(SAVE_ATTEMPTS):
+        setattr(instance, field, allocate_slug(queryset, base_slug, field))
+        try:
+            # Savepoint, żeby nieudany INSERT nie zepsuł zewnętrznej transakcji
+            with transaction.atomic():
+                save()
+            return
+        except IntegrityError:
+            if attempt == SAVE_ATTEMPTS - 1:
+                raise
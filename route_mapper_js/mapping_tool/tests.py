@@ -1,3 +1,410 @@
-from django.test import TestCase
+# mapping_tool/tests.py
+"""
+Budżety zapytań: ile zapytań SQL może wykonać każdy endpoint.
 
-# Create your tests here.
+Każdy endpoint ma zadeklarowane maksimum (QUERY_BUDGETS), które nie może zależeć
+od wielkości wyniku. Dlatego każde żądanie jest wysyłane przy rosnących danych
+(więcej map, plansz, kamieni, segmentów ścieżek...) i przy każdym rozmiarze musi
+zmieścić się w tym samym budżecie. Zmiana serializera, która wprowadzi jedno
+zapytanie na obiekt (N+1), kończy się tutaj błędem z listą wykonanych zapytań.
+
+Na końcu testy zapisywania wgrywanych map według zawartości (mapping_tool/uploads.py).
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from .models import Map, Board, Waystone, UserPathSegment, WAYSTONE_COLORS
+
+User = get_user_model()
+
+# Maksymalna liczba zapytań na żądanie, niezależnie od liczby map / plansz / kamieni / segmentów
+QUERY_BUDGETS = {
+    # API (force_authenticate, więc bez zapytań o sesję i użytkownika)
+    'map-list': 1,
+    'map-detail': 1,
+    'board-list': 2,
+    'board-detail': 2,
+    'board-create': 5,
+    'board-update': 8,
+    'board-delete': 5,
+    'board-user-paths': 2,
+    'board-user-paths-save': 5,
+    # Strony (logowanie przez sesję: zapytania o sesję i użytkownika wliczone)
+    'home': 4,
+    'add-map': 2,
+    'create-board': 3,
+    'play-board': 4,
+    'signup': 0,
+}
+
+# Rozmiary danych, przy których sprawdzany jest każdy endpoint
+FIXTURE_SIZES = [1, 5, 25]
+
+
+class QueryBudgetMixin:
+    """
+    assertQueryBudget() wysyła żądanie raz dla każdego rozmiaru danych
+    i porównuje liczbę zapytań z zadeklarowanym budżetem endpointu.
+    """
+
+    def assertQueryBudget(self, endpoint, grow, request, sizes=FIXTURE_SIZES):
+        """
+        grow(size) powiększa dane do rozmiaru `size` (wywoływane z rosnącymi rozmiarami),
+        request(size) wysyła żądanie i zwraca odpowiedź. Błąd, jeśli żądanie wykona
+        więcej zapytań niż QUERY_BUDGETS[endpoint] albo odpowie błędem (4xx/5xx).
+        """
+        budget = QUERY_BUDGETS[endpoint]
+        for size in sizes:
+            grow(size)
+            with CaptureQueriesContext(connection) as queries:
+                response = request(size)
+
+            self.assertLess(response.status_code, 400, f"{endpoint} (rozmiar {size}) odpowiedział {response.status_code}")
+            if len(queries) > budget:
+                listing = '\n'.join(f"  {number}. {query['sql']}" for number, query in enumerate(queries.captured_queries, 1))
+                self.fail(
+                    f"{endpoint} wykonał {len(queries)} zapytań przy rozmiarze danych {size}, "
+                    f"budżet to {budget}:\n{listing}"
+                )
+
+
+class QueryBudgetFixtures(QueryBudgetMixin):
+    """Wspólne dane: użytkownik, mapa i plansza; metody do ich powiększania."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='budzet', password='testpassword')
+        self.map = self.create_map(0)
+        self.board = self.create_board(0)
+
+    def create_map(self, number):
+        # Slug podany wprost, plik obrazka nie jest potrzebny (używany jest tylko jego URL)
+        return Map.objects.create(uploader=self.user, title=f'Mapa {number}', slug=f'mapa-{number}', image='maps/mapa.png')
+
+    def create_board(self, number):
+        board = Board.objects.create(creator=self.user, map_reference=self.map, name=f'Plansza {number}', grid_rows=10, grid_cols=10)
+        Waystone.objects.bulk_create([
+            Waystone(board=board, row=0, col=0, color='red'),
+            Waystone(board=board, row=9, col=9, color='red'),
+        ])
+        return board
+
+    def grow_maps(self, size):
+        for number in range(Map.objects.count(), size):
+            self.create_map(number)
+
+    def grow_boards(self, size):
+        """`size` plansz (każda z mapą innego uploadera i dwoma kamieniami)."""
+        for number in range(Board.objects.count(), size):
+            uploader = User.objects.create_user(username=f'uploader{number}')
+            self.map = Map.objects.create(uploader=uploader, title=f'Mapa planszy {number}', slug=f'mapa-planszy-{number}', image='maps/mapa.png')
+            self.create_board(number)
+
+    def grow_waystones(self, size):
+        """`size` kamieni na planszy self.board (po jednym w każdym polu pierwszych wierszy)."""
+        existing = self.board.waystones.count()
+        Waystone.objects.bulk_create([
+            Waystone(board=self.board, row=1 + number // 10, col=number % 10, color=WAYSTONE_COLORS[number % 10][0])
+            for number in range(existing, size)
+        ])
+
+    def grow_segments(self, size):
+        existing = UserPathSegment.objects.filter(board=self.board, user=self.user).count()
+        UserPathSegment.objects.bulk_create([
+            UserPathSegment(board=self.board, user=self.user, start_row=0, start_col=number, end_row=0, end_col=number + 1)
+            for number in range(existing, size)
+        ])
+
+
+def waystones_input(size):
+    """Poprawny zestaw kamieni do zapisu: po dwa kamienie dla min(size, 10) kolorów."""
+    return [
+        {'row': row, 'col': color_number, 'color': WAYSTONE_COLORS[color_number][0]}
+        for color_number in range(min(size, len(WAYSTONE_COLORS)))
+        for row in (0, 1)
+    ]
+
+
+class ApiQueryBudgetTests(QueryBudgetFixtures, APITestCase):
+    """
+    Budżety zapytań endpointów API (/api/maps/, /api/boards/).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def board_url(self, board=None):
+        return reverse('board-detail', kwargs={'pk': (board or self.board).pk})
+
+    def test_map_list(self):
+        self.assertQueryBudget('map-list', self.grow_maps, lambda size: self.client.get(reverse('map-list')))
+
+    def test_map_detail(self):
+        self.assertQueryBudget(
+            'map-detail', self.grow_maps, lambda size: self.client.get(reverse('map-detail', kwargs={'pk': self.map.pk}))
+        )
+
+    def test_board_list(self):
+        self.assertQueryBudget('board-list', self.grow_boards, lambda size: self.client.get(reverse('board-list')))
+
+    def test_board_detail(self):
+        self.assertQueryBudget('board-detail', self.grow_waystones, lambda size: self.client.get(self.board_url()))
+
+    def test_board_create(self):
+        def create(size):
+            data = {
+                'name': f'Nowa {size}', 'map_reference': self.map.pk, 'grid_rows': 10, 'grid_cols': 10,
+                'waystones_input': waystones_input(size),
+            }
+            return self.client.post(reverse('board-list'), data, format='json')
+
+        self.assertQueryBudget('board-create', lambda size: None, create)
+
+    def test_board_update(self):
+        def update(size):
+            data = {
+                'name': f'Zmieniona {size}', 'map_reference': self.map.pk, 'grid_rows': 10, 'grid_cols': 10,
+                'waystones_input': waystones_input(size),
+            }
+            return self.client.put(self.board_url(), data, format='json')
+
+        self.assertQueryBudget('board-update', lambda size: None, update)
+
+    def test_board_delete(self):
+        boards = {}
+
+        def grow(size):
+            self.grow_waystones(size) # Kamienie usuwanej planszy
+            boards[size] = self.board
+            self.board = self.create_board(size)
+
+        self.assertQueryBudget('board-delete', grow, lambda size: self.client.delete(self.board_url(boards[size])))
+
+    def test_user_paths(self):
+        url = reverse('board-user-paths', kwargs={'pk': self.board.pk})
+        self.assertQueryBudget('board-user-paths', self.grow_segments, lambda size: self.client.get(url))
+
+    def test_user_paths_save(self):
+        url = reverse('board-user-paths', kwargs={'pk': self.board.pk})
+        segments = lambda size: [
+            {'start_row': 0, 'start_col': number, 'end_row': 1, 'end_col': number} for number in range(size)
+        ]
+        self.assertQueryBudget(
+            'board-user-paths-save', self.grow_segments, lambda size: self.client.post(url, segments(size), format='json')
+        )
+
+
+class WebQueryBudgetTests(QueryBudgetFixtures, APITestCase):
+    """
+    Budżety zapytań stron aplikacji.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_home(self):
+        def grow(size):
+            self.grow_maps(size)
+            self.grow_boards(size)
+
+        self.assertQueryBudget('home', grow, lambda size: self.client.get(reverse('home')))
+
+    def test_add_map_form(self):
+        self.assertQueryBudget('add-map', self.grow_maps, lambda size: self.client.get(reverse('mapping_tool:add_map')))
+
+    def test_create_board_form(self):
+        self.assertQueryBudget(
+            'create-board', self.grow_maps, lambda size: self.client.get(reverse('mapping_tool:create_board'))
+        )
+
+    def test_play_board(self):
+        self.assertQueryBudget(
+            'play-board', self.grow_waystones,
+            lambda size: self.client.get(reverse('mapping_tool:play_board', kwargs={'board_id': self.board.pk})),
+        )
+
+    def test_signup_form(self):
+        self.client.logout()
+        self.assertQueryBudget('signup', lambda size: None, lambda size: self.client.get(reverse('signup')))
+
+
+# Najmniejszy poprawny GIF (1x1 piksel), formularz sprawdza, czy plik jest obrazkiem
+GIF_1PX = (
+    b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00'
+    b',\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;'
+)
+
+
+class ContentAddressedUploadTests(TestCase):
+    """
+    Mapy wgrywane przez MapForm są zapisywane według zawartości (mapping_tool/uploads.py).
+    """
+
+    def setUp(self):
+        # Pliki trafiają do MEDIA_ROOT, trzymamy je poza projektem
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.user = User.objects.create_user(username='kartograf', password='testpassword')
+        self.client.force_login(self.user)
+
+    def upload(self, title, file_name, content=GIF_1PX):
+        data = {'title': title, 'image': SimpleUploadedFile(file_name, content, content_type='image/gif')}
+        response = self.client.post(reverse('mapping_tool:add_map'), data)
+        self.assertEqual(response.status_code, 302)
+        return Map.objects.get(title=title)
+
+    def stored_files(self):
+        return sorted(os.listdir(os.path.join(self.media_root, 'maps')))
+
+    def test_upload_zapisuje_rozmiar_format_i_hash(self):
+        map_instance = self.upload('Mapa', 'mapa.gif')
+
+        content_hash = hashlib.sha256(GIF_1PX).hexdigest()
+        self.assertEqual((map_instance.width, map_instance.height, map_instance.format), (1, 1, 'GIF'))
+        self.assertEqual(map_instance.content_hash, content_hash)
+        self.assertEqual(map_instance.image.name, f'maps/{content_hash}.gif')
+
+    def test_identyczne_uploady_dziela_jeden_plik(self):
+        first = self.upload('Pierwsza kopia', 'test_map.gif')
+        second = self.upload('Druga kopia', 'test_map_kopia.gif')
+
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(self.stored_files(), [os.path.basename(first.image.name)])
+
+    def test_rozne_uploady_maja_osobne_pliki(self):
+        other_gif = GIF_1PX.replace(b'\xff\xff\xff', b'\x00\x80\x00') # Inny kolor w palecie
+        first = self.upload('Biały piksel', 'piksel.gif')
+        second = self.upload('Zielony piksel', 'piksel.gif', other_gif)
+
+        self.assertNotEqual(first.content_hash, second.content_hash)
+        self.assertEqual(len(self.stored_files()), 2)
+
+
+class ChunkedUploadApiTests(APITestCase):
+    """
+    Wznawialne wgrywanie map w kawałkach (/api/uploads/, mapping_tool/chunked_uploads.py).
+    """
+
+    def setUp(self):
+        from io import BytesIO
+        from PIL import Image
+
+        # Pliki częściowe i gotowe trafiają do MEDIA_ROOT, trzymamy je poza projektem
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.user = User.objects.create_user(username='skaner', password='testpassword')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        buffer = BytesIO()
+        Image.effect_noise((120, 80), 64).save(buffer, 'PNG') # Szum, żeby PNG się nie skompresował do zera
+        self.content = buffer.getvalue()
+
+    def start_upload(self, title='Skan planu'):
+        response = self.client.post(
+            reverse('map-upload-list'), {'title': title, 'filename': 'skan.png', 'size': len(self.content)}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def put_chunk(self, upload_id, start, data):
+        return self.client.generic(
+            'PUT', reverse('map-upload-detail', kwargs={'pk': upload_id}), data,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{start + len(data) - 1}/{len(self.content)}',
+        )
+
+    def finalize(self, upload_id):
+        return self.client.post(reverse('map-upload-finalize', kwargs={'pk': upload_id}))
+
+    def test_wgrywanie_w_kawalkach_tworzy_mape(self):
+        upload_id = self.start_upload()
+        for start in range(0, len(self.content), 1000):
+            self.assertEqual(self.put_chunk(upload_id, start, self.content[start:start + 1000]).status_code, 200)
+
+        response = self.finalize(upload_id)
+
+        self.assertEqual(response.status_code, 201)
+        map_instance = Map.objects.get(pk=response.data['id'])
+        self.assertEqual((map_instance.slug, map_instance.uploader), ('skan-planu', self.user))
+        self.assertEqual((map_instance.width, map_instance.height, map_instance.format), (120, 80, 'PNG'))
+        self.assertEqual(map_instance.content_hash, hashlib.sha256(self.content).hexdigest())
+        with map_instance.image.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads', 'partial')), [])
+
+    def test_kawalek_z_zlego_miejsca_dostaje_offset(self):
+        upload_id = self.start_upload()
+        self.put_chunk(upload_id, 0, self.content[:1000])
+
+        conflict = self.put_chunk(upload_id, 500, self.content[500:1500])
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(conflict.data['offset'], 1000)
+        self.assertEqual(self.client.get(reverse('map-upload-detail', kwargs={'pk': upload_id})).data['offset'], 1000)
+        # Niepełny upload nie może być sfinalizowany
+        self.assertEqual(self.finalize(upload_id).status_code, 400)
+
+    def test_nieudana_finalizacja_zostawia_plik_czesciowy(self):
+        """Jeśli mapy nie da się zapisać, przeniesiony plik wraca, a upload można sfinalizować ponownie."""
+        from unittest import mock
+        from django.db import DatabaseError
+        from .chunked_uploads import finalize_upload
+        from .models import MapUpload
+        upload_id = self.start_upload()
+        self.put_chunk(upload_id, 0, self.content)
+
+        with mock.patch.object(Map, 'save', side_effect=DatabaseError('brak miejsca')):
+            with self.assertRaises(DatabaseError):
+                finalize_upload(MapUpload.objects.get(pk=upload_id))
+
+        self.assertTrue(MapUpload.objects.filter(pk=upload_id).exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'maps')), [])
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 201)
+        with Map.objects.get(pk=response.data['id']).image.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_porzucone_uploady_sa_usuwane_komenda(self):
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import MapUpload
+        stary = self.start_upload('Stary skan')
+        self.put_chunk(stary, 0, self.content[:1000])
+        MapUpload.objects.filter(pk=stary).update(updated_at=timezone.now() - timedelta(hours=25))
+        nowy = self.start_upload('Nowy skan')
+        self.put_chunk(nowy, 0, self.content[:1000])
+
+        call_command('clear_stale_uploads', stdout=StringIO())
+
+        self.assertEqual([str(pk) for pk in MapUpload.objects.values_list('pk', flat=True)], [nowy])
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads', 'partial')), [f'{nowy}.part'])
+
+    def test_tytul_zajety_jest_odrzucany_na_starcie(self):
+        Map.objects.create(uploader=self.user, title='Zajęty', image='maps/mapa.png')
+        response = self.client.post(
+            reverse('map-upload-list'), {'title': 'Zajęty', 'filename': 'skan.png', 'size': 10}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
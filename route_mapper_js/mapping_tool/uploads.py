@@ -0,0 +1,101 @@
+# mapping_tool/uploads.py
+"""
+Zapisywanie wgrywanych obrazków według zawartości (MapForm).
+
+Plik jest haszowany (SHA-256) podczas czytania kawałek po kawałku, więc nigdy nie
+trzymamy go w pamięci w całości. Zapisujemy go jako maps/<hash>.<rozszerzenie>,
+a upload o bajtach, które już są zapisane, używa istniejącego pliku zamiast
+zapisywać kolejną kopię. Jednocześnie na modelu zapisujemy szerokość, wysokość,
+format i hash, odczytane z nagłówka, który Pillow sparsował już przy walidacji
+formularza, więc później nie trzeba otwierać pliku.
+"""
+
+import hashlib
+
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+
+# Rozszerzenie pliku dla nazwy formatu z Pillow (pozostałe formaty: nazwa małymi literami)
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'TIFF': 'tif'}
+
+
+def hash_upload(uploaded_file):
+    """SHA-256 (hex) uploadu, czytanego kawałkami (duże uploady są w pliku tymczasowym)."""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def read_image_info(uploaded_file):
+    """
+    (szerokość, wysokość, format) uploadu. forms.ImageField zostawia na pliku
+    sprawdzony obrazek Pillow jako `.image`, w przeciwnym razie czytamy tylko nagłówek.
+    """
+    image = getattr(uploaded_file, 'image', None)
+    if image is None:
+        image = Image.open(uploaded_file) # Leniwie, czyta tylko nagłówek
+        uploaded_file.seek(0)
+    return image.width, image.height, image.format or ''
+
+
+def content_name(content_hash, image_format):
+    """Nazwa pliku (bez katalogu upload_to) dla danej zawartości."""
+    extension = FORMAT_EXTENSIONS.get(image_format, image_format.lower() or 'bin')
+    return f'{content_hash}.{extension}'
+
+
+def find_stored_copy(instance, field_name, content_hash, name):
+    """
+    Nazwa zapisanego pliku o tej samej zawartości albo None: plik innego wiersza
+    z tym samym hashem (jedno zapytanie po indeksie), a jeśli go nie ma, nazwa
+    według zawartości, o ile taki plik istnieje.
+    """
+    storage = instance._meta.get_field(field_name).storage
+    stored_names = (
+        type(instance)._default_manager.filter(content_hash=content_hash)
+        .exclude(**{field_name: ''}).values_list(field_name, flat=True)[:1]
+    )
+    for stored_name in stored_names:
+        if storage.exists(stored_name):
+            return stored_name
+    return name if storage.exists(name) else None
+
+
+def store_image(instance, uploaded_file, field_name='image'):
+    """
+    Umieszcza upload w instance.<field_name> według zawartości i ustawia instance.width,
+    height, format i content_hash. Plik jest zapisywany tylko wtedy, gdy tych bajtów
+    jeszcze nie ma (dwa równoczesne pierwsze uploady tych samych bajtów mogą oba go
+    zapisać, storage nada wtedy drugiemu nazwę z sufiksem).
+    """
+    content_hash = hash_upload(uploaded_file)
+    instance.width, instance.height, instance.format = read_image_info(uploaded_file)
+    instance.content_hash = content_hash
+
+    field_file = getattr(instance, field_name)
+    name = field_file.field.generate_filename(instance, content_name(content_hash, instance.format))
+    stored_name = find_stored_copy(instance, field_name, content_hash, name)
+    if stored_name:
+        setattr(instance, field_name, stored_name) # Nazwa już zapisanego pliku, save() nic nie zapisze
+    else:
+        field_file.save(content_name(content_hash, instance.format), uploaded_file, save=False)
+
+
+class ContentAddressedImageFormMixin:
+    """
+    Mixin dla ModelForm: nowo wgrany obrazek jest zapisywany przez store_image() przy
+    zapisie formularza (także z commit=False, żeby widok mógł jeszcze ustawić inne pola).
+    """
+    image_field_name = 'image'
+
+    def save(self, commit=True):
+        instance = super().save(commit=False)
+        uploaded_file = self.cleaned_data.get(self.image_field_name)
+        if isinstance(uploaded_file, UploadedFile): # Nie wtedy, gdy zostaje zapisany obrazek
+            store_image(instance, uploaded_file, self.image_field_name)
+        if commit:
+            instance.save()
+            self._save_m2m()
+        return instance
@@ -6,6 +6,7 @@ from . import views_api
 router = DefaultRouter()
 router.register(r'maps', views_api.MapViewSet, basename='map')
 router.register(r'boards', views_api.BoardViewSet, basename='board') # Dodajemy BoardViewSet
+router.register(r'uploads', views_api.MapUploadViewSet, basename='map-upload') # Mapy wgrywane w kawałkach
 
 urlpatterns = [
     path('', include(router.urls)),
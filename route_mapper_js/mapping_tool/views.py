@@ -9,6 +9,9 @@ from .models import Map, WAYSTONE_COLORS, Board
 from .serializers import BoardSerializer
 import json
 
+CHUNKED_UPLOAD_THRESHOLD = 20 * 1024 * 1024 # Większe mapy idą przez /api/uploads/
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024 # Bajtów na jeden PUT wgrywania w kawałkach
+
 
 def signup_view(request):
     if request.method == 'POST':
@@ -35,13 +38,20 @@ def add_map_view(request):
             return redirect('home') # Przekierowanie na stronę główną (lub listę map)
     else:
         form = MapForm()
-    return render(request, 'mapping_tool/add_map.html', {'form': form})
+    context = {
+        'form': form,
+        # Większe pliki JavaScript strony wysyła w kawałkach przez /api/uploads/
+        'chunked_upload_threshold': CHUNKED_UPLOAD_THRESHOLD,
+        'upload_chunk_size': UPLOAD_CHUNK_SIZE,
+    }
+    return render(request, 'mapping_tool/add_map.html', context)
 
 
 
 def home_view(request):
-    maps = Map.objects.all().order_by('-uploaded_at')[:6] # Pokaż kilka ostatnich map
-    user_boards = Board.objects.filter(creator=request.user).order_by('-updated_at') if request.user.is_authenticated else []
+    # select_related: szablon pokazuje uploadera mapy i tytuł mapy planszy
+    maps = Map.objects.select_related('uploader').order_by('-uploaded_at')[:6] # Pokaż kilka ostatnich map
+    user_boards = Board.objects.filter(creator=request.user).select_related('map_reference').order_by('-updated_at') if request.user.is_authenticated else []
     context = {
         'maps': maps,
         'user_boards': user_boards, # Dodajemy dla przyszłego listowania plansz użytkownika
@@ -83,7 +93,10 @@ def play_board_view(request, board_id):
     # Pobierz planszę lub zwróć 404. Można dodać sprawdzanie, czy użytkownik jest twórcą,
     # jeśli "granie" ma być ograniczone tylko do twórcy lub ma jakieś specjalne uprawnienia.
     # Na razie zakładamy, że jeśli zna ID i jest zalogowany, może zobaczyć.
-    board = get_object_or_404(Board, id=board_id)
+    board = get_object_or_404(
+        Board.objects.select_related('creator', 'map_reference__uploader').prefetch_related('waystones'),
+        id=board_id,
+    )
     # board = get_object_or_404(Board, id=board_id, creator=request.user) # Jeśli tylko właściciel
 
     # Serializuj dane planszy, aby łatwo przekazać je do JS (w tym waystones)
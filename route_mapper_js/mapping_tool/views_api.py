@@ -1,20 +1,77 @@
 # mapping_tool/views_api.py
-from rest_framework import viewsets, permissions, status
+from django.db import transaction
+from rest_framework import mixins, viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response # WAŻNE
 
-from .models import Map, Board, Waystone, UserPathSegment # WAŻNE (UserPathSegment)
-from .serializers import MapSerializer, BoardSerializer, WaystoneSerializer, UserPathSegmentSerializer # WAŻNE (UserPathSegmentSerializer)
+from .models import Map, MapUpload, Board, Waystone, UserPathSegment # WAŻNE (UserPathSegment)
+from .serializers import MapSerializer, MapUploadSerializer, BoardSerializer, WaystoneSerializer, UserPathSegmentSerializer # WAŻNE (UserPathSegmentSerializer)
+from .chunked_uploads import (
+    UploadError, UploadOffsetMismatch, append_chunk, delete_upload, finalize_upload, parse_content_range,
+)
 from .permissions import IsOwnerOrReadOnly
 
 class MapViewSet(viewsets.ModelViewSet):
     # ... (bez zmian)
-    queryset = Map.objects.all().order_by('-uploaded_at')
+    # select_related: MapSerializer pokazuje uploadera, bez tego jedno zapytanie na mapę
+    queryset = Map.objects.select_related('uploader').order_by('-uploaded_at')
     serializer_class = MapSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     http_method_names = ['get', 'head', 'options']
 
 
+class MapUploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                       mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Wznawialne wgrywanie map w kawałkach (zob. mapping_tool/chunked_uploads.py).
+    Upload widzi tylko użytkownik, który go zaczął.
+
+    POST   /api/uploads/                -> start: {title, filename, size}
+    GET    /api/uploads/{id}/           -> postęp, `offset` to początek następnego kawałka
+    PUT    /api/uploads/{id}/           -> jeden kawałek jako surowe body,
+                                           z Content-Range: bytes <pierwszy>-<ostatni>/<rozmiar>
+    POST   /api/uploads/{id}/finalize/  -> tworzy Map, gdy dotarły wszystkie bajty
+    DELETE /api/uploads/{id}/           -> porzuca upload
+    """
+    serializer_class = MapUploadSerializer
+
+    def get_queryset(self):
+        return MapUpload.objects.filter(uploader=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(uploader=self.request.user)
+
+    def update(self, request, pk=None):
+        # Body jest strumieniowane do pliku częściowego, nigdy nie trafia w całości do pamięci
+        # (nie sięgamy po request.data, więc żaden parser się nie uruchamia).
+        # Kawałek, który nie zaczyna się od bieżącego offsetu, dostaje 409 z tym offsetem.
+        upload = self.get_object()
+        try:
+            start, length, total = parse_content_range(request.headers.get('Content-Range'))
+            if total != upload.size:
+                raise UploadError(f"Całość w Content-Range musi być rozmiarem uploadu, {upload.size}.")
+            if length != int(request.META.get('CONTENT_LENGTH') or 0):
+                raise UploadError("Content-Length musi zgadzać się z Content-Range.")
+            upload = append_chunk(upload, request.stream, start, length)
+        except UploadOffsetMismatch as error:
+            return Response({'detail': str(error), 'offset': error.offset}, status=status.HTTP_409_CONFLICT)
+        except UploadError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(upload).data)
+
+    def perform_destroy(self, instance):
+        delete_upload(instance)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        try:
+            map_instance = finalize_upload(self.get_object())
+        except UploadError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = MapSerializer(map_instance, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
 class BoardViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows boards to be viewed, created, edited and deleted.
@@ -29,7 +86,12 @@ class BoardViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         if user.is_authenticated:
-            return Board.objects.filter(creator=user).order_by('-updated_at')
+            # Twórca, mapa z uploaderem i kamienie są serializowane dla każdej planszy,
+            # więc pobieramy je z góry (stała liczba zapytań niezależnie od liczby plansz)
+            boards = Board.objects.filter(creator=user).order_by('-updated_at')
+            if self.action == 'user_paths': # Tu plansza nie jest serializowana
+                return boards
+            return boards.select_related('creator', 'map_reference__uploader').prefetch_related('waystones')
         return Board.objects.none() # Niezalogowani nie widzą żadnych plansz na liście
 
     def perform_create(self, serializer):
@@ -57,45 +119,27 @@ class BoardViewSet(viewsets.ModelViewSet):
             # Klient powinien wysłać listę obiektów:
             # [{start_row: r, start_col: c, end_row: r2, end_col: c2}, ...]
             
-            # Usuń istniejące ścieżki tego użytkownika dla tej planszy
-            UserPathSegment.objects.filter(board=board, user=request.user).delete()
-
             # Zapisz nowe ścieżki
             # request.data powinna być listą ścieżek
             new_paths_data = request.data 
             if not isinstance(new_paths_data, list):
                 return Response({"error": "Oczekiwano listy segmentów ścieżek."}, status=status.HTTP_400_BAD_REQUEST)
 
-            created_paths_serializers = []
+            # Najpierw walidujemy wszystkie segmenty, potem zapisujemy je jednym
+            # bulk_create (jedno zapytanie zamiast jednego na segment)
+            new_segments = []
             for path_data in new_paths_data:
-                # Dodaj board i user do danych każdego segmentu
-                path_data['board'] = board.id # Serializer oczekuje ID
-                path_data['user'] = request.user.id # Serializer oczekuje ID
-                
                 serializer = UserPathSegmentSerializer(data=path_data, context={'board': board}) # Przekazujemy board do kontekstu dla ewentualnej walidacji
-                if serializer.is_valid():
-                    # Nie zapisujemy bezpośrednio przez serializer.save(), bo user i board są read_only
-                    # Tworzymy obiekty ręcznie lub dostosowujemy serializer.
-                    # Prostsze ręczne tworzenie w tym przypadku:
-                    try:
-                        UserPathSegment.objects.create(
-                            board=board,
-                            user=request.user,
-                            start_row=path_data['start_row'],
-                            start_col=path_data['start_col'],
-                            end_row=path_data['end_row'],
-                            end_col=path_data['end_col']
-                        )
-                        # Jeśli UserPathSegmentSerializer miałby być użyty do zapisu,
-                        # musiałby akceptować board_id i user_id lub być inaczej skonstruowany.
-                        # np. serializer.save(board=board, user=request.user)
-                    except KeyError:
-                         return Response({"error": "Brakujące pola w danych ścieżki (start_row, start_col, end_row, end_col)."}, status=status.HTTP_400_BAD_REQUEST)
-
-                else:
+                if not serializer.is_valid():
                     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Pobierz nowo utworzone ścieżki, aby je zwrócić
-            final_paths = UserPathSegment.objects.filter(board=board, user=request.user).order_by('created_at')
-            final_serializer = UserPathSegmentSerializer(final_paths, many=True)
+                # Pola start_row, start_col, end_row, end_col są wymagane przez serializer
+                new_segments.append(UserPathSegment(board=board, user=request.user, **serializer.validated_data))
+
+            # Usuń istniejące ścieżki tego użytkownika dla tej planszy i zapisz nowe (wszystko albo nic)
+            with transaction.atomic():
+                UserPathSegment.objects.filter(board=board, user=request.user).delete()
+                created = UserPathSegment.objects.bulk_create(new_segments)
+
+            # Zwracamy zapisane obiekty (mają już id i created_at), bez ponownego pobierania
+            final_serializer = UserPathSegmentSerializer(created, many=True)
             return Response(final_serializer.data, status=status.HTTP_201_CREATED)
\ No newline at end of file